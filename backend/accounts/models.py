@@ -62,6 +62,9 @@ class BuyerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='buyer_profile')
     company_name = models.CharField(max_length=200, blank=True)
     delivery_address = models.TextField()
+    # Optional; used to batch the buyer's deliveries by area
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     preferences = models.TextField(blank=True, help_text="Preferred products or suppliers")
     
     def __str__(self):
@@ -1,12 +1,30 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from django.core.cache import cache
 from .models import FarmerProfile, BuyerProfile
 
 User = get_user_model()
 
 
+def online_status(context, user_ids):
+    """Presence of ``user_ids``, looked up in one batch and remembered in the serializer context."""
+    from chat.presence import PresenceService
+
+    known = context.setdefault('online_users', {})
+    missing = [user_id for user_id in user_ids if user_id not in known]
+    if missing:
+        online = PresenceService.online_ids(missing)
+        known.update((user_id, user_id in online) for user_id in missing)
+    return known
+
+
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        online_status(self.context, [user.id for user in users])
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Read-only user representation returned on login/profile."""
     full_name = serializers.SerializerMethodField()
@@ -22,6 +40,7 @@ class UserSerializer(serializers.ModelSerializer):
             'profile_picture', 'is_verified', 'created_at', 'is_online'
         ]
         read_only_fields = ['id', 'created_at', 'is_verified']
+        list_serializer_class = UserListSerializer
 
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}".strip() or obj.username
@@ -37,7 +56,7 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.profile_picture.url
 
     def get_is_online(self, obj):
-        return cache.get(f"user_online_{obj.id}", False)
+        return online_status(self.context, [obj.id])[obj.id]
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -151,6 +151,7 @@ class DashboardStatsView(APIView):
     def get(self, request):
         from orders.models import Order, OrderItem
         from products.models import Product
+        from services.order_service import OrderArchiveService
         from django.db.models import Sum, F
 
         user = request.user
@@ -164,6 +165,9 @@ class DashboardStatsView(APIView):
             total_revenue = farmer_order_items.filter(status='delivered').aggregate(
                 total=Sum(F('quantity') * F('price'))
             )['total'] or 0.0
+            archived_orders, archived_revenue = OrderArchiveService.farmer_totals(user)
+            total_orders += archived_orders
+            total_revenue = float(total_revenue) + float(archived_revenue)
             return Response({
                 'total_orders': total_orders,
                 'pending_orders': pending_orders,
@@ -178,6 +182,9 @@ class DashboardStatsView(APIView):
             total_spent = buyer_orders.filter(status='delivered').aggregate(
                 total=Sum('total_amount')
             )['total'] or 0.0
+            archived_orders, archived_spent = OrderArchiveService.order_totals(buyer=user)
+            total_orders += archived_orders
+            total_spent = float(total_spent) + float(archived_spent)
             return Response({
                 'total_orders': total_orders,
                 'pending_orders': pending_orders,
@@ -7,6 +7,7 @@ from django.db.models.functions import TruncMonth, TruncDay
 from accounts.models import User
 from products.models import Product, Category
 from orders.models import Order, OrderItem
+from services.order_service import OrderArchiveService
 from analytics.models import AnalyticsSnapshot, BusinessInsight
 
 
@@ -24,6 +25,10 @@ class DashboardAnalyticsService:
         
         revenue_dict = Order.objects.filter(status='delivered').aggregate(total=Sum('total_amount'))
         total_revenue = float(revenue_dict['total'] or 0)
+
+        archived_orders, archived_revenue = OrderArchiveService.order_totals()
+        total_orders += archived_orders
+        total_revenue += float(archived_revenue)
         
         # New in last 30 days
         new_farmers = User.objects.filter(user_type='farmer', created_at__gte=thirty_days_ago).count()
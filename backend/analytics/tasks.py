@@ -4,6 +4,7 @@ from datetime import timedelta
 from accounts.models import User
 from products.models import Product
 from orders.models import Order
+from services.order_service import OrderArchiveService
 from django.db.models import Sum
 from .models import AnalyticsSnapshot
 
@@ -25,6 +26,10 @@ def generate_daily_snapshot():
     
     revenue_dict = Order.objects.filter(status='delivered', created_at__lte=now).aggregate(total=Sum('total_amount'))
     total_revenue = float(revenue_dict['total'] or 0)
+
+    archived_orders, archived_revenue = OrderArchiveService.order_totals(created_at__lte=now)
+    total_orders += archived_orders
+    total_revenue += float(archived_revenue)
     
     snapshot = AnalyticsSnapshot.objects.create(
         date=yesterday,
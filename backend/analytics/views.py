@@ -46,6 +46,12 @@ class FarmerAnalyticsView(APIView):
         total_orders = farmer_items.values('order').distinct().count()
         pending_orders = farmer_items.filter(status='pending').values('order').distinct().count()
 
+        # Archived orders still count towards the all-time KPIs
+        from services.order_service import OrderArchiveService
+        archived_orders, archived_revenue = OrderArchiveService.farmer_totals(user)
+        total_orders += archived_orders
+        total_revenue += float(archived_revenue)
+
         # Average rating across all products
         from products.models import Review
         reviews = Review.objects.filter(product__farmer=user)
@@ -170,6 +176,11 @@ class BuyerAnalyticsView(APIView):
         total_spent = sum(float(o.total_amount) for o in orders.filter(status='delivered'))
         pending_orders = orders.filter(status__in=['pending', 'processing']).count()
 
+        from services.order_service import OrderArchiveService
+        archived_orders, archived_spent = OrderArchiveService.order_totals(buyer=user)
+        total_orders += archived_orders
+        total_spent += float(archived_spent)
+
         # Monthly spend trend
         six_months_ago = timezone.now() - timedelta(days=180)
         monthly_spend_qs = (
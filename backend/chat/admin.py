@@ -1,30 +1,43 @@
 from django.contrib import admin
-from .models import Conversation, Message, MessageReceipt, TypingStatus, MessageReaction
+from .models import Conversation, ConversationMember, Message, TypingStatus, MessageReaction
+from .membership import invalidate
+
+class ConversationMemberInline(admin.TabularInline):
+    model = ConversationMember
+    extra = 0
+    fields = ['user', 'unread_count', 'last_read_seq', 'last_read_at', 'last_activity_at']
+    readonly_fields = ['unread_count', 'last_read_seq', 'last_read_at', 'last_activity_at']
+    autocomplete_fields = ['user']
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'is_group', 'group_name', 'created_at', 'updated_at']
+    list_display = ['id', 'is_group', 'group_name', 'last_message_at', 'created_at', 'updated_at']
     list_filter = ['is_group', 'created_at']
     search_fields = ['group_name']
-    filter_horizontal = ['participants']
+    inlines = [ConversationMemberInline]
     date_hierarchy = 'created_at'
+    readonly_fields = [
+        'last_message', 'last_message_at', 'last_message_sender', 'last_message_type',
+        'last_message_preview', 'last_message_is_deleted',
+    ]
+
+    def save_related(self, request, form, formsets, change):
+        before = set(form.instance.members.values_list('user_id', flat=True)) if change else set()
+        super().save_related(request, form, formsets, change)
+        # Inline rows are saved directly, without the m2m_changed signal
+        after = set(form.instance.members.values_list('user_id', flat=True))
+        if before != after:
+            invalidate([form.instance.pk], before | after)
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'conversation', 'sender', 'message_type', 'is_read', 'is_deleted', 'created_at']
-    list_filter = ['message_type', 'is_read', 'is_deleted', 'created_at']
+    list_display = ['id', 'conversation', 'sender', 'message_type', 'seq', 'is_deleted', 'created_at']
+    list_filter = ['message_type', 'is_deleted', 'created_at']
     search_fields = ['content', 'sender__username']
     date_hierarchy = 'created_at'
-    readonly_fields = ['created_at', 'updated_at', 'delivered_at', 'read_at']
+    readonly_fields = ['created_at', 'updated_at', 'delivered_at', 'seq', 'change_seq']
     autocomplete_fields = ['conversation', 'sender', 'reply_to']
 
-@admin.register(MessageReceipt)
-class MessageReceiptAdmin(admin.ModelAdmin):
-    list_display = ['message', 'user', 'delivered_at', 'read_at']
-    list_filter = ['delivered_at', 'read_at']
-    search_fields = ['user__username']
-    autocomplete_fields = ['message', 'user']
-
 @admin.register(MessageReaction)
 class MessageReactionAdmin(admin.ModelAdmin):
     list_display = ['message', 'user', 'reaction', 'created_at']
@@ -1,15 +1,42 @@
+import asyncio
 import json
-import base64
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.db import database_sync_to_async
-from django.core.files.base import ContentFile
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.core.cache import cache
-from .models import Conversation, Message, MessageReceipt, TypingStatus, MessageReaction
+from .models import ConversationMember, Message, TypingStatus, MessageReaction
+from .membership import aget_participant_ids, forget_local
+from .uploads import ChunkedUpload, UploadError, parse_frame
+from . import viewers
+from .presence import PresenceService, presence_group
 
 User = get_user_model()
 
+
+def conversation_group(conversation_id):
+    return f'conv_{conversation_id}'
+
+
+def read_event(conversation_id, user_id, seq):
+    return {
+        'type': 'message_read',
+        'conversation_id': conversation_id,
+        'user_id': user_id,
+        'seq': seq,
+        'read_at': timezone.now().isoformat(),
+    }
+
+
+def publish_read(conversation_id, user_id, seq):
+    """Tell the conversation's sockets that ``user_id`` has read every message up to ``seq``."""
+    async_to_sync(get_channel_layer().group_send)(conversation_group(conversation_id), read_event(conversation_id, user_id, seq))
+
+
 class GlobalChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope['user']
@@ -21,61 +48,75 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
             return
         
         self.user_group_name = f'user_{self.user.id}'
+        # Chunked media transfers in progress or waiting for their message, by transfer id
+        self.uploads = {}
+        # Conversation open on this socket and when its viewer entry was last refreshed
+        self.active_conversation_id = None
+        self.active_refreshed_at = 0
+        # Typing bursts in progress: conversation id -> last broadcast time and expiry task
+        self.typing = {}
+        # Read positions not yet written: conversation id -> highest seq / message id and flush task
+        self.reads = {}
         
         # Join personal user group
         await self.channel_layer.group_add(
             self.user_group_name,
             self.channel_name
         )
-        # Join global presence group
-        await self.channel_layer.group_add(
-            'global_presence',
-            self.channel_name
-        )
+        # Join the groups of every conversation the user is in, and follow
+        # the presence of the people in them
+        self.conversation_ids, self.contact_ids = set(), set()
+        await self.sync_memberships()
         
         await self.accept()
         
-        # Track online status in cache for API
-        await cache.aset(f"user_online_{self.user.id}", True, timeout=86400)
-        
-        # Send online status to everyone
-        await self.channel_layer.group_send(
-            'global_presence',
-            {
-                'type': 'user_status',
-                'user_id': self.user.id,
-                'username': self.user.username,
-                'status': 'online'
-            }
-        )
+        if await sync_to_async(PresenceService.connect, thread_sensitive=False)(self.user.id, self.channel_name):
+            await self.broadcast_status('online')
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
     
     async def disconnect(self, close_code):
         if hasattr(self, 'user') and self.user.is_authenticated:
-            # Remove from cache
-            await cache.adelete(f"user_online_{self.user.id}")
-            
-            # Send offline status
-            await self.channel_layer.group_send(
-                'global_presence',
-                {
-                    'type': 'user_status',
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'status': 'offline'
-                }
-            )
+            self.heartbeat_task.cancel()
+            # Other devices may still be connected
+            if await sync_to_async(PresenceService.disconnect, thread_sensitive=False)(self.user.id, self.channel_name):
+                await self.broadcast_status('offline')
             
             # Leave groups
             await self.channel_layer.group_discard(
                 self.user_group_name,
                 self.channel_name
             )
-            await self.channel_layer.group_discard(
-                'global_presence',
-                self.channel_name
+            await asyncio.gather(
+                *[
+                    self.channel_layer.group_discard(conversation_group(conversation_id), self.channel_name)
+                    for conversation_id in self.conversation_ids
+                ],
+                *[
+                    self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+                    for user_id in self.contact_ids
+                ],
             )
+            
+            # End open typing bursts so nobody keeps a stale indicator
+            for conversation_id, state in list(self.typing.items()):
+                state['expiry'].cancel()
+                await self.broadcast_typing(conversation_id, False)
+            self.typing.clear()
+            # Reads waiting for their flush are written now
+            for conversation_id in list(self.reads):
+                self.reads[conversation_id]['flush'].cancel()
+                await self.flush_read(conversation_id)
+            await self.set_active_conversation(None)
+            
+            # Files sent but never attached to a message are removed
+            for upload in self.uploads.values():
+                await sync_to_async(upload.discard, thread_sensitive=False)()
+            self.uploads.clear()
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self.handle_upload_chunk(bytes_data)
+            return
         data = json.loads(text_data)
         message_type = data.get('type')
         
@@ -91,148 +132,293 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
             await self.handle_delete_message(data)
         elif message_type == 'edit_message':
             await self.handle_edit_message(data)
+        elif message_type == 'upload_start':
+            await self.handle_upload_start(data)
+        elif message_type == 'active_conversation':
+            await self.handle_active_conversation(data)
     
     async def handle_chat_message(self, data):
         conversation_id = data.get('conversation_id')
         content = data.get('message', '')
         reply_to_id = data.get('reply_to')
         media_type = data.get('media_type', 'text')
-        media_data = data.get('media_data')
+        upload_id = data.get('upload_id')
         location_data = data.get('location')
         
-        if not conversation_id:
+        if not await self.get_participants(conversation_id):
             return
+        conversation_id = int(conversation_id)
+        await self.refresh_active_conversation(conversation_id)
+
+        if reply_to_id is not None:
+            try:
+                reply_to_id = int(reply_to_id)
+            except (TypeError, ValueError):
+                await self.send(text_data=json.dumps({
+                    'type': 'message_error', 'conversation_id': conversation_id, 'error': 'Invalid reply_to.',
+                }))
+                return
+
+        media_name = None
+        if upload_id:
+            upload = self.uploads.get(bytes.fromhex(upload_id)) if isinstance(upload_id, str) and len(upload_id) == 32 else None
+            if not upload or not upload.stored_name or upload.conversation_id != conversation_id:
+                await self.send(text_data=json.dumps({'type': 'upload_error', 'transfer_id': upload_id, 'error': 'Unknown upload.'}))
+                return
+            del self.uploads[upload.id]
+            media_type, media_name = upload.media_type, upload.stored_name
 
         # Save message to database
         message = await self.save_message(
             conversation_id=conversation_id,
             content=content,
             media_type=media_type,
-            media_data=media_data,
+            media_name=media_name,
             reply_to_id=reply_to_id,
             location_data=location_data
         )
         
-        # Send message to all participants
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
-            await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'chat_message',
-                    'message': message,
-                    'conversation_id': conversation_id
-                }
-            )
+        # One publish reaches every participant's sockets
+        await self.channel_layer.group_send(
+            conversation_group(conversation_id),
+            {
+                'type': 'chat_message',
+                'message': message,
+                'conversation_id': conversation_id
+            }
+        )
     
     async def handle_typing_status(self, data):
+        """Relay typing state without storing it.
+
+        A typing burst is broadcast at most once per CHAT_TYPING_THROTTLE_SECONDS
+        and is ended automatically when no typing event arrives for
+        CHAT_TYPING_TTL_SECONDS, so clients never keep a stale indicator.
+        """
         conversation_id = data.get('conversation_id')
-        is_typing = data.get('is_typing', False)
-        if not conversation_id:
+        is_typing = bool(data.get('is_typing', False))
+        if not await self.get_participants(conversation_id):
             return
-            
-        await self.update_typing_status(conversation_id, is_typing)
+        conversation_id = int(conversation_id)
+        await self.refresh_active_conversation(conversation_id)
         
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
-            await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'typing_status',
-                    'conversation_id': conversation_id,
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'is_typing': is_typing
-                }
-            )
+        state = self.typing.pop(conversation_id, None)
+        if state:
+            state['expiry'].cancel()
+        if not is_typing:
+            # Only a burst that was announced needs an end
+            if state:
+                await self.broadcast_typing(conversation_id, False)
+            return
+        
+        now = time.monotonic()
+        throttled = state is not None and now - state['sent_at'] < settings.CHAT_TYPING_THROTTLE_SECONDS
+        self.typing[conversation_id] = {
+            'sent_at': state['sent_at'] if throttled else now,
+            'expiry': asyncio.create_task(self.expire_typing(conversation_id)),
+        }
+        if not throttled:
+            await self.broadcast_typing(conversation_id, True)
+    
+    async def expire_typing(self, conversation_id):
+        await asyncio.sleep(settings.CHAT_TYPING_TTL_SECONDS)
+        self.typing.pop(conversation_id, None)
+        await self.broadcast_typing(conversation_id, False)
+    
+    async def broadcast_typing(self, conversation_id, is_typing):
+        if settings.CHAT_TYPING_DEBUG_SINK:
+            await self.update_typing_status(conversation_id, is_typing)
+        await self.channel_layer.group_send(
+            conversation_group(conversation_id),
+            {
+                'type': 'typing_status',
+                'conversation_id': conversation_id,
+                'user_id': self.user.id,
+                'username': self.user.username,
+                'is_typing': is_typing
+            }
+        )
     
     async def handle_message_read(self, data):
+        """Collect read positions (``seq``, or ``message_id`` from older clients).
+
+        Reads are coalesced per conversation and written once per
+        CHAT_READ_FLUSH_SECONDS as a single watermark update, followed by
+        a single ``message_read`` event for the highest position.
+        """
         conversation_id = data.get('conversation_id')
-        message_id = data.get('message_id')
-        if not conversation_id:
+        try:
+            seq = int(data.get('seq') or 0)
+            message_id = int(data.get('message_id') or 0)
+        except (TypeError, ValueError):
             return
-            
-        await self.mark_message_read(message_id)
+        if not (seq or message_id) or not await self.get_participants(conversation_id):
+            return
+        conversation_id = int(conversation_id)
+        await self.refresh_active_conversation(conversation_id)
         
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
+        pending = self.reads.get(conversation_id)
+        if pending is None:
+            pending = self.reads[conversation_id] = {
+                'seq': 0,
+                'message_id': 0,
+                'flush': asyncio.create_task(self.delayed_flush_read(conversation_id)),
+            }
+        pending['seq'] = max(pending['seq'], seq)
+        pending['message_id'] = max(pending['message_id'], message_id)
+    
+    async def delayed_flush_read(self, conversation_id):
+        await asyncio.sleep(settings.CHAT_READ_FLUSH_SECONDS)
+        await self.flush_read(conversation_id)
+    
+    async def flush_read(self, conversation_id):
+        pending = self.reads.pop(conversation_id, None)
+        if pending is None:
+            return
+        seq = await self.mark_read(conversation_id, pending['seq'], pending['message_id'])
+        if seq is not None:
             await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'message_read',
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'user_id': self.user.id,
-                    'read_at': timezone.now().isoformat()
-                }
+                conversation_group(conversation_id), read_event(conversation_id, self.user.id, seq)
             )
     
     async def handle_message_reaction(self, data):
         conversation_id = data.get('conversation_id')
         message_id = data.get('message_id')
         reaction = data.get('reaction')
-        if not conversation_id:
+        if not await self.get_participants(conversation_id):
             return
+        conversation_id = int(conversation_id)
             
-        await self.add_reaction(message_id, reaction)
+        await self.add_reaction(conversation_id, message_id, reaction)
         
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
-            await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'message_reaction',
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'reaction': reaction
-                }
-            )
+        await self.channel_layer.group_send(
+            conversation_group(conversation_id),
+            {
+                'type': 'message_reaction',
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'user_id': self.user.id,
+                'username': self.user.username,
+                'reaction': reaction
+            }
+        )
     
     async def handle_delete_message(self, data):
         conversation_id = data.get('conversation_id')
         message_id = data.get('message_id')
         delete_for_everyone = data.get('delete_for_everyone', False)
-        if not conversation_id:
+        if not await self.get_participants(conversation_id):
             return
+        conversation_id = int(conversation_id)
             
-        await self.delete_message(message_id, delete_for_everyone)
+        await self.delete_message(conversation_id, message_id, delete_for_everyone)
         
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
-            await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'message_deleted',
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'delete_for_everyone': delete_for_everyone,
-                    'user_id': self.user.id
-                }
-            )
+        await self.channel_layer.group_send(
+            conversation_group(conversation_id),
+            {
+                'type': 'message_deleted',
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'delete_for_everyone': delete_for_everyone,
+                'user_id': self.user.id
+            }
+        )
     
     async def handle_edit_message(self, data):
         conversation_id = data.get('conversation_id')
         message_id = data.get('message_id')
         new_content = data.get('content')
-        if not conversation_id:
+        if not await self.get_participants(conversation_id):
             return
+        conversation_id = int(conversation_id)
             
-        await self.edit_message(message_id, new_content)
+        await self.edit_message(conversation_id, message_id, new_content)
         
-        participant_ids = await self.get_conversation_participants(conversation_id)
-        for p_id in participant_ids:
-            await self.channel_layer.group_send(
-                f'user_{p_id}',
-                {
-                    'type': 'message_edited',
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'content': new_content,
-                    'user_id': self.user.id
-                }
+        await self.channel_layer.group_send(
+            conversation_group(conversation_id),
+            {
+                'type': 'message_edited',
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'content': new_content,
+                'user_id': self.user.id
+            }
+        )
+    
+    async def handle_active_conversation(self, data):
+        """The client opened a conversation (``conversation_id``) or closed it (``null``)."""
+        conversation_id = data.get('conversation_id')
+        if conversation_id is not None:
+            if not await self.get_participants(conversation_id):
+                return
+            conversation_id = int(conversation_id)
+        await self.set_active_conversation(conversation_id)
+    
+    async def set_active_conversation(self, conversation_id):
+        previous = self.active_conversation_id
+        self.active_conversation_id = conversation_id
+        if previous is not None and previous != conversation_id:
+            await sync_to_async(viewers.leave, thread_sensitive=False)(previous, self.user.id, self.channel_name)
+        if conversation_id is not None:
+            await self.refresh_active_conversation(force=True)
+    
+    async def refresh_active_conversation(self, conversation_id=None, force=False):
+        # Activity in the open conversation keeps its viewer entry alive, a few writes per TTL at most
+        if self.active_conversation_id is None or conversation_id not in (None, self.active_conversation_id):
+            return
+        now = time.monotonic()
+        if not force and now - self.active_refreshed_at < settings.CHAT_VIEWING_TTL / 3:
+            return
+        self.active_refreshed_at = now
+        await sync_to_async(viewers.enter, thread_sensitive=False)(self.active_conversation_id, self.user.id, self.channel_name)
+    
+    async def handle_upload_start(self, data):
+        """Announce a file: ``{conversation_id, media_type, file_name, size, sha256}``."""
+        conversation_id = data.get('conversation_id')
+        if not await self.get_participants(conversation_id):
+            return
+        if len(self.uploads) >= settings.CHAT_UPLOAD_MAX_ACTIVE:
+            await self.send(text_data=json.dumps({'type': 'upload_error', 'error': 'Too many uploads in progress.'}))
+            return
+        try:
+            upload = await sync_to_async(ChunkedUpload, thread_sensitive=False)(
+                int(conversation_id), data.get('media_type'), data.get('file_name'), data.get('size'), data.get('sha256')
             )
+        except UploadError as exc:
+            await self.send(text_data=json.dumps({'type': 'upload_error', 'error': str(exc)}))
+            return
+        self.uploads[upload.id] = upload
+        await self.send(text_data=json.dumps({
+            'type': 'upload_ready',
+            'transfer_id': upload.id.hex(),
+            'chunk_size': settings.CHAT_UPLOAD_CHUNK_BYTES,
+        }))
+    
+    async def handle_upload_chunk(self, frame):
+        # File work runs outside the thread that serves database calls
+        try:
+            transfer_id, offset, chunk = parse_frame(frame)
+        except UploadError as exc:
+            await self.send(text_data=json.dumps({'type': 'upload_error', 'error': str(exc)}))
+            return
+        upload = self.uploads.get(transfer_id)
+        if not upload or upload.complete:
+            await self.send(text_data=json.dumps({'type': 'upload_error', 'transfer_id': transfer_id.hex(), 'error': 'Unknown upload.'}))
+            return
+        try:
+            await sync_to_async(upload.write, thread_sensitive=False)(offset, chunk)
+            if upload.complete:
+                await sync_to_async(upload.finish, thread_sensitive=False)()
+        except UploadError as exc:
+            del self.uploads[transfer_id]
+            await sync_to_async(upload.discard, thread_sensitive=False)()
+            await self.send(text_data=json.dumps({'type': 'upload_error', 'transfer_id': transfer_id.hex(), 'error': str(exc)}))
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'upload_complete' if upload.complete else 'upload_progress',
+            'transfer_id': transfer_id.hex(),
+            'received': upload.received,
+        }))
     
     # WebSocket event handlers
     async def chat_message(self, event):
@@ -256,8 +442,8 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'type': 'message_read',
             'conversation_id': event['conversation_id'],
-            'message_id': event['message_id'],
             'user_id': event['user_id'],
+            'seq': event['seq'],
             'read_at': event['read_at']
         }))
     
@@ -297,62 +483,116 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
             'status': event['status']
         }))
     
+    async def order_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'order_update',
+            'event': event['event'],
+            'order_id': event['order_id'],
+            'data': event['data']
+        }))
+    
+    async def reservation_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'reservation_update',
+            'event': event['event'],
+            'reservation_id': event['reservation_id'],
+            'data': event['data']
+        }))
+    
+    async def membership_changed(self, event):
+        forget_local(event['conversation_id'])
+        # Follow the user into or out of the conversation, and its people's presence
+        await self.sync_memberships()
+    
+    async def sync_memberships(self):
+        """Join and leave conversation and presence groups to match the user's conversations."""
+        conversation_ids, contact_ids = await self.get_memberships()
+        changes = [
+            self.channel_layer.group_add(conversation_group(conversation_id), self.channel_name)
+            for conversation_id in conversation_ids - self.conversation_ids
+        ] + [
+            self.channel_layer.group_discard(conversation_group(conversation_id), self.channel_name)
+            for conversation_id in self.conversation_ids - conversation_ids
+        ] + [
+            self.channel_layer.group_add(presence_group(user_id), self.channel_name)
+            for user_id in contact_ids - self.contact_ids
+        ] + [
+            self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+            for user_id in self.contact_ids - contact_ids
+        ]
+        self.conversation_ids, self.contact_ids = conversation_ids, contact_ids
+        await asyncio.gather(*changes)
+    
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_SECONDS)
+            if await sync_to_async(PresenceService.heartbeat, thread_sensitive=False)(self.user.id, self.channel_name):
+                await self.broadcast_status('online')
+            await self.refresh_active_conversation(force=True)
+    
+    async def broadcast_status(self, status):
+        await self.channel_layer.group_send(presence_group(self.user.id), {
+            'type': 'user_status',
+            'user_id': self.user.id,
+            'username': self.user.username,
+            'status': status,
+        })
+    
+    async def get_participants(self, conversation_id):
+        """Participant ids of a conversation the user belongs to, else ``None``."""
+        try:
+            conversation_id = int(conversation_id)
+        except (TypeError, ValueError):
+            return None
+        participant_ids = await aget_participant_ids(conversation_id)
+        return participant_ids if self.user.id in participant_ids else None
+    
     # Database operations
     @database_sync_to_async
-    def get_conversation_participants(self, conversation_id):
-        try:
-            conv = Conversation.objects.get(id=conversation_id)
-            return list(conv.participants.values_list('id', flat=True))
-        except Conversation.DoesNotExist:
-            return []
-
+    def get_memberships(self):
+        """``(conversation ids, ids of everyone else in them)`` in one query."""
+        rows = ConversationMember.objects.filter(
+            conversation_id__in=ConversationMember.objects.filter(user_id=self.user.id).values('conversation_id')
+        ).values_list('conversation_id', 'user_id')
+        conversation_ids, contact_ids = set(), set()
+        for conversation_id, user_id in rows:
+            conversation_ids.add(conversation_id)
+            if user_id != self.user.id:
+                contact_ids.add(user_id)
+        return conversation_ids, contact_ids
+    
     @database_sync_to_async
-    def save_message(self, conversation_id, content, media_type, media_data, reply_to_id, location_data):
-        conversation = Conversation.objects.get(id=conversation_id)
-        
-        message = Message.objects.create(
-            conversation=conversation,
-            sender_id=self.user.id,
-            message_type=media_type,
-            content=content
-        )
-        
-        # Handle media files
-        if media_data and media_type in ['image', 'video', 'audio', 'document']:
-            format, imgstr = media_data.split(';base64,')
-            ext = format.split('/')[-1]
-            file_data = ContentFile(base64.b64decode(imgstr), name=f'{message.id}.{ext}')
-            
-            if media_type == 'image': message.image = file_data
-            elif media_type == 'video': message.video = file_data
-            elif media_type == 'audio': message.audio = file_data
-            elif media_type == 'document': message.document = file_data
-            message.save()
-        
+    def save_message(self, conversation_id, content, media_type, media_name, reply_to_id, location_data):
+        """Store a message with a fixed number of statements, whatever the group size.
+
+        The sender's membership was already checked against the cached
+        participants, so the conversation itself is never loaded.
+        """
+        fields = {}
+        # Uploaded media is already in storage; the message only records its name
+        if media_name:
+            fields[media_type] = media_name
         if location_data:
-            message.latitude = location_data.get('latitude')
-            message.longitude = location_data.get('longitude')
-            message.location_name = location_data.get('name', '')
-            message.save()
-        
-        if reply_to_id:
-            try:
-                reply_to_message = Message.objects.get(id=reply_to_id)
-                message.reply_to = reply_to_message
-                message.save()
-            except Message.DoesNotExist:
-                pass
-        
-        conversation.updated_at = timezone.now()
-        conversation.save()
+            fields.update(
+                latitude=location_data.get('latitude'),
+                longitude=location_data.get('longitude'),
+                location_name=location_data.get('name', ''),
+            )
+        if reply_to_id and Message.objects.filter(id=reply_to_id, conversation_id=conversation_id).exists():
+            fields['reply_to_id'] = reply_to_id
         
-        participants = conversation.participants.exclude(id=self.user.id)
-        for participant in participants:
-            MessageReceipt.objects.create(message=message, user=participant)
+        with transaction.atomic():
+            message = Message.objects.create(
+                conversation_id=conversation_id,
+                sender=self.user,
+                message_type=media_type,
+                content=content,
+                **fields
+            )
         
         return {
             'id': message.id,
-            'conversation': conversation.id,
+            'conversation': conversation_id,
             'sender': self.user.id,
             'sender_details': {
                 'id': self.user.id,
@@ -364,15 +604,19 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
             'content': message.content,
             'file_url': message.file_url,
             'file_name': message.file_name,
-            'reply_to': message.reply_to.id if message.reply_to else None,
+            'reply_to': message.reply_to_id,
             'reactions': [],
             'created_at': message.created_at.isoformat(),
             'is_edited': message.is_edited,
-            'is_read': message.is_read,
+            # Nobody else has read a message that was just sent
+            'is_read': False,
+            'seq': message.seq,
+            'change_seq': message.change_seq,
         }
     
     @database_sync_to_async
     def update_typing_status(self, conversation_id, is_typing):
+        # Debug sink only (CHAT_TYPING_DEBUG_SINK); nothing reads these rows
         TypingStatus.objects.update_or_create(
             conversation_id=conversation_id,
             user_id=self.user.id,
@@ -380,33 +624,36 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
         )
     
     @database_sync_to_async
-    def mark_message_read(self, message_id):
-        try:
-            message = Message.objects.get(id=message_id)
-            message.is_read = True
-            message.read_at = timezone.now()
-            message.save()
-            MessageReceipt.objects.filter(message=message, user_id=self.user.id).update(read_at=timezone.now())
-        except Message.DoesNotExist:
-            pass
+    def mark_read(self, conversation_id, seq, message_id):
+        """Move the user's watermark; returns the new one, or ``None`` if it did not move."""
+        if message_id:
+            message_seq = Message.objects.filter(
+                id=message_id, conversation_id=conversation_id
+            ).values_list('seq', flat=True).first()
+            seq = max(seq, message_seq or 0)
+        if not seq:
+            return None
+        return ConversationMember.mark_read(conversation_id, self.user.id, seq)
     
     @database_sync_to_async
-    def add_reaction(self, message_id, reaction):
+    def add_reaction(self, conversation_id, message_id, reaction):
         try:
-            message = Message.objects.get(id=message_id)
-            reaction_obj, created = MessageReaction.objects.update_or_create(
-                message=message,
-                user_id=self.user.id,
-                defaults={'reaction': reaction}
-            )
+            message = Message.objects.get(id=message_id, conversation_id=conversation_id)
+            with transaction.atomic():
+                reaction_obj, created = MessageReaction.objects.update_or_create(
+                    message=message,
+                    user_id=self.user.id,
+                    defaults={'reaction': reaction}
+                )
+                Message.touch(message.id, conversation_id)
             return {'created': created}
         except Message.DoesNotExist:
             return None
     
     @database_sync_to_async
-    def delete_message(self, message_id, delete_for_everyone):
+    def delete_message(self, conversation_id, message_id, delete_for_everyone):
         try:
-            message = Message.objects.get(id=message_id, sender_id=self.user.id)
+            message = Message.objects.get(id=message_id, conversation_id=conversation_id, sender_id=self.user.id)
             if delete_for_everyone:
                 message.deleted_for_everyone = True
             message.is_deleted = True
@@ -415,9 +662,9 @@ class GlobalChatConsumer(AsyncWebsocketConsumer):
             pass
     
     @database_sync_to_async
-    def edit_message(self, message_id, new_content):
+    def edit_message(self, conversation_id, message_id, new_content):
         try:
-            message = Message.objects.get(id=message_id, sender_id=self.user.id)
+            message = Message.objects.get(id=message_id, conversation_id=conversation_id, sender_id=self.user.id)
             message.content = new_content
             message.is_edited = True
             message.save()
@@ -0,0 +1,125 @@
+"""Conversation membership lookups for the chat consumers.
+
+Participant ids are kept in a small LRU in each process, backed by the
+shared cache, so that typing indicators, receipts and other frequent
+socket events are authorised without a database query. Entries are
+stored under a per-conversation generation number that is bumped when
+the participants change, and every process holding a copy is told to
+drop it through the affected users' channel groups.
+"""
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_local = OrderedDict()
+# Touched from the event loop and from the database thread
+_lock = threading.Lock()
+# Bumped whenever an entry is dropped, so lookups that raced a change are not kept
+_epoch = 0
+
+
+def _generation_key(conversation_id):
+    return f'chat:members:gen:{conversation_id}'
+
+
+def _members_key(conversation_id, generation):
+    return f'chat:members:{conversation_id}:{generation}'
+
+
+def _remember(conversation_id, participant_ids, epoch):
+    with _lock:
+        if epoch != _epoch:
+            return
+        _local[conversation_id] = (time.monotonic(), participant_ids)
+        _local.move_to_end(conversation_id)
+        while len(_local) > settings.CHAT_MEMBERSHIP_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def _cached(conversation_id):
+    with _lock:
+        entry = _local.get(conversation_id)
+        if entry is None:
+            return None
+        cached_at, participant_ids = entry
+        if time.monotonic() - cached_at > settings.CHAT_MEMBERSHIP_LOCAL_TTL:
+            del _local[conversation_id]
+            return None
+        _local.move_to_end(conversation_id)
+        return participant_ids
+
+
+def forget_local(conversation_id):
+    """Drop this process's copy of a conversation's participants."""
+    global _epoch
+    with _lock:
+        _local.pop(conversation_id, None)
+        _epoch += 1
+
+
+def get_participant_ids(conversation_id):
+    """Ids of the conversation's participants; empty for unknown conversations."""
+    participant_ids = _cached(conversation_id)
+    if participant_ids is not None:
+        return participant_ids
+
+    from .models import ConversationMember
+
+    epoch = _epoch
+    # A generation that starts from the clock never reuses keys left by an evicted counter
+    generation_key = _generation_key(conversation_id)
+    cache.add(generation_key, time.time_ns(), timeout=None)
+    generation = cache.get(generation_key)
+    members_key = _members_key(conversation_id, generation)
+
+    participant_ids = cache.get(members_key)
+    if participant_ids is None:
+        participant_ids = frozenset(
+            ConversationMember.objects.filter(conversation_id=conversation_id)
+            .values_list('user_id', flat=True)
+        )
+        cache.set(members_key, participant_ids, timeout=settings.CHAT_MEMBERSHIP_CACHE_SECONDS)
+    _remember(conversation_id, participant_ids, epoch)
+    return participant_ids
+
+
+async def aget_participant_ids(conversation_id):
+    """Async ``get_participant_ids`` that stays on the event loop for local hits."""
+    participant_ids = _cached(conversation_id)
+    if participant_ids is not None:
+        return participant_ids
+    return await database_sync_to_async(get_participant_ids)(conversation_id)
+
+
+def invalidate(conversation_ids, user_ids):
+    """Retire the cached participants of ``conversation_ids`` after the transaction commits.
+
+    ``user_ids`` must cover everyone who was or is now a participant: the
+    processes serving their sockets are the ones that may hold a copy.
+    """
+    conversation_ids, user_ids = set(conversation_ids), set(user_ids)
+    if not conversation_ids:
+        return
+
+    def publish():
+        for conversation_id in conversation_ids:
+            forget_local(conversation_id)
+            try:
+                cache.incr(_generation_key(conversation_id))
+            except ValueError:
+                pass
+        channel_layer = get_channel_layer()
+        for user_id in user_ids:
+            for conversation_id in conversation_ids:
+                async_to_sync(channel_layer.group_send)(f'user_{user_id}', {
+                    'type': 'membership_changed',
+                    'conversation_id': conversation_id,
+                })
+
+    transaction.on_commit(publish)
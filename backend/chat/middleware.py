@@ -1,17 +1,14 @@
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import AccessToken
+from accounts.auth import CachedJWTAuthentication
 from urllib.parse import parse_qs
 
-User = get_user_model()
+authentication = CachedJWTAuthentication()
 
 @database_sync_to_async
-def get_user(user_id):
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
+def get_user(token):
+    # Same checks and user cache as REST requests
+    return authentication.get_user(authentication.get_validated_token(token))
 
 class JWTAuthMiddleware:
     """
@@ -27,14 +24,8 @@ class JWTAuthMiddleware:
 
         if token:
             try:
-                # This will decode the token and check its validity
-                access_token = AccessToken(token)
-                user_id = access_token.payload.get('user_id')
-                user = await get_user(user_id)
-                if user.is_authenticated:
-                    scope["user"] = user
-                else:
-                    print(f"JWT Auth: User {user_id} not found")
+                # Decodes and validates the token, then resolves the user
+                scope["user"] = await get_user(token)
             except Exception as e:
                 print(f"JWT Auth Error: {str(e)}")
                 scope["user"] = AnonymousUser()
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Left
+
+
+def backfill(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    Message = apps.get_model('chat', 'Message')
+
+    newest = Message.objects.filter(conversation_id=OuterRef('pk')).order_by('-created_at', '-id')
+    Conversation.objects.update(
+        last_message_id=Subquery(newest.values('id')[:1]),
+        last_message_at=Subquery(newest.values('created_at')[:1]),
+        last_message_sender_id=Subquery(newest.values('sender_id')[:1]),
+        last_message_type=Coalesce(Subquery(newest.values('message_type')[:1]), models.Value('')),
+        last_message_preview=Coalesce(Subquery(newest.annotate(preview=Left('content', 100)).values('preview')[:1]), models.Value('')),
+        last_message_is_deleted=Coalesce(Subquery(newest.values('is_deleted')[:1]), models.Value(False)),
+    )
+    # Documents are previewed by file name, which is simpler to derive here
+    for conversation in Conversation.objects.filter(last_message_type='document').select_related('last_message'):
+        if conversation.last_message.document:
+            conversation.last_message_preview = conversation.last_message.document.name.split('/')[-1][:100]
+            conversation.save(update_fields=['last_message_preview'])
+
+    unread = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), is_read=False
+    ).exclude(sender_id=OuterRef('user_id')).order_by().values('conversation_id').annotate(n=Count('id')).values('n')
+    conversation = Conversation.objects.filter(pk=OuterRef('conversation_id'))
+    ConversationMember.objects.update(
+        unread_count=Coalesce(Subquery(unread), 0, output_field=models.IntegerField()),
+        last_activity_at=Subquery(conversation.values(activity=Coalesce('last_message_at', 'updated_at'))[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_messagereaction_messagereceipt_typingstatus_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The membership model takes over the existing many-to-many table
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationMember',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='chat.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'chat_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='chat.ConversationMember', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='conversationmember',
+            index=models.Index(fields=['user', '-last_activity_at'], name='chat_member_inbox_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_is_deleted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_type',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Number existing messages in the order they were sent; they have not changed since
+NUMBER_MESSAGES = """
+UPDATE chat_message SET seq = numbered.n, change_seq = numbered.n
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS n
+    FROM chat_message
+) AS numbered
+WHERE chat_message.id = numbered.id
+"""
+
+SET_LAST_SEQ = """
+UPDATE chat_conversation SET last_seq = COALESCE(
+    (SELECT MAX(seq) FROM chat_message WHERE chat_message.conversation_id = chat_conversation.id), 0
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_conversation_member_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'change_seq'], name='chat_message_sync_idx'),
+        ),
+        migrations.RunSQL(NUMBER_MESSAGES, migrations.RunSQL.noop),
+        migrations.RunSQL(SET_LAST_SEQ, migrations.RunSQL.noop),
+    ]
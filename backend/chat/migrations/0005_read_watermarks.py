@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    """Turn per-message read flags into watermarks: the newest message read or sent by each member."""
+    ConversationMember = apps.get_model('chat', 'ConversationMember')
+    Message = apps.get_model('chat', 'Message')
+
+    read_upto = Message.objects.filter(conversation_id=OuterRef('conversation_id')).filter(
+        Q(sender_id=OuterRef('user_id')) | Q(is_read=True)
+    ).order_by().values('conversation_id').annotate(seq=Max('seq')).values('seq')
+    ConversationMember.objects.update(
+        last_read_seq=Coalesce(Subquery(read_upto), 0, output_field=models.PositiveBigIntegerField()),
+    )
+    unread = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), seq__gt=OuterRef('last_read_seq')
+    ).exclude(sender_id=OuterRef('user_id')).order_by().values('conversation_id').annotate(n=Count('id')).values('n')
+    ConversationMember.objects.update(
+        unread_count=Coalesce(Subquery(unread), 0, output_field=models.IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('conversation', 'seq'), name='unique_message_seq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='messagereceipt',
+            unique_together=None,
+        ),
+        migrations.RemoveField(
+            model_name='messagereceipt',
+            name='message',
+        ),
+        migrations.RemoveField(
+            model_name='messagereceipt',
+            name='user',
+        ),
+        migrations.RemoveField(
+            model_name='conversationmember',
+            name='last_read_message',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_at',
+        ),
+        migrations.DeleteModel(
+            name='MessageReceipt',
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Message = apps.get_model('chat', 'Message')
+
+    # Walked by id range, since the message table is too large to list its ids
+    last_id = Message.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id + 1, 5000):
+        Message.objects.filter(id__gte=start, id__lt=start + 5000, deleted_for_everyone=False).update(
+            search_vector=SearchVector('content', config='simple'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_read_watermarks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('deleted_for_everyone', False)), fields=['search_vector'], name='chat_message_search_idx'),
+        ),
+    ]
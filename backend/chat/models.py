@@ -1,18 +1,33 @@
-from django.db import models
+import re
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorField
+from django.db import models, transaction
 from accounts.models import User
-from django.db.models import Q
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, m2m_changed
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 
 class Conversation(models.Model):
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, through='ConversationMember', related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_group = models.BooleanField(default=False)
     group_name = models.CharField(max_length=200, blank=True)
     group_icon = models.ImageField(upload_to='chat/group_icons/', blank=True, null=True)
     
+    # Copy of the newest message, so listing conversations never reads their history
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_type = models.CharField(max_length=20, blank=True)
+    last_message_preview = models.CharField(max_length=100, blank=True)
+    last_message_is_deleted = models.BooleanField(default=False)
+    
+    # Last number handed out to a message created or changed in the conversation
+    last_seq = models.PositiveBigIntegerField(default=0)
+    
     class Meta:
         ordering = ['-updated_at']
     
@@ -21,15 +36,94 @@ class Conversation(models.Model):
             return f"Group: {self.group_name}"
         return f"Conversation {self.id}"
     
-    @property
-    def last_message(self):
-        return self.messages.first()
-    
     def get_other_participant(self, user):
         return self.participants.exclude(id=user.id).first()
     
+    @staticmethod
+    def next_seq(conversation_id):
+        """Take the conversation's next sequence number; call inside a transaction."""
+        conversations = Conversation.objects.filter(id=conversation_id)
+        conversations.update(last_seq=F('last_seq') + 1)
+        return conversations.values_list('last_seq', flat=True).get()
+
     def unread_count(self, user):
-        return self.messages.filter(~Q(sender=user), is_read=False).count()
+        return self.members.filter(user=user).values_list('unread_count', flat=True).first() or 0
+
+    @staticmethod
+    def last_message_fields(message):
+        """The ``last_message_*`` values that describe ``message``."""
+        if message.message_type == 'document' and message.document:
+            preview = message.file_name
+        else:
+            preview = message.content
+        return {
+            'last_message_at': message.created_at,
+            'last_message_sender_id': message.sender_id,
+            'last_message_type': message.message_type,
+            'last_message_preview': (preview or '')[:100],
+            'last_message_is_deleted': message.is_deleted,
+        }
+
+
+class ConversationMember(models.Model):
+    """A participant of a conversation, with their read position and unread counter.
+
+    Uses the table Django created for the original many-to-many field.
+    Read state is a watermark: the member has read every message whose
+    ``seq`` is at most ``last_read_seq``. ``last_activity_at`` follows the
+    conversation's newest message so that a user's inbox is read in order
+    from a single index.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_seq = models.PositiveBigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'chat_conversation_participants'
+        unique_together = ('conversation', 'user')
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at'], name='chat_member_inbox_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id}"
+    
+    @classmethod
+    def mark_read(cls, conversation_id, user_id, seq=None):
+        """Move the user's watermark forward to ``seq``, or to the newest message when ``None``.
+
+        A single row is written whatever the number of messages read, and
+        only messages after the new watermark are counted for the unread
+        counter. Returns the new watermark, or ``None`` if it did not move.
+        """
+        last_seq = Conversation.objects.filter(id=conversation_id).values_list('last_seq', flat=True).first()
+        if last_seq is None:
+            return None
+        seq = last_seq if seq is None else min(seq, last_seq)
+        still_unread = Message.objects.filter(
+            conversation_id=conversation_id, seq__gt=seq
+        ).exclude(sender_id=user_id).order_by().values('conversation_id').annotate(n=models.Count('id')).values('n')
+        moved = cls.objects.filter(conversation_id=conversation_id, user_id=user_id, last_read_seq__lt=seq).update(
+            last_read_seq=seq,
+            last_read_at=timezone.now(),
+            unread_count=Coalesce(models.Subquery(still_unread), 0, output_field=models.IntegerField()),
+        )
+        return seq if moved else None
+
+    @staticmethod
+    def read_watermarks(conversation_ids):
+        """``{conversation id: {user id: last read seq}}`` for the given conversations, in one query."""
+        watermarks = {conversation_id: {} for conversation_id in conversation_ids}
+        rows = ConversationMember.objects.filter(conversation_id__in=watermarks).values_list(
+            'conversation_id', 'user_id', 'last_read_seq'
+        )
+        for conversation_id, user_id, last_read_seq in rows:
+            watermarks[conversation_id][user_id] = last_read_seq
+        return watermarks
+
 
 class Message(models.Model):
     MESSAGE_TYPE_CHOICES = (
@@ -57,8 +151,7 @@ class Message(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_name = models.CharField(max_length=200, blank=True)
     
-    # Message metadata
-    is_read = models.BooleanField(default=False)
+    # Message metadata; read state comes from the members' watermarks (ConversationMember.last_read_seq)
     is_edited = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
     deleted_for_everyone = models.BooleanField(default=False)
@@ -68,21 +161,74 @@ class Message(models.Model):
     
     # Delivery status
     delivered_at = models.DateTimeField(null=True, blank=True)
-    read_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Positions in the conversation's sequence: when the message was sent and when it last changed
+    seq = models.PositiveBigIntegerField(default=0)
+    change_seq = models.PositiveBigIntegerField(default=0)
+    
+    # Written by save(); empty once the message is deleted for everyone, see search()
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['conversation', '-created_at']),
             models.Index(fields=['sender', '-created_at']),
+            models.Index(fields=['conversation', 'change_seq'], name='chat_message_sync_idx'),
+            # Messages deleted for everyone never enter the index
+            GinIndex(fields=['search_vector'], name='chat_message_search_idx', condition=Q(deleted_for_everyone=False)),
+        ]
+        constraints = [
+            # Also serves counting the messages after a read watermark
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='unique_message_seq'),
         ]
     
     def __str__(self):
         return f"Message from {self.sender.username} - {self.message_type}"
     
+    def save(self, *args, **kwargs):
+        # The sequence row stays locked until commit, so numbers become visible in order
+        with transaction.atomic(savepoint=False):
+            self.change_seq = Conversation.next_seq(self.conversation_id)
+            if self._state.adding:
+                self.seq = self.change_seq
+            # Built from the value being saved, so the document follows creates and edits in the same statement
+            self.search_vector = None if self.deleted_for_everyone else self.search_vector_expression(self.content)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq', 'search_vector'}
+            super().save(*args, **kwargs)
+    
+    @staticmethod
+    def search_vector_expression(content):
+        return SearchVector(models.Value(content or '', output_field=models.TextField()), config='simple')
+    
+    @staticmethod
+    def search_query(text):
+        """Every word of ``text`` as a prefix, so that half-typed words already find messages."""
+        terms = [re.sub(r'[^\w@.-]', '', word).lower() for word in text.split()]
+        terms = [f"'{term}':*" for term in terms if term]
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(terms), search_type='raw', config='simple')
+    
+    @classmethod
+    def search(cls, queryset, text):
+        """Narrow ``queryset`` to messages matching ``text`` through the partial GIN index."""
+        query = cls.search_query(text)
+        if query is None:
+            return queryset.none()
+        # Repeating the index condition lets the planner use it
+        return queryset.filter(deleted_for_everyone=False, search_vector=query)
+    
+    @staticmethod
+    def touch(message_id, conversation_id):
+        """Record a change made outside the row, such as a reaction, for delta sync."""
+        with transaction.atomic(savepoint=False):
+            Message.objects.filter(id=message_id).update(change_seq=Conversation.next_seq(conversation_id))
+    
     @property
     def file_url(self):
         if self.message_type == 'image' and self.image:
@@ -101,21 +247,8 @@ class Message(models.Model):
             return self.document.name.split('/')[-1]
         return None
 
-class MessageReceipt(models.Model):
-    """Track message delivery and read status for each recipient"""
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='receipts')
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    delivered_at = models.DateTimeField(null=True, blank=True)
-    read_at = models.DateTimeField(null=True, blank=True)
-    
-    class Meta:
-        unique_together = ('message', 'user')
-    
-    def __str__(self):
-        return f"Receipt for {self.message.id} - {self.user.username}"
-
 class TypingStatus(models.Model):
-    """Track who is typing in a conversation"""
+    """Typing changes, only recorded when CHAT_TYPING_DEBUG_SINK is enabled"""
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='typing_statuses')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     is_typing = models.BooleanField(default=False)
@@ -150,18 +283,63 @@ class MessageReaction(models.Model):
         return f"{self.user.username} reacted {self.reaction} "
 
 @receiver(post_save, sender=Message)
-def create_chat_notification(sender, instance, created, **kwargs):
+def record_last_message(sender, instance, created, **kwargs):
+    """Keep the conversation's last message copy and its members' unread counters current."""
+    fields = Conversation.last_message_fields(instance)
+    if not created:
+        Conversation.objects.filter(last_message=instance).update(**fields)
+        return
+    # A slower, older insert must not replace a newer last message
+    Conversation.objects.filter(
+        Q(last_message__isnull=True) | Q(last_message_id__lt=instance.id), id=instance.conversation_id
+    ).update(last_message=instance, updated_at=instance.created_at, **fields)
+    # The sender has read everything up to their own message
+    sent = Q(user_id=instance.sender_id)
+    ConversationMember.objects.filter(conversation_id=instance.conversation_id).update(
+        unread_count=Case(When(sent, then=Value(0)), default=F('unread_count') + 1),
+        last_read_seq=Case(
+            When(sent, then=Value(instance.seq)), default=F('last_read_seq'), output_field=models.PositiveBigIntegerField()
+        ),
+        last_activity_at=instance.created_at,
+    )
+
+
+@receiver(post_save, sender=Message)
+def publish_message_created(sender, instance, created, **kwargs):
+    # Notifications are created by the outbox relay, off the request path
     if created:
-        from notifications.models import Notification
-        participants = instance.conversation.participants.exclude(id=instance.sender.id)
-        message_preview = instance.content[:50] + "..." if instance.content and len(instance.content) > 50 else instance.content
-        if not message_preview:
-            message_preview = f"Sent a {instance.message_type}"
-            
-        for participant in participants:
-            Notification.objects.create(
-                user=participant,
-                notification_type='chat_message',
-                title=f"New message from {instance.sender.username}",
-                message=message_preview,
-            )
\ No newline at end of file
+        from outbox.services import OutboxService
+        from .membership import get_participant_ids
+        preview = instance.content[:50] + "..." if instance.content and len(instance.content) > 50 else instance.content
+        OutboxService.publish('chat.message_created', Message, instance.pk, {
+            'conversation_id': instance.conversation_id,
+            'sender_id': instance.sender_id,
+            'sender_username': instance.sender.username,
+            'message_type': instance.message_type,
+            'preview': preview or f"Sent a {instance.message_type}",
+            'recipient_ids': sorted(get_participant_ids(instance.conversation_id) - {instance.sender_id}),
+        })
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_conversation_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    from .membership import invalidate
+    if reverse:
+        conversation_ids = set(pk_set or ()) if action != 'pre_clear' else set(
+            sender.objects.filter(user_id=instance.pk).values_list('conversation_id', flat=True)
+        )
+        user_ids = {instance.pk}
+    else:
+        conversation_ids = {instance.pk}
+        user_ids = set(pk_set or ())
+    # Everyone left in the conversations may hold a cached copy as well
+    user_ids.update(sender.objects.filter(conversation_id__in=conversation_ids).values_list('user_id', flat=True))
+    invalidate(conversation_ids, user_ids)
+
+
+@receiver(pre_delete, sender=Conversation)
+def invalidate_deleted_conversation(sender, instance, **kwargs):
+    from .membership import invalidate
+    invalidate([instance.pk], instance.participants.values_list('id', flat=True))
@@ -0,0 +1,82 @@
+"""Online presence kept in Redis and driven by socket heartbeats.
+
+Every socket is recorded in a per-user sorted set scored by its last
+heartbeat, so several devices are counted separately and connections
+left by a crashed process age out on their own. A global sorted set of
+users scored by last-seen answers "who is online" for many users with a
+single command. Status changes are published to ``presence_<user id>``
+groups, which only the user's contacts subscribe to.
+"""
+import time
+from django.conf import settings
+from farmket.redis_client import get_redis
+
+SEEN_KEY = 'presence:seen'
+
+
+def presence_group(user_id):
+    return f'presence_{user_id}'
+
+
+def _connections_key(user_id):
+    return f'presence:connections:{user_id}'
+
+
+class PresenceService:
+    @staticmethod
+    def connect(user_id, channel_name):
+        """Record a new socket; True when it is the user's only live one."""
+        now = time.time()
+        key = _connections_key(user_id)
+        pipe = get_redis().pipeline()
+        pipe.zremrangebyscore(key, '-inf', now - settings.PRESENCE_TIMEOUT_SECONDS)
+        pipe.zadd(key, {channel_name: now})
+        pipe.expire(key, settings.PRESENCE_TIMEOUT_SECONDS)
+        pipe.zcard(key)
+        pipe.zadd(SEEN_KEY, {user_id: now})
+        return pipe.execute()[3] == 1
+
+    @staticmethod
+    def heartbeat(user_id, channel_name):
+        """Refresh a live socket; True when the user had been timed out in the meantime."""
+        now = time.time()
+        key = _connections_key(user_id)
+        pipe = get_redis().pipeline()
+        pipe.zadd(key, {channel_name: now})
+        pipe.expire(key, settings.PRESENCE_TIMEOUT_SECONDS)
+        pipe.zadd(SEEN_KEY, {user_id: now})
+        return pipe.execute()[2] == 1
+
+    @staticmethod
+    def disconnect(user_id, channel_name):
+        """Forget a socket; True when the user has no live socket left."""
+        now = time.time()
+        key = _connections_key(user_id)
+        pipe = get_redis().pipeline()
+        pipe.zrem(key, channel_name)
+        pipe.zremrangebyscore(key, '-inf', now - settings.PRESENCE_TIMEOUT_SECONDS)
+        pipe.zcard(key)
+        remaining = pipe.execute()[2]
+        if remaining:
+            return False
+        get_redis().zrem(SEEN_KEY, user_id)
+        return True
+
+    @staticmethod
+    def online_ids(user_ids):
+        """The subset of ``user_ids`` seen within PRESENCE_TIMEOUT_SECONDS, in one round trip."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        cutoff = time.time() - settings.PRESENCE_TIMEOUT_SECONDS
+        scores = get_redis().zmscore(SEEN_KEY, user_ids)
+        return {user_id for user_id, score in zip(user_ids, scores) if score is not None and score > cutoff}
+
+    @staticmethod
+    def expire():
+        """Drop users whose sockets stopped sending heartbeats; returns their ids."""
+        cutoff = time.time() - settings.PRESENCE_TIMEOUT_SECONDS
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.zrangebyscore(SEEN_KEY, '-inf', cutoff)
+        pipe.zremrangebyscore(SEEN_KEY, '-inf', cutoff)
+        return [int(user_id) for user_id in pipe.execute()[0]]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Conversation, Message, MessageReceipt, TypingStatus, MessageReaction
+from .models import Conversation, ConversationMember, Message, TypingStatus, MessageReaction
 from accounts.serializers import UserSerializer
 
 from django.conf import settings
@@ -13,9 +13,28 @@ class MessageReactionSerializer(serializers.ModelSerializer):
 
 
 class MessageReceiptSerializer(serializers.ModelSerializer):
+    """A member who has read a message, derived from their read watermark."""
+    read_at = serializers.DateTimeField(source='last_read_at')
+
     class Meta:
-        model = MessageReceipt
-        fields = ['id', 'user', 'delivered_at', 'read_at']
+        model = ConversationMember
+        fields = ['user', 'read_at']
+
+
+def read_watermarks(context, conversation_ids):
+    """Members' read watermarks per conversation, loaded in one query and remembered in the serializer context."""
+    known = context.setdefault('read_watermarks', {})
+    missing = {conversation_id for conversation_id in conversation_ids if conversation_id not in known}
+    if missing:
+        known.update(ConversationMember.read_watermarks(missing))
+    return known
+
+
+class MessageListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        read_watermarks(self.context, {message.conversation_id for message in messages})
+        return super().to_representation(messages)
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -24,9 +43,11 @@ class MessageSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     file_name = serializers.SerializerMethodField()
     reply_to_details = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
+        list_serializer_class = MessageListSerializer
         fields = [
             'id', 'conversation', 'sender', 'sender_details',
             'message_type', 'content',
@@ -37,8 +58,9 @@ class MessageSerializer(serializers.ModelSerializer):
             'reply_to', 'reply_to_details',
             'reactions',
             'created_at', 'updated_at',
+            'seq', 'change_seq',
         ]
-        read_only_fields = ['sender', 'created_at', 'updated_at', 'file_url', 'file_name']
+        read_only_fields = ['sender', 'created_at', 'updated_at', 'file_url', 'file_name', 'seq', 'change_seq']
 
     def get_file_url(self, obj):
         request = self.context.get('request')
@@ -50,6 +72,12 @@ class MessageSerializer(serializers.ModelSerializer):
     def get_file_name(self, obj):
         return obj.file_name
 
+    def get_is_read(self, obj):
+        # Read once every other member's watermark has reached the message
+        watermarks = read_watermarks(self.context, [obj.conversation_id])[obj.conversation_id]
+        others = [seq for user_id, seq in watermarks.items() if user_id != obj.sender_id]
+        return bool(others) and min(others) >= obj.seq
+
     def get_reply_to_details(self, obj):
         if obj.reply_to:
             return {
@@ -61,6 +89,27 @@ class MessageSerializer(serializers.ModelSerializer):
         return None
 
 
+class MessageSearchResultSerializer(serializers.ModelSerializer):
+    """A search hit with enough of its conversation to list it and jump to it by ``seq``."""
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+    conversation_details = serializers.SerializerMethodField()
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = [
+            'id', 'conversation', 'conversation_details', 'sender', 'sender_username',
+            'message_type', 'content', 'seq', 'created_at', 'rank',
+        ]
+
+    def get_conversation_details(self, obj):
+        return {
+            'id': obj.conversation_id,
+            'is_group': obj.conversation.is_group,
+            'group_name': obj.conversation.group_name,
+        }
+
+
 class ConversationSerializer(serializers.ModelSerializer):
     participants_details = UserSerializer(source='participants', many=True, read_only=True)
     last_message = serializers.SerializerMethodField()
@@ -77,12 +126,24 @@ class ConversationSerializer(serializers.ModelSerializer):
         ]
 
     def get_last_message(self, obj):
-        msg = obj.messages.first()
-        if msg:
-            return MessageSerializer(msg, context=self.context).data
-        return None
+        # Built from the copy kept on the conversation, so no message is loaded
+        if not obj.last_message_id:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'conversation': obj.id,
+            'sender': obj.last_message_sender_id,
+            'message_type': obj.last_message_type,
+            'content': obj.last_message_preview,
+            'file_name': obj.last_message_preview if obj.last_message_type == 'document' else None,
+            'is_deleted': obj.last_message_is_deleted,
+            'created_at': serializers.DateTimeField().to_representation(obj.last_message_at),
+        }
 
     def get_unread_count(self, obj):
+        # Annotated by ConversationViewSet from the user's membership row
+        if hasattr(obj, 'member_unread_count'):
+            return obj.member_unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.unread_count(request.user)
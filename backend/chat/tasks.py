@@ -0,0 +1,20 @@
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from channels.layers import get_channel_layer
+from accounts.models import User
+from .presence import PresenceService, presence_group
+
+
+@shared_task
+def expire_presence():
+    """Announce users whose sockets stopped sending heartbeats (crashed processes, lost networks) as offline."""
+    user_ids = PresenceService.expire()
+    channel_layer = get_channel_layer()
+    for user_id, username in User.objects.filter(id__in=user_ids).values_list('id', 'username'):
+        async_to_sync(channel_layer.group_send)(presence_group(user_id), {
+            'type': 'user_status',
+            'user_id': user_id,
+            'username': username,
+            'status': 'offline',
+        })
+    return f"Expired presence of {len(user_ids)} users."
@@ -1,3 +1,34 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from .models import Conversation, Message
 
-# Create your tests here.
+
+class MessageSearchPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='asha', email='asha@example.com')
+        other = User.objects.create(username='ravi', email='ravi@example.com')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user, other)
+        # Identical content gives every hit the same rank, so only the id orders them
+        self.message_ids = [
+            Message.objects.create(conversation=conversation, sender=other, content='fresh tomatoes').id
+            for _ in range(45)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_through_hits_with_equal_ranks(self):
+        seen = []
+        url = '/api/chat/messages/search/?q=tomatoes'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 20)
+            seen.extend(hit['id'] for hit in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted(self.message_ids, reverse=True))
+
+    def test_rejects_a_malformed_cursor(self):
+        response = self.client.get('/api/chat/messages/search/?q=tomatoes&cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,102 @@
+"""Chunked media transfers for the chat socket.
+
+A client announces a file with an ``upload_start`` event and then sends it
+as binary frames, each laid out as::
+
+    16 bytes transfer id | 8 bytes big-endian offset | chunk
+
+Chunks are appended to a temporary file as they arrive and hashed on the
+way, so memory use per transfer is bounded by the chunk size. Once every
+byte is in, the SHA-256 is checked and the file is moved into the storage
+backend under the upload path of the matching ``Message`` file field.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+
+HEADER_SIZE = 24
+
+# Media types are also the names of the Message file fields that store them
+MEDIA_TYPES = ('image', 'video', 'audio', 'document')
+
+
+class UploadError(Exception):
+    pass
+
+
+def parse_frame(frame):
+    """Split a binary frame into ``(transfer_id, offset, chunk)``."""
+    if len(frame) <= HEADER_SIZE:
+        raise UploadError('Chunk frames need a 24 byte header and data.')
+    view = memoryview(frame)
+    return bytes(view[:16]), int.from_bytes(view[16:HEADER_SIZE], 'big'), view[HEADER_SIZE:]
+
+
+class ChunkedUpload:
+    def __init__(self, conversation_id, media_type, file_name, size, sha256):
+        if media_type not in MEDIA_TYPES:
+            raise UploadError('Unsupported media type.')
+        if not isinstance(size, int) or not 0 < size <= settings.CHAT_UPLOAD_MAX_BYTES:
+            raise UploadError(f'Files must be between 1 byte and {settings.CHAT_UPLOAD_MAX_BYTES} bytes.')
+        if not isinstance(sha256, str) or len(sha256) != 64:
+            raise UploadError('sha256 must be a hex digest.')
+
+        self.id = uuid.uuid4().bytes
+        self.conversation_id = conversation_id
+        self.media_type = media_type
+        self.file_name = get_valid_filename(os.path.basename(file_name or '')) or 'upload'
+        self.size = size
+        self.sha256 = sha256.lower()
+        self.received = 0
+        self.stored_name = None
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False)
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def write(self, offset, chunk):
+        """Append ``chunk``; chunks must arrive in order and fit the announced size."""
+        if offset != self.received:
+            raise UploadError(f'Expected offset {self.received}, got {offset}.')
+        if len(chunk) > settings.CHAT_UPLOAD_CHUNK_BYTES:
+            raise UploadError(f'Chunks may be at most {settings.CHAT_UPLOAD_CHUNK_BYTES} bytes.')
+        if self.received + len(chunk) > self.size:
+            raise UploadError('More data than the announced size.')
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.received += len(chunk)
+
+    def finish(self):
+        """Verify the checksum and move the file into storage; returns the stored name."""
+        self._file.close()
+        try:
+            if self._hash.hexdigest() != self.sha256:
+                raise UploadError('Checksum mismatch.')
+            field = _media_field(self.media_type)
+            with open(self._file.name, 'rb') as handle:
+                self.stored_name = default_storage.save(
+                    field.generate_filename(None, self.file_name), File(handle, name=self.file_name)
+                )
+            return self.stored_name
+        finally:
+            os.unlink(self._file.name)
+
+    def discard(self):
+        """Remove the temporary file, and the stored file if no message took it."""
+        if not self._file.closed:
+            self._file.close()
+            os.unlink(self._file.name)
+        if self.stored_name:
+            default_storage.delete(self.stored_name)
+
+
+def _media_field(media_type):
+    from .models import Message
+    return Message._meta.get_field(media_type)
@@ -0,0 +1,38 @@
+"""Which users currently have a conversation open.
+
+Each socket that reports an open conversation is recorded in a sorted set
+per (conversation, user), scored by when the entry expires. Sockets
+refresh their entry while they stay active, so entries left behind by a
+crashed process simply age out.
+"""
+import time
+from django.conf import settings
+from farmket.redis_client import get_redis
+
+
+def _key(conversation_id, user_id):
+    return f'chat:viewing:{conversation_id}:{user_id}'
+
+
+def enter(conversation_id, user_id, channel_name):
+    key = _key(conversation_id, user_id)
+    pipe = get_redis().pipeline()
+    pipe.zadd(key, {channel_name: time.time() + settings.CHAT_VIEWING_TTL})
+    pipe.expire(key, settings.CHAT_VIEWING_TTL)
+    pipe.execute()
+
+
+def leave(conversation_id, user_id, channel_name):
+    get_redis().zrem(_key(conversation_id, user_id), channel_name)
+
+
+def viewing(conversation_id, user_ids):
+    """The subset of ``user_ids`` with the conversation open on some device."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    now = time.time()
+    pipe = get_redis().pipeline()
+    for user_id in user_ids:
+        pipe.zcount(_key(conversation_id, user_id), now, '+inf')
+    return {user_id for user_id, open_sockets in zip(user_ids, pipe.execute()) if open_sockets}
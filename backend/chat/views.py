@@ -1,11 +1,25 @@
-from rest_framework import viewsets, permissions, status, filters
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db import transaction
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message, MessageReaction
-from .serializers import ConversationSerializer, MessageSerializer, MessageReactionSerializer
+from .models import Conversation, ConversationMember, Message, MessageReaction
+from .serializers import (
+    ConversationSerializer, MessageSerializer, MessageReactionSerializer, MessageReceiptSerializer,
+    MessageSearchResultSerializer,
+)
+from .consumers import publish_read
 
 User = get_user_model()
 
@@ -15,9 +29,10 @@ class ConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user).prefetch_related(
-            'participants', 'messages'
-        )
+        # Read through the user's membership rows, newest activity first, on the inbox index
+        return Conversation.objects.filter(members__user=self.request.user).annotate(
+            member_unread_count=F('members__unread_count'),
+        ).order_by('-members__last_activity_at', '-id').prefetch_related('participants')
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -55,7 +70,14 @@ class ConversationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         conversation = self.get_object()
-        conversation.messages.exclude(sender=request.user).update(is_read=True)
+        try:
+            seq = request.data.get('seq')
+            seq = None if seq is None else int(seq)
+        except (TypeError, ValueError):
+            return Response({'error': 'seq must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        seq = ConversationMember.mark_read(conversation.id, request.user.id, seq)
+        if seq is not None:
+            publish_read(conversation.id, request.user.id, seq)
         return Response({'status': 'messages marked as read'})
 
     @action(detail=False, methods=['get'])
@@ -83,13 +105,60 @@ class ConversationViewSet(viewsets.ModelViewSet):
         return Response(data)
 
 
+class MessageCursorPagination(CursorPagination):
+    page_size = 30
+    # Newest first, read backwards on the (conversation, -created_at) index
+    ordering = '-created_at'
+
+
+class MessageSearchPagination(BasePagination):
+    """Keyset pages over (rank, id), best match first.
+
+    CursorPagination keys pages on its first ordering field plus an offset,
+    which does not hold up for a computed rank shared by many hits. The
+    cursor here carries both values of the last hit, and the next page
+    starts strictly after that pair.
+    """
+    page_size = 20
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        position = self.decode_cursor(request)
+        if position is not None:
+            rank, last_id = position
+            queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=last_id))
+        page = list(queryset.order_by('-rank', '-id')[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            rank, last_id = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            return float(rank), int(last_id)
+        except (TypeError, ValueError, binascii.Error, UnicodeError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        encoded = urlsafe_b64encode(json.dumps([last.rank, last.id]).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['created_at']
-    ordering = ['created_at']
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         qs = Message.objects.filter(conversation__participants=self.request.user)
@@ -114,20 +183,99 @@ class MessageViewSet(viewsets.ModelViewSet):
         if not reaction_emoji:
             return Response({'error': 'reaction required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        obj, created = MessageReaction.objects.update_or_create(
-            message=message,
-            user=request.user,
-            defaults={'reaction': reaction_emoji}
-        )
+        with transaction.atomic():
+            obj, created = MessageReaction.objects.update_or_create(
+                message=message,
+                user=request.user,
+                defaults={'reaction': reaction_emoji}
+            )
+            Message.touch(message.id, message.conversation_id)
         return Response({'status': 'created' if created else 'updated', 'reaction': reaction_emoji})
 
     @action(detail=True, methods=['delete'], url_path='unreact')
     def unreact(self, request, pk=None):
         """Remove a reaction from a message."""
         message = self.get_object()
-        MessageReaction.objects.filter(message=message, user=request.user).delete()
+        with transaction.atomic():
+            if MessageReaction.objects.filter(message=message, user=request.user).delete()[0]:
+                Message.touch(message.id, message.conversation_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['get'])
+    def receipts(self, request, pk=None):
+        """Members other than the sender whose read watermark has reached this message."""
+        message = self.get_object()
+        members = ConversationMember.objects.filter(
+            conversation_id=message.conversation_id, last_read_seq__gte=message.seq
+        ).exclude(user_id=message.sender_id)
+        return Response(MessageReceiptSerializer(members, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Messages of a conversation created or changed after the client's ``since`` sequence number.
+
+        Returns at most CHAT_SYNC_LIMIT messages in change order, with
+        ``seq`` as the watermark for the next call and ``has_more`` when
+        the client should call again straight away.
+        """
+        try:
+            conversation_id = int(request.query_params['conversation'])
+            since = int(request.query_params.get('since', 0))
+        except (KeyError, ValueError):
+            return Response({'error': 'conversation and an integer since are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the head first: numbers up to it are committed, so nothing below the watermark can appear later
+        last_seq = Conversation.objects.filter(
+            id=conversation_id, participants=request.user
+        ).values_list('last_seq', flat=True).first()
+        if last_seq is None:
+            return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        limit = settings.CHAT_SYNC_LIMIT
+        messages = list(
+            Message.objects.filter(conversation_id=conversation_id, change_seq__gt=since, change_seq__lte=last_seq)
+            .select_related('sender', 'reply_to__sender').prefetch_related('reactions')
+            .order_by('change_seq')[:limit + 1]
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        return Response({
+            'messages': self.get_serializer(messages, many=True).data,
+            'seq': messages[-1].change_seq if has_more else max(last_seq, since),
+            'has_more': has_more,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Messages matching ``q`` in the caller's conversations, best match first.
+
+        ``conversation`` narrows the search to one conversation. Pages are
+        keyed on (rank, id), so results stay stable while new messages arrive.
+        """
+        q = request.query_params.get('q', '')
+        query = Message.search_query(q)
+        if query is None:
+            return Response({'error': 'q must contain a word to search for'}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = Message.search(
+            Message.objects.filter(
+                conversation_id__in=ConversationMember.objects.filter(user=request.user).values('conversation_id'),
+                is_deleted=False,
+            ),
+            q,
+        )
+        conversation_id = request.query_params.get('conversation')
+        if conversation_id:
+            qs = qs.filter(conversation_id=conversation_id)
+        # ts_rank returns float4; as float8 the rank read back into the cursor compares equal to the stored one
+        qs = qs.annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        ).select_related('sender', 'conversation')
+
+        paginator = MessageSearchPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(MessageSearchResultSerializer(page, many=True).data)
+
     @action(detail=False, methods=['post'], url_path='upload_media')
     def upload_media(self, request):
         """
@@ -147,29 +295,16 @@ class MessageViewSet(viewsets.ModelViewSet):
         except Conversation.DoesNotExist:
             return Response({'error': 'Conversation not found'}, status=404)
 
+        # The file is stored while the row is prepared, so the message is a single INSERT
+        media = {msg_type: file_obj} if msg_type in ('image', 'video', 'audio', 'document') else {}
         message = Message.objects.create(
             conversation=conversation,
             sender=request.user,
             message_type=msg_type,
             content=content,
+            **media
         )
 
-        if msg_type == 'image':
-            message.image = file_obj
-        elif msg_type == 'video':
-            message.video = file_obj
-        elif msg_type == 'audio':
-            message.audio = file_obj
-        elif msg_type == 'document':
-            message.document = file_obj
-
-        message.save()
-
-        # Update conversation timestamp
-        from django.utils import timezone
-        conversation.updated_at = timezone.now()
-        conversation.save(update_fields=['updated_at'])
-
         serializer = self.get_serializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -182,4 +317,11 @@ class MessageReactionViewSet(viewsets.ModelViewSet):
         return MessageReaction.objects.filter(message__conversation__participants=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            reaction = serializer.save(user=self.request.user)
+            Message.touch(reaction.message_id, reaction.message.conversation_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Message.touch(instance.message_id, instance.message.conversation_id)
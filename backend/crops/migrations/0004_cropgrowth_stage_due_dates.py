@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:14
+
+from django.conf import settings
+from datetime import timedelta
+from django.db import migrations, models
+
+def populate_stage_due_dates(apps, schema_editor):
+    CropGrowth = apps.get_model('crops', 'CropGrowth')
+    thresholds = {'growing_from': 0.25, 'near_harvest_from': 0.75}
+
+    for crop in CropGrowth.objects.all():
+        window = (crop.expected_harvest_date - crop.sowing_date).days
+        for field, fraction in thresholds.items():
+            setattr(crop, field, crop.sowing_date + timedelta(days=int(window * fraction)))
+        crop.save(update_fields=list(thresholds))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crops', '0003_rename_updated_at_cropgrowth_last_updated_and_more'),
+        ('products', '0004_product_products_pr_is_avai_c23034_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropgrowth',
+            name='growing_from',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cropgrowth',
+            name='near_harvest_from',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_stage_due_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cropgrowth',
+            index=models.Index(fields=['stage', 'growing_from'], name='crops_cropg_stage_ac2f2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cropgrowth',
+            index=models.Index(fields=['stage', 'near_harvest_from'], name='crops_cropg_stage_11a805_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crops', '0004_cropgrowth_stage_due_dates'),
+        ('orders', '0006_order_orders_orde_buyer_i_90aa29_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cropreservation',
+            index=models.Index(fields=['reservation_status', 'reserved_at'], name='crops_cropr_reserva_106825_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from accounts.models import User
 from products.models import Product
@@ -10,6 +11,13 @@ class CropStage(models.TextChoices):
     NEAR_HARVEST = "NEAR_HARVEST", "Near Harvest"
     HARVESTED = "HARVESTED", "Harvested"
 
+# Fraction of the sowing -> expected harvest window after which a crop is
+# automatically moved into each stage by the progression scheduler.
+STAGE_PROGRESSION_THRESHOLDS = {
+    CropStage.GROWING: 0.25,
+    CropStage.NEAR_HARVEST: 0.75,
+}
+
 class CropGrowth(models.Model):
 
     farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='crop_growths')
@@ -22,15 +30,37 @@ class CropGrowth(models.Model):
     stage = models.CharField(max_length=20, choices=CropStage.choices, default=CropStage.PLANTED)
     organic = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
+    # Dates on which the crop becomes due for automatic stage progression
+    growing_from = models.DateField(null=True, blank=True, editable=False)
+    near_harvest_from = models.DateField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-expected_harvest_date']
+        indexes = [
+            models.Index(fields=['stage', 'growing_from']),
+            models.Index(fields=['stage', 'near_harvest_from']),
+        ]
 
     def __str__(self):
         return f"{self.product.name if self.product else 'Unknown Crop'} - {self.farmer.username}"
 
+    def save(self, *args, **kwargs):
+        self.growing_from = self.stage_due_date(CropStage.GROWING)
+        self.near_harvest_from = self.stage_due_date(CropStage.NEAR_HARVEST)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'sowing_date', 'expected_harvest_date'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'growing_from', 'near_harvest_from'}
+        super().save(*args, **kwargs)
+
+    def stage_due_date(self, stage):
+        """Date on which the given stage is reached, based on the growth window."""
+        if not self.sowing_date or not self.expected_harvest_date:
+            return None
+        window = (self.expected_harvest_date - self.sowing_date).days
+        return self.sowing_date + timedelta(days=int(window * STAGE_PROGRESSION_THRESHOLDS[stage]))
+
     @property
     def progress_percentage(self):
         mapping = {
@@ -71,6 +101,17 @@ class CropReservation(models.Model):
 
     class Meta:
         ordering = ['-reserved_at']
+        indexes = [
+            models.Index(fields=['reservation_status', 'reserved_at']),
+        ]
+
+    @property
+    def expires_at(self):
+        """When a pending stand-alone reservation is released by the sweeper."""
+        hours = settings.CROP_RESERVATION_EXPIRY_HOURS
+        if not hours or self.reservation_status != 'PENDING' or self.order_id or not self.reserved_at:
+            return None
+        return self.reserved_at + timedelta(hours=hours)
 
 class CropFollower(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followed_crops')
@@ -13,10 +13,11 @@ class CropStageHistorySerializer(serializers.ModelSerializer):
 class CropReservationSerializer(serializers.ModelSerializer):
     buyer_name = serializers.ReadOnlyField(source='buyer.username')
     crop_name = serializers.ReadOnlyField(source='crop_growth.product.name')
+    expires_at = serializers.ReadOnlyField()
 
     class Meta:
         model = CropReservation
-        fields = ['id', 'buyer', 'buyer_name', 'crop_growth', 'crop_name', 'quantity_reserved', 'reservation_status', 'reserved_at', 'expected_delivery_date']
+        fields = ['id', 'buyer', 'buyer_name', 'crop_growth', 'crop_name', 'quantity_reserved', 'reservation_status', 'reserved_at', 'expected_delivery_date', 'expires_at']
         read_only_fields = ['buyer', 'reserved_at']
 
 class CropFollowerSerializer(serializers.ModelSerializer):
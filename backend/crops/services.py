@@ -0,0 +1,209 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import F, Case, When, Value, DecimalField
+from django.utils import timezone
+from .models import CropGrowth, CropStage, CropStageHistory, CropReservation
+from outbox.services import OutboxService
+
+
+def reservation_created_payload(farmer_id, buyer_id, buyer_username, quantity, product_name):
+    """Payload of the ``reservation.created`` outbox event."""
+    return {
+        'farmer_id': farmer_id,
+        'buyer_id': buyer_id,
+        'user_ids': [farmer_id, buyer_id],
+        'buyer_username': buyer_username,
+        'quantity': quantity,
+        'product_name': product_name,
+    }
+
+
+# CropReservation.quantity_reserved is DecimalField(max_digits=10, decimal_places=2)
+RESERVATION_QUANTITY_STEP = Decimal('0.01')
+RESERVATION_QUANTITY_MAX = Decimal('99999999.99')
+
+
+def parse_reservation_quantity(value):
+    """``(quantity, error)`` for a requested reservation quantity, rounded to what the column stores."""
+    try:
+        quantity = Decimal(str(value))
+    except InvalidOperation:
+        return None, 'Quantity must be a number'
+    if not quantity.is_finite():
+        return None, 'Quantity must be a number'
+    # quantize() fails on huge values, so the range is checked before rounding as well as after
+    for rounded in (False, True):
+        if rounded:
+            quantity = quantity.quantize(RESERVATION_QUANTITY_STEP, rounding=ROUND_HALF_UP)
+        if quantity > RESERVATION_QUANTITY_MAX:
+            return None, 'Quantity is too large'
+        if quantity <= 0:
+            return None, 'Quantity must be at least 0.01'
+    return quantity, None
+
+
+class CropProgressionService:
+    # Applied in this order so that a crop which is already late for
+    # NEAR_HARVEST skips straight past GROWING in a single run.
+    TRANSITIONS = (
+        (CropStage.NEAR_HARVEST, [CropStage.PLANTED, CropStage.GROWING], 'near_harvest_from'),
+        (CropStage.GROWING, [CropStage.PLANTED], 'growing_from'),
+    )
+
+    @staticmethod
+    def advance_due_stages(today=None):
+        """Move every crop whose stage date has passed into its next stage.
+
+        Each transition is a fixed number of set-based statements regardless
+        of how many crops are due: one indexed SELECT, one UPDATE and bulk
+        inserts for history rows and the outbox events that notify followers.
+        """
+        today = today or timezone.now().date()
+        advanced = {}
+        for new_stage, from_stages, due_field in CropProgressionService.TRANSITIONS:
+            advanced[new_stage] = CropProgressionService._apply_transition(
+                new_stage, from_stages, due_field, today
+            )
+        return advanced
+
+    @staticmethod
+    @transaction.atomic
+    def _apply_transition(new_stage, from_stages, due_field, today):
+        due = list(
+            CropGrowth.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(stage__in=from_stages, **{f'{due_field}__lte': today})
+            .values_list('id', 'stage', 'product__name')
+        )
+        if not due:
+            return 0
+
+        crop_ids = [crop_id for crop_id, _, _ in due]
+        CropGrowth.objects.filter(id__in=crop_ids).update(stage=new_stage, last_updated=timezone.now())
+
+        CropStageHistory.objects.bulk_create([
+            CropStageHistory(
+                crop_growth_id=crop_id,
+                previous_stage=previous_stage,
+                current_stage=new_stage,
+                updated_by=None,
+                remarks='Automatically advanced based on the expected harvest date.'
+            )
+            for crop_id, previous_stage, _ in due
+        ])
+
+        OutboxService.publish_many('crop.stage_changed', CropGrowth, [
+            (crop_id, {
+                'product_name': name or 'Crop',
+                'previous_stage': previous_stage,
+                'stage': new_stage,
+                'stage_display': CropStage(new_stage).label,
+            })
+            for crop_id, previous_stage, name in due
+        ])
+
+        return len(due)
+
+
+class ReservationService:
+    @staticmethod
+    @transaction.atomic
+    def reserve(user, crop, quantity, expected_delivery_date=None):
+        """Reserve ``quantity`` of ``crop`` for ``user``; ``None`` when not enough is available.
+
+        ``quantity`` must already be validated with ``parse_reservation_quantity``.
+
+        The quantity is taken with a conditional ``F()`` update, so concurrent
+        reservations, checkout and the expiry sweeper never overwrite each other.
+        """
+        taken = CropGrowth.objects.filter(id=crop.id, available_quantity__gte=quantity).update(
+            available_quantity=F('available_quantity') - quantity,
+            last_updated=timezone.now(),
+        )
+        if not taken:
+            return None
+        return CropReservation.objects.create(
+            buyer=user,
+            crop_growth=crop,
+            quantity_reserved=quantity,
+            expected_delivery_date=expected_delivery_date or crop.expected_harvest_date,
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def decide(reservation, new_status):
+        """Move a PENDING reservation to CONFIRMED or CANCELLED; False when it is no longer pending.
+
+        The status is switched with a conditional UPDATE, which also locks the
+        row, so a reservation released by the sweeper or decided by a concurrent
+        request is never confirmed or returned to stock a second time.
+        """
+        changed = CropReservation.objects.filter(id=reservation.id, reservation_status='PENDING').update(
+            reservation_status=new_status,
+        )
+        if not changed:
+            return False
+
+        if new_status == 'CANCELLED':
+            CropGrowth.objects.filter(id=reservation.crop_growth_id).update(
+                available_quantity=F('available_quantity') + reservation.quantity_reserved,
+                last_updated=timezone.now(),
+            )
+        reservation.reservation_status = new_status
+        # update() skips the post_save receiver that tells the buyer
+        OutboxService.publish('reservation.status_changed', CropReservation, reservation.id, {
+            'buyer_id': reservation.buyer_id,
+            'user_ids': [reservation.buyer_id],
+            'product_name': reservation.crop_growth.product.name,
+            'status': new_status,
+            'status_display': reservation.get_reservation_status_display(),
+        })
+        return True
+
+    @staticmethod
+    @transaction.atomic
+    def release_expired(cutoff, batch_size=500):
+        """Cancel up to ``batch_size`` PENDING reservations made before ``cutoff``.
+
+        Only stand-alone reservations are swept; pre-bookings placed through
+        checkout follow the lifecycle of their order instead. The reserved
+        quantities are summed per crop and returned with a single UPDATE.
+        Returns the number of reservations released.
+        """
+        expired = list(
+            CropReservation.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(reservation_status='PENDING', reserved_at__lt=cutoff, order__isnull=True)
+            .order_by('reserved_at')
+            .values_list('id', 'crop_growth_id', 'quantity_reserved', 'buyer_id', 'crop_growth__product__name')[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        released = defaultdict(Decimal)
+        for _, crop_id, quantity, _, _ in expired:
+            released[crop_id] += quantity
+
+        # Lock the crops in id order, the same order checkout uses
+        crop_ids = list(
+            CropGrowth.objects.select_for_update().filter(id__in=released).order_by('id').values_list('id', flat=True)
+        )
+        CropReservation.objects.filter(id__in=[row[0] for row in expired]).update(reservation_status='CANCELLED')
+        CropGrowth.objects.filter(id__in=crop_ids).update(
+            available_quantity=F('available_quantity') + Case(
+                *[When(id=crop_id, then=Value(released[crop_id])) for crop_id in crop_ids],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            last_updated=timezone.now(),
+        )
+
+        OutboxService.publish_many('reservation.expired', CropReservation, [
+            (reservation_id, {
+                'buyer_id': buyer_id,
+                'user_ids': [buyer_id],
+                'product_name': name or 'Crop',
+                'quantity': quantity,
+            })
+            for reservation_id, _, quantity, buyer_id, name in expired
+        ])
+
+        return len(expired)
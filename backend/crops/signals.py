@@ -1,7 +1,8 @@
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from .models import CropGrowth, CropStageHistory, CropReservation, CropFollower
-from notifications.models import Notification
+from outbox.services import OutboxService
+from .services import reservation_created_payload
 
 @receiver(pre_save, sender=CropGrowth)
 def track_stage_change(sender, instance, **kwargs):
@@ -28,26 +29,14 @@ def process_stage_change(sender, instance, created, **kwargs):
             remarks=getattr(instance, '_stage_remarks', '')
         )
         
-        # 2. Notify followers if stage changed
+        # 2. Followers are notified through the outbox once this commits
         if not created and previous_stage:
-            followers = instance.followers.all()
-            for follower in followers:
-                Notification.objects.create(
-                    user=follower.buyer,
-                    notification_type='buyer_alert',
-                    title=f"Crop Stage Updated: {instance.product.name if instance.product else 'Crop'}",
-                    message=f"The stage changed from {previous_stage} to {instance.stage}."
-                )
-                
-            # If ready for harvest or harvested, send specific alerts
-            if instance.stage in ['NEAR_HARVEST', 'HARVESTED']:
-                for follower in followers:
-                    Notification.objects.create(
-                        user=follower.buyer,
-                        notification_type='buyer_alert',
-                        title=f"Harvest Alert: {instance.product.name if instance.product else 'Crop'}",
-                        message=f"The crop is now {instance.get_stage_display()}!"
-                    )
+            OutboxService.publish('crop.stage_changed', CropGrowth, instance.id, {
+                'product_name': instance.product.name if instance.product else 'Crop',
+                'previous_stage': previous_stage,
+                'stage': instance.stage,
+                'stage_display': instance.get_stage_display(),
+            })
 
 @receiver(pre_save, sender=CropReservation)
 def track_reservation_status(sender, instance, **kwargs):
@@ -60,20 +49,19 @@ def track_reservation_status(sender, instance, **kwargs):
             pass
 
 @receiver(post_save, sender=CropReservation)
-def notify_reservation_status(sender, instance, created, **kwargs):
+def publish_reservation_events(sender, instance, created, **kwargs):
     if created:
-        # Notify Farmer of new reservation
-        Notification.objects.create(
-            user=instance.crop_growth.farmer,
-            notification_type='system',
-            title='New Pre-Booking Request',
-            message=f"{instance.buyer.username} wants to reserve {instance.quantity_reserved} of {instance.crop_growth.product.name}."
-        )
+        # Tell the farmer about the new reservation
+        OutboxService.publish('reservation.created', CropReservation, instance.id, reservation_created_payload(
+            instance.crop_growth.farmer_id, instance.buyer_id, instance.buyer.username,
+            instance.quantity_reserved, instance.crop_growth.product.name,
+        ))
     elif getattr(instance, '_status_changed', False):
-        # Notify Buyer of status change
-        Notification.objects.create(
-            user=instance.buyer,
-            notification_type='system',
-            title='Reservation Status Updated',
-            message=f"Your reservation for {instance.crop_growth.product.name} is now {instance.get_reservation_status_display()}."
-        )
+        # Tell the buyer about the status change
+        OutboxService.publish('reservation.status_changed', CropReservation, instance.id, {
+            'buyer_id': instance.buyer_id,
+            'user_ids': [instance.buyer_id],
+            'product_name': instance.crop_growth.product.name,
+            'status': instance.reservation_status,
+            'status_display': instance.get_reservation_status_display(),
+        })
@@ -1,7 +1,9 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from .models import CropGrowth
+from .services import CropProgressionService, ReservationService
 from notifications.models import Notification
 
 @shared_task
@@ -46,3 +48,27 @@ def check_upcoming_harvests():
                     title=f"Harvest in 7 Days: {crop.product.name if crop.product else 'Crop'}",
                     message=f"The crop you follow is expected to be harvested in 7 days. Be ready to order!"
                 )
+
+@shared_task
+def advance_crop_stages():
+    if not settings.CROP_STAGE_AUTO_PROGRESSION:
+        return "Automatic crop stage progression is disabled."
+
+    advanced = CropProgressionService.advance_due_stages()
+    summary = ', '.join(f"{count} to {stage}" for stage, count in advanced.items())
+    return f"Advanced crops: {summary}"
+
+@shared_task
+def release_expired_reservations(batch_size=500):
+    hours = settings.CROP_RESERVATION_EXPIRY_HOURS
+    if not hours:
+        return "Reservation expiry is disabled."
+
+    cutoff = timezone.now() - timedelta(hours=hours)
+    total = 0
+    while True:
+        released = ReservationService.release_expired(cutoff, batch_size=batch_size)
+        total += released
+        if released < batch_size:
+            break
+    return f"Released {total} expired reservations."
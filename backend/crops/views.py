@@ -1,10 +1,13 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 from django.utils import timezone
 from .models import CropGrowth, CropReservation, CropFollower
+from .services import ReservationService, parse_reservation_quantity
 from .serializers import CropGrowthSerializer, CropReservationSerializer, CropFollowerSerializer
 from products.permissions import IsFarmerOwnerOrReadOnly, IsBuyerOwnerOrReadOnly
+from orders.idempotency import idempotent
 
 class CropGrowthViewSet(viewsets.ModelViewSet):
     queryset = CropGrowth.objects.all()
@@ -39,6 +42,7 @@ class CropGrowthViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(qs, many=True)
         return Response(serializer.data)
 
+    @transaction.atomic
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsFarmerOwnerOrReadOnly])
     def update_stage(self, request, pk=None):
         crop = self.get_object()
@@ -58,18 +62,23 @@ class CropGrowthViewSet(viewsets.ModelViewSet):
                 crop.product.stock_quantity += int(float(crop.available_quantity))
                 crop.product.save()
                 
-            from orders.models import OrderItem
+            from orders.models import OrderItem, record_item_transitions
             reservations = crop.reservations.filter(reservation_status__in=['PENDING', 'CONFIRMED'])
             for res in reservations:
-                order_items = OrderItem.objects.filter(
-                    order__buyer=res.buyer,
-                    crop_growth=crop,
-                    is_prebooking=True
+                # Locked in id order before the counters move, like every item transition
+                order_items = list(
+                    OrderItem.objects.select_for_update(of=('self',)).filter(
+                        order__buyer=res.buyer,
+                        crop_growth=crop,
+                        is_prebooking=True
+                    ).order_by('id').values('id', 'order_id', 'farmer_id', 'status')
                 )
-                for item in order_items:
-                    item.status = 'pending' # Converts to standard pending order item
-                    item.is_prebooking = False # Now it's a standard order item
-                    item.save()
+                # Converts to standard pending order items
+                OrderItem.objects.filter(id__in=[item['id'] for item in order_items]).update(status='pending', is_prebooking=False)
+                record_item_transitions([
+                    (item['id'], item['order_id'], item['farmer_id'], item['status'], 'pending')
+                    for item in order_items if item['status'] != 'pending'
+                ])
                 res.reservation_status = 'COMPLETED'
                 res.save()
 
@@ -81,31 +90,23 @@ class CropGrowthViewSet(viewsets.ModelViewSet):
         
         return Response({'status': 'Stage updated', 'current_stage': crop.stage})
 
+    @idempotent
+    @transaction.atomic
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def reserve(self, request, pk=None):
         if hasattr(request.user, 'is_farmer') and request.user.is_farmer and request.user == self.get_object().farmer:
             return Response({'error': 'Farmers cannot reserve their own crops'}, status=status.HTTP_400_BAD_REQUEST)
             
         crop = self.get_object()
-        quantity_requested = float(request.data.get('quantity', 0))
-        
-        if quantity_requested <= 0:
-            return Response({'error': 'Quantity must be greater than 0'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if quantity_requested > crop.available_quantity:
-            return Response({'error': 'Requested quantity exceeds available quantity'}, status=status.HTTP_400_BAD_REQUEST)
+        quantity_requested, error = parse_reservation_quantity(request.data.get('quantity', 0))
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
             
-        # Create reservation
-        reservation = CropReservation.objects.create(
-            buyer=request.user,
-            crop_growth=crop,
-            quantity_reserved=quantity_requested,
-            expected_delivery_date=request.data.get('expected_delivery_date', crop.expected_harvest_date)
+        reservation = ReservationService.reserve(
+            request.user, crop, quantity_requested, request.data.get('expected_delivery_date')
         )
-        
-        # Deduct from available quantity
-        crop.available_quantity = float(crop.available_quantity) - quantity_requested
-        crop.save()
+        if reservation is None:
+            return Response({'error': 'Requested quantity exceeds available quantity'}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = CropReservationSerializer(reservation)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -140,8 +141,8 @@ class CropReservationViewSet(viewsets.ModelViewSet):
         if request.user != reservation.crop_growth.farmer:
             return Response({'error': 'Only the farmer can approve'}, status=status.HTTP_403_FORBIDDEN)
             
-        reservation.reservation_status = 'CONFIRMED'
-        reservation.save()
+        if not ReservationService.decide(reservation, 'CONFIRMED'):
+            return Response({'error': 'Reservation is no longer pending'}, status=status.HTTP_409_CONFLICT)
         return Response({'status': 'approved'})
         
     @action(detail=True, methods=['post'])
@@ -150,12 +151,7 @@ class CropReservationViewSet(viewsets.ModelViewSet):
         if request.user != reservation.crop_growth.farmer:
             return Response({'error': 'Only the farmer can reject'}, status=status.HTTP_403_FORBIDDEN)
             
-        reservation.reservation_status = 'CANCELLED'
-        reservation.save()
-        
-        # Restore quantity
-        crop = reservation.crop_growth
-        crop.available_quantity = float(crop.available_quantity) + float(reservation.quantity_reserved)
-        crop.save()
-        
+        # Stock is returned only by the request that cancels a still-pending reservation
+        if not ReservationService.decide(reservation, 'CANCELLED'):
+            return Response({'error': 'Reservation is no longer pending'}, status=status.HTTP_409_CONFLICT)
         return Response({'status': 'rejected'})
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'analytics',
     'notifications',
     'posts',
+    'outbox',
 
     # Third party & utils
     'django_celery_beat',
@@ -163,6 +164,19 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Redis connection used for data kept outside the database (carts, ...)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+# Cache
+# Shared by every web and worker process (online flags, dispatch plans, ...)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', REDIS_URL),
+        'KEY_PREFIX': 'farmket',
+    }
+}
+
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -184,7 +198,7 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.auth.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -213,6 +227,10 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Users resolved from access tokens are cached this long; saves and deletes
+# retire the cached copy straight away (see accounts.auth).
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', '300'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -242,3 +260,139 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+from celery.schedules import crontab
+CELERY_BEAT_SCHEDULE = {
+    'advance-crop-stages': {
+        'task': 'crops.tasks.advance_crop_stages',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'release-expired-reservations': {
+        'task': 'crops.tasks.release_expired_reservations',
+        'schedule': crontab(minute='*/15'),
+    },
+    'purge-expired-idempotency-keys': {
+        'task': 'orders.tasks.purge_expired_idempotency_keys',
+        'schedule': crontab(minute=30),
+    },
+    'persist-dirty-carts': {
+        'task': 'orders.tasks.persist_dirty_carts',
+        'schedule': 60.0,
+    },
+    'reconcile-carts': {
+        'task': 'orders.tasks.reconcile_carts',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'archive-orders': {
+        'task': 'orders.tasks.archive_orders',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'relay-outbox': {
+        'task': 'outbox.tasks.relay_outbox',
+        'schedule': 5.0,
+    },
+    'purge-outbox': {
+        'task': 'outbox.tasks.purge_outbox',
+        'schedule': crontab(minute=45),
+    },
+    'expire-presence': {
+        'task': 'chat.tasks.expire_presence',
+        'schedule': 30.0,
+    },
+    'flush-chat-notifications': {
+        'task': 'notifications.tasks.flush_chat_notifications',
+        'schedule': 5.0,
+    },
+}
+
+# Crops
+# Advance PLANTED -> GROWING -> NEAR_HARVEST automatically from the sowing and
+# expected harvest dates instead of waiting for the farmer to update the stage.
+CROP_STAGE_AUTO_PROGRESSION = os.getenv('CROP_STAGE_AUTO_PROGRESSION', 'False') == 'True'
+
+
+# Pending pre-booking reservations that the farmer has not approved or rejected
+# within this many hours are cancelled and their quantity is released (0 disables).
+CROP_RESERVATION_EXPIRY_HOURS = int(os.getenv('CROP_RESERVATION_EXPIRY_HOURS', '72'))
+
+# Orders
+# Responses to POSTs sent with an Idempotency-Key header are replayed for
+# retries of the same key during this window.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+# Seconds a claimed key stays locked while its request runs. A retry after this
+# takes over a claim left behind by a killed worker, so keep it a few times
+# longer than the longest request.
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '120'))
+# Seconds a duplicate request waits for the first one to finish before giving up with 409
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '5'))
+
+# Where buyer carts live between requests. 'orders.cart_store.RedisCartStore'
+# keeps them in Redis and writes them back to the database in the background.
+CART_STORE_BACKEND = os.getenv('CART_STORE_BACKEND', 'orders.cart_store.DatabaseCartStore')
+# Seconds an idle Redis cart is kept before it is reloaded from the database
+CART_REDIS_TTL = int(os.getenv('CART_REDIS_TTL', str(7 * 24 * 3600)))
+# Upper bound in seconds on how long the Redis cart shows product data changed
+# without going through the product signals (bulk updates, farmer renames)
+CART_PRODUCT_SNAPSHOT_TTL = int(os.getenv('CART_PRODUCT_SNAPSHOT_TTL', '300'))
+# Finished orders untouched for this many days move to the archive tables (0 disables).
+# Dashboard totals include the archive, but the six-month trend charts read only
+# live orders, so keep this above 180.
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '365'))
+# Buyers with coordinates are batched by grid cells this many degrees wide
+# (0.05 is roughly 5 km); the rest are batched by the locality of their address.
+DISPATCH_GRID_DEGREES = float(os.getenv('DISPATCH_GRID_DEGREES', '0.05'))
+# Seconds a farmer's dispatch plan is cached; any change to their items replaces it sooner
+DISPATCH_PLAN_CACHE_SECONDS = int(os.getenv('DISPATCH_PLAN_CACHE_SECONDS', '3600'))
+
+# Chat
+# Conversation participants are cached per process (LRU of this many conversations)
+# and in the shared cache, so socket events are authorised without a query.
+CHAT_MEMBERSHIP_CACHE_SIZE = int(os.getenv('CHAT_MEMBERSHIP_CACHE_SIZE', '10000'))
+# Seconds a process trusts its own copy; changes are also pushed to the sockets involved
+CHAT_MEMBERSHIP_LOCAL_TTL = int(os.getenv('CHAT_MEMBERSHIP_LOCAL_TTL', '60'))
+CHAT_MEMBERSHIP_CACHE_SECONDS = int(os.getenv('CHAT_MEMBERSHIP_CACHE_SECONDS', '86400'))
+# Media sent over the chat socket arrives in binary chunks of at most this many bytes.
+# Keep it below the ASGI server's WebSocket frame size limit.
+CHAT_UPLOAD_CHUNK_BYTES = int(os.getenv('CHAT_UPLOAD_CHUNK_BYTES', str(256 * 1024)))
+CHAT_UPLOAD_MAX_BYTES = int(os.getenv('CHAT_UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+# Transfers a single socket may have open or waiting to be attached to a message
+CHAT_UPLOAD_MAX_ACTIVE = int(os.getenv('CHAT_UPLOAD_MAX_ACTIVE', '3'))
+# Chat messages are folded into one unread notification per recipient and
+# conversation, written at most once per window.
+CHAT_NOTIFICATION_WINDOW_SECONDS = int(os.getenv('CHAT_NOTIFICATION_WINDOW_SECONDS', '60'))
+# Seconds a socket's open conversation counts without activity; recipients
+# with the conversation open get no notification for it.
+CHAT_VIEWING_TTL = int(os.getenv('CHAT_VIEWING_TTL', '120'))
+# Typing state lives only on the socket: a burst is broadcast at most once per
+# throttle interval and ends by itself after the TTL without typing events.
+CHAT_TYPING_THROTTLE_SECONDS = float(os.getenv('CHAT_TYPING_THROTTLE_SECONDS', '1'))
+CHAT_TYPING_TTL_SECONDS = float(os.getenv('CHAT_TYPING_TTL_SECONDS', '5'))
+# Also record typing changes in the TypingStatus table, for debugging only
+CHAT_TYPING_DEBUG_SINK = os.getenv('CHAT_TYPING_DEBUG_SINK', 'False') == 'True'
+# Most messages one delta sync call returns; clients call again while has_more is set
+CHAT_SYNC_LIMIT = int(os.getenv('CHAT_SYNC_LIMIT', '200'))
+# Read positions reported by a socket are coalesced and written once per interval
+CHAT_READ_FLUSH_SECONDS = float(os.getenv('CHAT_READ_FLUSH_SECONDS', '1'))
+# Sockets report liveness this often; users with no heartbeat for the timeout
+# are shown offline (and announced as such by the expire-presence task).
+PRESENCE_HEARTBEAT_SECONDS = int(os.getenv('PRESENCE_HEARTBEAT_SECONDS', '30'))
+PRESENCE_TIMEOUT_SECONDS = int(os.getenv('PRESENCE_TIMEOUT_SECONDS', '90'))
+
+# Outbox
+# Consumers the relay hands outbox events to, each with the topics it reads.
+# Deliveries are recorded per consumer when an event is published, so a consumer
+# added or renamed later only receives events published after the change.
+OUTBOX_CONSUMERS = {
+    'notifications': {
+        'handler': 'notifications.handlers.create_notifications',
+        'topics': ['crop.stage_changed', 'reservation.created', 'reservation.status_changed', 'reservation.expired', 'chat.message_created'],
+    },
+    'realtime': {
+        'handler': 'notifications.handlers.push_realtime',
+        'topics': ['order.created', 'order.item_status_changed', 'reservation.created', 'reservation.status_changed', 'reservation.expired'],
+    },
+}
+# Failed deliveries are retried on later relay runs, then marked dead after this many attempts
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+# Processed events are kept this long for inspection before being purged
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '72'))
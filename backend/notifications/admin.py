@@ -3,7 +3,7 @@ from .models import Notification
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'notification_type', 'title', 'is_read', 'created_at']
+    list_display = ['user', 'notification_type', 'title', 'event_count', 'is_read', 'created_at']
     list_filter = ['notification_type', 'is_read', 'created_at']
     search_fields = ['user__username', 'title', 'message']
     autocomplete_fields = ['user']
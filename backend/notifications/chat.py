@@ -0,0 +1,151 @@
+"""Coalesced chat notifications.
+
+Chat messages are not turned into notifications one by one. Recipients'
+pending counts are collected in Redis per conversation, and each
+conversation is flushed once per ``CHAT_NOTIFICATION_WINDOW_SECONDS``
+into a single unread "N new messages from X" notification per recipient,
+which later flushes update in place until it is read.
+"""
+import logging
+import time
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from farmket.redis_client import get_redis
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+DUE_KEY = 'chatnotif:due'
+
+
+def _counts_key(conversation_id):
+    return f'chatnotif:counts:{conversation_id}'
+
+
+def _latest_key(conversation_id):
+    return f'chatnotif:latest:{conversation_id}'
+
+
+def buffer_messages(events):
+    """Add ``chat.message_created`` outbox events to the pending counts with one pipeline."""
+    from chat.viewers import viewing
+
+    due_at = time.time() + settings.CHAT_NOTIFICATION_WINDOW_SECONDS
+    pipe = get_redis().pipeline()
+    for event in events:
+        payload = event.payload
+        conversation_id = payload['conversation_id']
+        # People looking at the conversation have already seen the message
+        recipients = set(payload['recipient_ids']) - viewing(conversation_id, payload['recipient_ids'])
+        if not recipients:
+            continue
+        for user_id in recipients:
+            pipe.hincrby(_counts_key(conversation_id), user_id, 1)
+        pipe.hset(_latest_key(conversation_id), mapping={
+            'sender_username': payload['sender_username'],
+            'preview': payload['preview'],
+        })
+        # The window starts with the first message and is not pushed back by later ones
+        pipe.zadd(DUE_KEY, {conversation_id: due_at}, nx=True)
+    pipe.execute()
+
+
+def flush_due(limit=500):
+    """Write the notifications of conversations whose window has closed; returns conversations flushed."""
+    redis = get_redis()
+    flushed = 0
+    for conversation_id in redis.zrangebyscore(DUE_KEY, '-inf', time.time(), start=0, num=limit):
+        # Whoever removes the entry owns the flush
+        if not redis.zrem(DUE_KEY, conversation_id):
+            continue
+        pipe = redis.pipeline(transaction=True)
+        pipe.hgetall(_counts_key(conversation_id))
+        pipe.hgetall(_latest_key(conversation_id))
+        pipe.delete(_counts_key(conversation_id), _latest_key(conversation_id))
+        counts, latest, _ = pipe.execute()
+        if not counts:
+            continue
+        try:
+            write(int(conversation_id), {int(user_id): int(count) for user_id, count in counts.items()}, latest)
+        except Exception:
+            logger.exception("Chat notifications for conversation %s failed; keeping them for the next flush", conversation_id)
+            _restore(redis, conversation_id, counts, latest)
+            continue
+        flushed += 1
+    return flushed
+
+
+def _restore(redis, conversation_id, counts, latest):
+    """Put counts taken by a failed flush back, merged with anything buffered since."""
+    pipe = redis.pipeline(transaction=True)
+    for user_id, count in counts.items():
+        pipe.hincrby(_counts_key(conversation_id), user_id, int(count))
+    # A message buffered since the flush started is newer; keep its preview
+    for field, value in latest.items():
+        pipe.hsetnx(_latest_key(conversation_id), field, value)
+    pipe.zadd(DUE_KEY, {conversation_id: time.time() + settings.CHAT_NOTIFICATION_WINDOW_SECONDS}, nx=True)
+    pipe.execute()
+
+
+@transaction.atomic
+def write(conversation_id, counts, latest):
+    """Fold ``counts`` ({recipient id: new messages}) into each recipient's unread notification."""
+    from chat.models import Conversation
+
+    content_type = ContentType.objects.get_for_model(Conversation)
+    unread = Notification.objects.filter(
+        notification_type='chat_message', is_read=False,
+        content_type=content_type, object_id=conversation_id, user_id__in=counts,
+    )
+
+    while True:
+        existing = set(unread.values_list('user_id', flat=True))
+        if existing:
+            _add_to_unread(unread.filter(user_id__in=existing), counts, latest)
+        new = counts.keys() - existing
+        try:
+            with transaction.atomic():
+                Notification.objects.bulk_create([
+                    Notification(
+                        user_id=user_id,
+                        notification_type='chat_message',
+                        title=(
+                            f"New message from {latest['sender_username']}" if counts[user_id] == 1
+                            else f"{counts[user_id]} new messages from {latest['sender_username']}"
+                        ),
+                        message=latest['preview'],
+                        event_count=counts[user_id],
+                        content_type=content_type,
+                        object_id=conversation_id,
+                    )
+                    for user_id in new
+                ])
+            return
+        except IntegrityError:
+            # A concurrent flush created some of these rows first; add to them on the next pass
+            counts = {user_id: counts[user_id] for user_id in new}
+            unread = unread.filter(user_id__in=counts)
+
+
+def _add_to_unread(notifications, counts, latest):
+    by_count = {}
+    for user_id, count in counts.items():
+        by_count.setdefault(count, []).append(user_id)
+    added = Case(
+        *[When(user_id__in=user_ids, then=Value(count)) for count, user_ids in by_count.items()],
+        output_field=IntegerField(),
+    )
+    notifications.update(
+        event_count=F('event_count') + added,
+        title=Concat(
+            Cast(F('event_count') + added, CharField()), Value(' new messages from '), Value(latest['sender_username']),
+            output_field=CharField(),
+        ),
+        message=latest['preview'],
+        # Coalesced notifications move back to the top of the list
+        created_at=timezone.now(),
+    )
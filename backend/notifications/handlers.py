@@ -0,0 +1,78 @@
+"""Outbox consumers that turn domain events into user-facing notifications."""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .chat import buffer_messages
+from .models import Notification
+
+
+def create_notifications(events):
+    """Store in-app notifications for crop, reservation and chat message events."""
+    from crops.models import CropFollower
+
+    stage_events = [event for event in events if event.topic == 'crop.stage_changed']
+    followers = {}
+    if stage_events:
+        rows = CropFollower.objects.filter(
+            crop_growth_id__in={event.aggregate_id for event in stage_events}
+        ).values_list('crop_growth_id', 'buyer_id')
+        for crop_id, buyer_id in rows:
+            followers.setdefault(crop_id, []).append(buyer_id)
+
+    notifications = []
+    for event in events:
+        payload = event.payload
+        if event.topic == 'crop.stage_changed':
+            for buyer_id in followers.get(event.aggregate_id, []):
+                notifications.append(Notification(
+                    user_id=buyer_id,
+                    notification_type='buyer_alert',
+                    title=f"Crop Stage Updated: {payload['product_name']}",
+                    message=f"The stage changed from {payload['previous_stage']} to {payload['stage']}."
+                ))
+                if payload['stage'] in ['NEAR_HARVEST', 'HARVESTED']:
+                    notifications.append(Notification(
+                        user_id=buyer_id,
+                        notification_type='buyer_alert',
+                        title=f"Harvest Alert: {payload['product_name']}",
+                        message=f"The crop is now {payload['stage_display']}!"
+                    ))
+        elif event.topic == 'reservation.created':
+            notifications.append(Notification(
+                user_id=payload['farmer_id'],
+                notification_type='system',
+                title='New Pre-Booking Request',
+                message=f"{payload['buyer_username']} wants to reserve {payload['quantity']} of {payload['product_name']}."
+            ))
+        elif event.topic == 'reservation.status_changed':
+            notifications.append(Notification(
+                user_id=payload['buyer_id'],
+                notification_type='system',
+                title='Reservation Status Updated',
+                message=f"Your reservation for {payload['product_name']} is now {payload['status_display']}."
+            ))
+        elif event.topic == 'reservation.expired':
+            notifications.append(Notification(
+                user_id=payload['buyer_id'],
+                notification_type='system',
+                title='Reservation Expired',
+                message=f"Your reservation for {payload['product_name']} expired before the farmer confirmed it and has been cancelled."
+            ))
+    Notification.objects.bulk_create(notifications, batch_size=500)
+
+    # Chat messages are coalesced per conversation before they become notifications
+    chat_events = [event for event in events if event.topic == 'chat.message_created']
+    if chat_events:
+        buffer_messages(chat_events)
+
+
+def push_realtime(events):
+    """Forward order and reservation events to the personal WebSocket group of every party."""
+    channel_layer = get_channel_layer()
+    for event in events:
+        payload = event.payload
+        if event.topic.startswith('order.'):
+            message = {'type': 'order_update', 'event': event.topic, 'order_id': payload['order_id'], 'data': payload}
+        else:
+            message = {'type': 'reservation_update', 'event': event.topic, 'reservation_id': event.aggregate_id, 'data': payload}
+        for user_id in payload.get('user_ids', []):
+            async_to_sync(channel_layer.group_send)(f'user_{user_id}', message)
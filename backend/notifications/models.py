@@ -15,6 +15,8 @@ class Notification(models.Model):
     title = models.CharField(max_length=200)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
+    # Number of events folded into this notification (chat messages are coalesced)
+    event_count = models.PositiveIntegerField(default=1)
     
     # Generic relation to link to a Product or CropTracking
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
@@ -25,6 +27,14 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # At most one unread chat notification per recipient and conversation
+            models.UniqueConstraint(
+                fields=['user', 'content_type', 'object_id'],
+                condition=models.Q(notification_type='chat_message', is_read=False),
+                name='unique_unread_chat_notification',
+            ),
+        ]
         
     def __str__(self):
         return f"Notification for {self.user.username} - {self.title}"
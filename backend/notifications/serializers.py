@@ -5,4 +5,4 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
-        read_only_fields = ['user', 'notification_type', 'title', 'message', 'content_type', 'object_id', 'created_at']
+        read_only_fields = ['user', 'notification_type', 'title', 'message', 'content_type', 'object_id', 'event_count', 'created_at']
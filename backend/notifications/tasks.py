@@ -1,8 +1,15 @@
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
+from .chat import flush_due
 from .models import Notification
 
+
+@shared_task
+def flush_chat_notifications():
+    flushed = flush_due()
+    return f"Flushed chat notifications for {flushed} conversations."
+
 # TODO: Rewrite these tasks with the new crops.models.CropGrowth model
 # @shared_task
 # def check_harvest_reminders():
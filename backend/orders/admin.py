@@ -2,7 +2,10 @@
 
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Order, OrderItem, Cart, CartItem
+from .models import (
+    Order, OrderItem, FarmerOrder, Cart, CartItem, IdempotencyKey,
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory, record_item_transitions,
+)
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -16,6 +19,10 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ['product', 'farmer', 'quantity', 'price', 'get_subtotal']
     fields = ['product', 'farmer', 'quantity', 'price', 'get_subtotal', 'status']
     can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        # Items come from checkout, which also sets up the counters and sub-orders
+        return False
     
     # Safe getter for the admin display
     def get_subtotal(self, obj):
@@ -29,8 +36,38 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['order_number', 'buyer__username', 'buyer__email', 'delivery_address']
     inlines = [OrderItemInline]
     date_hierarchy = 'created_at'
-    readonly_fields = ['order_number', 'created_at', 'updated_at']
+    readonly_fields = [
+        'order_number', 'created_at', 'updated_at',
+        'pending_count', 'processing_count', 'shipped_count', 'delivered_count', 'cancelled_count',
+    ]
     autocomplete_fields = ['buyer']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Order.refresh_search_vectors(id=obj.id)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the GIN-indexed search document instead of ILIKE over joins
+        if not search_term.strip():
+            return queryset, False
+        return Order.search(queryset, search_term), False
+
+    def save_formset(self, request, form, formset, change):
+        # Item statuses edited inline still have to move the order counters
+        edited = {
+            item_form.instance.id: item_form.instance
+            for item_form in formset.forms
+            if item_form.instance.pk and 'status' in item_form.changed_data
+        }
+        # The locked rows, not the form, say which status each item is leaving
+        previous = dict(
+            OrderItem.objects.select_for_update().filter(id__in=edited).order_by('id').values_list('id', 'status')
+        ) if edited else {}
+        super().save_formset(request, form, formset, change)
+        record_item_transitions([
+            (item.id, item.order_id, item.farmer_id, previous[item.id], item.status)
+            for item in edited.values() if previous.get(item.id, item.status) != item.status
+        ])
     
     def colored_status(self, obj):
         colors = {
@@ -55,7 +92,24 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ['status', 'farmer', 'order__created_at'] 
     
     search_fields = ['order__order_number', 'product__name', 'farmer__username']
-    autocomplete_fields = ['order', 'product', 'farmer']
+    # Only the status is editable: it moves the counters through record_item_transitions,
+    # while the other fields feed the sub-order split and subtotals fixed at checkout
+    readonly_fields = ['order', 'product', 'farmer', 'quantity', 'price']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        previous = None
+        if change and 'status' in form.changed_data:
+            # The locked row, not the form, says which status the item is leaving
+            previous = OrderItem.objects.select_for_update().values_list('status', flat=True).get(id=obj.id)
+        super().save_model(request, obj, form, change)
+        if previous is not None and previous != obj.status:
+            record_item_transitions([(obj.id, obj.order_id, obj.farmer_id, previous, obj.status)])
     
     def order_link(self, obj):
         return obj.order.order_number
@@ -76,6 +130,14 @@ class OrderItemAdmin(admin.ModelAdmin):
         )
     item_status.short_description = 'Item Status'
 
+@admin.register(FarmerOrder)
+class FarmerOrderAdmin(admin.ModelAdmin):
+    list_display = ['order', 'farmer', 'status', 'subtotal', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order__order_number', 'farmer__username']
+    autocomplete_fields = ['order', 'farmer']
+    readonly_fields = ['created_at', 'pending_count', 'processing_count', 'shipped_count', 'delivered_count', 'cancelled_count']
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['id', 'buyer', 'item_count', 'total_price', 'created_at']
@@ -92,4 +154,61 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'is_prebooking', 'added_at']
     list_filter = ['is_prebooking', 'added_at']
     search_fields = ['cart__buyer__username', 'product__name']
-    autocomplete_fields = ['cart', 'product', 'crop_growth']
\ No newline at end of file
+    autocomplete_fields = ['cart', 'product', 'crop_growth']
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'response_status', 'created_at', 'expires_at']
+    list_filter = ['response_status', 'created_at']
+    search_fields = ['key', 'user__username']
+    autocomplete_fields = ['user']
+    readonly_fields = ['request_fingerprint', 'response_status', 'response_body', 'created_at']
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    fields = ['product_name', 'farmer', 'quantity', 'price', 'status']
+    readonly_fields = fields
+    can_delete = False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_number', 'buyer', 'status', 'total_amount', 'created_at', 'archived_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order_number', 'buyer__username', 'buyer__email']
+    inlines = [ArchivedOrderItemInline]
+    date_hierarchy = 'created_at'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return Order.search(queryset, search_term), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrderItem)
+class ArchivedOrderItemAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'product_name', 'farmer', 'status', 'quantity', 'price']
+    list_filter = ['status']
+    search_fields = ['order__order_number', 'product_name', 'farmer__username']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrderStatusHistory)
+class ArchivedOrderStatusHistoryAdmin(admin.ModelAdmin):
+    list_display = ['order_item', 'previous_status', 'new_status', 'updated_by', 'timestamp']
+    list_filter = ['new_status']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
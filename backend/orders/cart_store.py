@@ -0,0 +1,397 @@
+import json
+import zlib
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum, Value, DecimalField, ExpressionWrapper, OuterRef, Subquery, Prefetch
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Cart, CartItem
+from .serializers import CartSerializer, CartItemSerializer, CartProductSerializer
+from products.models import Product, ProductImage
+from redis.exceptions import WatchError
+
+
+class DatabaseCartStore:
+    """Keeps carts in the Cart/CartItem tables. Line ids are CartItem ids."""
+
+    def _cart(self, user):
+        cart, _ = Cart.objects.get_or_create(buyer=user)
+        return cart
+
+    def _touch(self, cart_id):
+        Cart.objects.filter(id=cart_id).update(version=F('version') + 1)
+
+    def _line(self, item):
+        return {
+            'id': item.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'is_prebooking': item.is_prebooking,
+            'crop_growth_id': item.crop_growth_id,
+        }
+
+    @staticmethod
+    def products_queryset():
+        """Products with what CartProductSerializer reads, in a fixed number of queries."""
+        from crops.models import CropGrowth
+        thumbnail = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'id').values('image')[:1]
+        return Product.objects.select_related('farmer').annotate(thumbnail=Subquery(thumbnail)).prefetch_related(
+            Prefetch(
+                'crop_growths',
+                queryset=CropGrowth.objects.exclude(stage='HARVESTED', available_quantity__lte=0).order_by('-expected_harvest_date'),
+                to_attr='prefetched_active_growth',
+            )
+        )
+
+    @classmethod
+    def items_queryset(cls):
+        """Cart lines with their totals computed by the database and a compact product."""
+        return CartItem.objects.annotate(
+            line_total=ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+        ).prefetch_related(Prefetch('product', queryset=cls.products_queryset())).order_by('added_at', 'id')
+
+    def get_version(self, user):
+        """Opaque token that changes whenever the cart representation may have changed."""
+        cart = Cart.objects.filter(buyer=user).aggregate(id=Max('id'), version=Max('version'), touched=Max('items__product__updated_at'))
+        touched = int(cart['touched'].timestamp()) if cart['touched'] else 0
+        return f"{cart['id'] or 0}-{cart['version'] or 0}-{touched}"
+
+    def get_cart(self, user, context=None):
+        total = Coalesce(
+            Sum(F('items__quantity') * F('items__product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0')),
+        )
+        carts = Cart.objects.filter(buyer=user).annotate(items_total=total).prefetch_related(
+            Prefetch('items', queryset=self.items_queryset())
+        )
+        cart = carts.first()
+        if cart is None:
+            self._cart(user)
+            cart = carts.first()
+        return CartSerializer(cart, context=context).data
+
+    def _represent(self, item_id, context=None):
+        return CartItemSerializer(self.items_queryset().get(id=item_id), context=context).data
+
+    def get_line(self, user, line_id):
+        item = CartItem.objects.filter(cart__buyer=user, id=line_id).first()
+        return self._line(item) if item else None
+
+    def find_line(self, user, product_id):
+        item = CartItem.objects.filter(cart__buyer=user, product_id=product_id).first()
+        return self._line(item) if item else None
+
+    def add_line(self, user, product, quantity, growth=None, context=None):
+        """Add ``quantity`` of ``product`` (pre-booked from ``growth`` if given). Returns ``(line, created)``."""
+        defaults = {'quantity': quantity, 'is_prebooking': growth is not None}
+        if growth is not None:
+            defaults['crop_growth'] = growth
+        cart_item, created = CartItem.objects.get_or_create(cart=self._cart(user), product=product, defaults=defaults)
+        if not created:
+            cart_item.quantity += quantity
+            cart_item.is_prebooking = growth is not None
+            if growth is not None:
+                cart_item.crop_growth = growth
+            cart_item.save()
+        self._touch(cart_item.cart_id)
+        return self._represent(cart_item.id, context), created
+
+    def set_quantity(self, user, line_id, quantity, context=None):
+        item = CartItem.objects.get(cart__buyer=user, id=line_id)
+        item.quantity = quantity
+        item.save(update_fields=['quantity'])
+        self._touch(item.cart_id)
+        return self._represent(item.id, context)
+
+    def remove_line(self, user, line_id):
+        deleted, _ = CartItem.objects.filter(cart__buyer=user, id=line_id).delete()
+        if deleted:
+            Cart.objects.filter(buyer=user).update(version=F('version') + 1)
+        return bool(deleted)
+
+    def persist(self, user):
+        """Make sure the Cart/CartItem tables reflect the store before checkout."""
+
+    def clear(self, user):
+        """Forget the cart after checkout has emptied it."""
+
+    def forget_products(self, product_ids):
+        """Drop anything cached about these products after they changed."""
+
+
+class RedisCartStore:
+    """
+    Keeps cart lines in a Redis hash per buyer and writes them back to the
+    Cart/CartItem tables asynchronously (see ``orders.tasks``) or at checkout.
+
+    The hash maps product ids to JSON lines plus a few ``_``-prefixed meta
+    fields, so line ids exposed by the API are product ids. A missing hash is
+    hydrated from the database, which also covers a Redis failover.
+
+    What the cart page shows about each product is kept once per product under
+    ``cartproduct:<id>``, shared by every cart and dropped whenever the
+    product changes (see ``orders.signals``).
+    """
+    DIRTY_KEY = 'cart:dirty'
+    SNAPSHOT_KEY = 'cartproduct:{}'
+
+    def __init__(self):
+        from farmket.redis_client import get_redis
+        self.redis = get_redis()
+        self.ttl = settings.CART_REDIS_TTL
+        self.snapshot_ttl = settings.CART_PRODUCT_SNAPSHOT_TTL
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    def _snapshots(self, product_ids):
+        """Cart-page data for each product by id, rebuilt from the database for the ones not cached."""
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return {}
+        cached = self.redis.mget([self.SNAPSHOT_KEY.format(product_id) for product_id in product_ids])
+        snapshots = {product_id: json.loads(value) for product_id, value in zip(product_ids, cached) if value is not None}
+        missing = [product_id for product_id in product_ids if product_id not in snapshots]
+        if missing:
+            pipe = self.redis.pipeline()
+            for product in DatabaseCartStore.products_queryset().filter(id__in=missing):
+                snapshots[product.id] = dict(CartProductSerializer(product).data)
+                pipe.set(self.SNAPSHOT_KEY.format(product.id), json.dumps(snapshots[product.id]), ex=self.snapshot_ttl)
+            pipe.execute()
+        return snapshots
+
+    def forget_products(self, product_ids):
+        keys = [self.SNAPSHOT_KEY.format(product_id) for product_id in product_ids]
+        if keys:
+            transaction.on_commit(lambda: self.redis.delete(*keys))
+
+    def _load(self, user):
+        """Return ``(meta, lines)`` for the buyer, hydrating the hash from the database on a miss."""
+        key = self._key(user.id)
+        data = self.redis.hgetall(key)
+        if not data:
+            cart, _ = Cart.objects.get_or_create(buyer=user)
+            data = {'_cart': str(cart.id), '_created_at': cart.created_at.isoformat(), '_version': str(cart.version)}
+            for item in CartItem.objects.filter(cart=cart):
+                data[str(item.product_id)] = json.dumps({
+                    'product': item.product_id,
+                    'quantity': item.quantity,
+                    'is_prebooking': item.is_prebooking,
+                    'crop_growth': item.crop_growth_id,
+                    'added_at': item.added_at.isoformat(),
+                })
+            pipe = self.redis.pipeline()
+            pipe.hset(key, mapping=data)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        meta = {k: v for k, v in data.items() if k.startswith('_')}
+        lines = {int(k): json.loads(v) for k, v in data.items() if not k.startswith('_')}
+        return meta, lines
+
+    def _queue_save(self, pipe, key, user_id, line):
+        pipe.hset(key, str(line['product']), json.dumps(line))
+        pipe.hincrby(key, '_version', 1)
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.DIRTY_KEY, user_id)
+
+    def _update_line(self, user, product_id, change):
+        """Apply ``change(line or None) -> line`` to one line under WATCH, retrying when the cart moved meanwhile."""
+        key = self._key(user.id)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.hmget(key, '_cart', '_created_at', '_version', str(product_id))
+                    if data[0] is None:
+                        # Expired since it was read; hydrate again before changing it
+                        pipe.unwatch()
+                        self._load(user)
+                        continue
+                    meta = {'_cart': data[0], '_created_at': data[1], '_version': data[2]}
+                    line = change(json.loads(data[3]) if data[3] else None)
+                    pipe.multi()
+                    self._queue_save(pipe, key, user.id, line)
+                    pipe.execute()
+                    return meta, line
+                except WatchError:
+                    continue
+
+    def _represent(self, meta, line, snapshot, context=None):
+        request = (context or {}).get('request')
+        product_details = dict(snapshot)
+        if request and product_details['thumbnail']:
+            product_details['thumbnail'] = request.build_absolute_uri(product_details['thumbnail'])
+        return {
+            'id': line['product'],
+            'cart': int(meta['_cart']),
+            'product': line['product'],
+            'product_details': product_details,
+            'quantity': line['quantity'],
+            'added_at': line['added_at'],
+            'subtotal': str(Decimal(product_details['price']) * line['quantity']),
+            'is_prebooking': line['is_prebooking'],
+            'crop_growth': line['crop_growth'],
+        }
+
+    def _line(self, line):
+        return {
+            'id': line['product'],
+            'product_id': line['product'],
+            'quantity': line['quantity'],
+            'is_prebooking': line['is_prebooking'],
+            'crop_growth_id': line['crop_growth'],
+        }
+
+    def get_version(self, user):
+        meta, lines = self._load(user)
+        # Price and stock changes reach the cart through the snapshots, so they are part of the tag
+        snapshots = self._snapshots(lines)
+        digest = zlib.crc32(json.dumps([snapshots[product_id] for product_id in sorted(snapshots)]).encode())
+        return f"{meta['_cart']}-r{meta['_version']}-{digest:08x}"
+
+    def get_cart(self, user, context=None):
+        meta, lines = self._load(user)
+        snapshots = self._snapshots(lines)
+        # Lines for deleted products are skipped here and pruned by the next write-back
+        items = [
+            self._represent(meta, line, snapshots[line['product']], context)
+            for line in sorted(lines.values(), key=lambda l: l['added_at'])
+            if line['product'] in snapshots
+        ]
+        return {
+            'id': int(meta['_cart']),
+            'buyer': user.id,
+            'created_at': meta['_created_at'],
+            'version': int(meta['_version']),
+            'items': items,
+            'total_price': str(sum((Decimal(item['subtotal']) for item in items), Decimal('0'))),
+        }
+
+    def get_line(self, user, line_id):
+        _, lines = self._load(user)
+        line = lines.get(int(line_id))
+        return self._line(line) if line else None
+
+    def find_line(self, user, product_id):
+        return self.get_line(user, product_id)
+
+    def add_line(self, user, product, quantity, growth=None, context=None):
+        self._load(user)
+        created = False
+
+        def change(line):
+            nonlocal created
+            created = line is None
+            if created:
+                line = {'product': product.id, 'quantity': 0, 'crop_growth': None, 'added_at': timezone.now().isoformat()}
+            line['quantity'] += quantity
+            line['is_prebooking'] = growth is not None
+            if growth is not None:
+                line['crop_growth'] = growth.id
+            # Carts written before snapshots were shared carried their own copy
+            line.pop('product_details', None)
+            return line
+
+        meta, line = self._update_line(user, product.id, change)
+        return self._represent(meta, line, self._snapshots([product.id])[product.id], context), created
+
+    def set_quantity(self, user, line_id, quantity, context=None):
+        self._load(user)
+
+        def change(line):
+            if line is None:
+                raise KeyError(line_id)
+            line['quantity'] = quantity
+            line.pop('product_details', None)
+            return line
+
+        meta, line = self._update_line(user, int(line_id), change)
+        return self._represent(meta, line, self._snapshots([line['product']])[line['product']], context)
+
+    def remove_line(self, user, line_id):
+        self._load(user)
+        key = self._key(user.id)
+        pipe = self.redis.pipeline()
+        pipe.hdel(key, str(line_id))
+        pipe.hincrby(key, '_version', 1)
+        pipe.sadd(self.DIRTY_KEY, user.id)
+        removed, _, _ = pipe.execute()
+        return bool(removed)
+
+    def persist(self, user):
+        self.persist_user(user.id)
+
+    def persist_user(self, user_id):
+        """Write the buyer's Redis cart to the Cart/CartItem tables."""
+        key = self._key(user_id)
+        data = self.redis.hgetall(key)
+        if not data:
+            self.redis.srem(self.DIRTY_KEY, user_id)
+            return
+        lines = [json.loads(v) for k, v in data.items() if not k.startswith('_')]
+
+        # Lines whose product or crop was deleted since they were added would fail the foreign keys
+        existing_products = set(Product.objects.filter(id__in=[line['product'] for line in lines]).values_list('id', flat=True))
+        from crops.models import CropGrowth
+        existing_growths = set(
+            CropGrowth.objects.filter(id__in=[line['crop_growth'] for line in lines if line['crop_growth']]).values_list('id', flat=True)
+        )
+        stale = [
+            line['product'] for line in lines
+            if line['product'] not in existing_products or (line['crop_growth'] and line['crop_growth'] not in existing_growths)
+        ]
+        version = data.get('_version')
+        if stale:
+            pipe = self.redis.pipeline()
+            pipe.hdel(key, *[str(product_id) for product_id in stale])
+            pipe.hincrby(key, '_version', 1)
+            version = str(pipe.execute()[1])
+            lines = [line for line in lines if line['product'] not in stale]
+
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(buyer_id=user_id)
+            # Keep the database version in step so a rehydrated cart never reuses an ETag
+            Cart.objects.filter(id=cart.id).update(version=int(version or cart.version))
+            CartItem.objects.filter(cart=cart).exclude(product_id__in=[line['product'] for line in lines]).delete()
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(
+                        cart=cart,
+                        product_id=line['product'],
+                        quantity=line['quantity'],
+                        is_prebooking=line['is_prebooking'],
+                        crop_growth_id=line['crop_growth'],
+                    )
+                    for line in lines
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'is_prebooking', 'crop_growth'],
+            )
+            transaction.on_commit(lambda: self._mark_clean(user_id, version))
+
+    def _mark_clean(self, user_id, version):
+        """Drop the dirty flag unless the cart changed after ``version`` was written back."""
+        key = self._key(user_id)
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.hget(key, '_version') != version:
+                    return
+                pipe.multi()
+                pipe.srem(self.DIRTY_KEY, user_id)
+                pipe.execute()
+            except WatchError:
+                # Changed while checking; it stays dirty for the next run
+                pass
+
+    def clear(self, user):
+        transaction.on_commit(lambda: self.redis.delete(self._key(user.id)))
+
+
+@lru_cache(maxsize=None)
+def get_cart_store():
+    return import_string(settings.CART_STORE_BACKEND)()
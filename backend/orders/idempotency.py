@@ -0,0 +1,104 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}:{request.path}:{body}".encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """Return ``(record, created)`` for the key, waiting briefly for a concurrent duplicate."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    request_fingerprint=fingerprint,
+                    # A lease until the response is stored, so a claim left by a killed worker frees up
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS),
+                )
+            return record, True
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            # The first request failed and released the key; claim it again
+            continue
+        if record.expires_at <= now:
+            # An expired response, or a claim whose worker died; take the key over
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            continue
+        if record.is_complete or record.request_fingerprint != fingerprint or time.monotonic() >= deadline:
+            return record, False
+        time.sleep(0.1)
+
+
+def _replay(record, fingerprint):
+    if record.request_fingerprint != fingerprint:
+        return Response(
+            {'error': f'This {IDEMPOTENCY_HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if not record.is_complete:
+        return Response(
+            {'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed.'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """
+    Make a viewset method safe to retry with an ``Idempotency-Key`` header.
+
+    The first response for a (user, key) pair is stored and replayed for every
+    retry without running the view again. Requests without the header are
+    handled as usual. Apply it outside ``transaction.atomic`` so the key is
+    claimed before the business transaction starts.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = _fingerprint(request)
+        record, created = _claim(request.user, key, fingerprint)
+        if not created:
+            return _replay(record, fingerprint)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            # Errors are raised before a response exists; let the client retry
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                response_status=response.status_code,
+                response_body=response.data,
+                expires_at=timezone.now() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+            )
+        return response
+    return wrapper
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+def rollup(statuses):
+    if all(s == 'delivered' for s in statuses):
+        return 'delivered'
+    if all(s == 'cancelled' for s in statuses):
+        return 'cancelled'
+    if any(s == 'shipped' for s in statuses):
+        return 'shipped'
+    if any(s == 'processing' for s in statuses):
+        return 'processing'
+    return 'pending'
+
+def populate_farmer_orders(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    FarmerOrder = apps.get_model('orders', 'FarmerOrder')
+
+    shares = {}
+    items = OrderItem.objects.values_list('order_id', 'order__created_at', 'farmer_id', 'status', 'quantity', 'price')
+    for order_id, created_at, farmer_id, status, quantity, price in items.iterator():
+        share = shares.setdefault((order_id, farmer_id), {'created_at': created_at, 'statuses': [], 'subtotal': 0})
+        share['statuses'].append(status)
+        share['subtotal'] += quantity * price
+
+    FarmerOrder.objects.bulk_create([
+        FarmerOrder(
+            order_id=order_id,
+            farmer_id=farmer_id,
+            subtotal=share['subtotal'],
+            status=rollup(share['statuses']),
+            created_at=share['created_at'],
+        )
+        for (order_id, farmer_id), share in shares.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farmer_sub_orders', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farmer_orders', to='orders.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['farmer', '-created_at'], name='orders_farm_farmer__faa853_idx')],
+                'unique_together': {('farmer', 'order')},
+            },
+        ),
+        migrations.RunPython(populate_farmer_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:24
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+
+
+def populate_status_counts(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Order = apps.get_model('orders', 'Order')
+    FarmerOrder = apps.get_model('orders', 'FarmerOrder')
+    fields = [f'{status}_count' for status in STATUSES]
+    counts = {f'{status}_count': Count('id', filter=Q(status=status)) for status in STATUSES}
+
+    for row in OrderItem.objects.values('order_id').annotate(**counts).order_by().iterator():
+        Order.objects.filter(id=row['order_id']).update(**{field: row[field] for field in fields})
+    for row in OrderItem.objects.values('order_id', 'farmer_id').annotate(**counts).order_by().iterator():
+        FarmerOrder.objects.filter(order_id=row['order_id'], farmer_id=row['farmer_id']).update(
+            **{field: row[field] for field in fields}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_cart_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmerorder',
+            name='cancelled_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='farmerorder',
+            name='delivered_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='farmerorder',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='farmerorder',
+            name='processing_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='farmerorder',
+            name='shipped_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='cancelled_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivered_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='processing_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='shipped_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_status_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:33
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Concat
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    User = apps.get_model('accounts', 'User')
+
+    buyer = User.objects.filter(pk=OuterRef('buyer_id')).annotate(
+        text=Concat('username', Value(' '), 'email', Value(' '), 'first_name', Value(' '), 'last_name',
+                    output_field=TextField())
+    ).values('text')[:1]
+    products = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id').annotate(
+        names=StringAgg('product__name', delimiter=' ')
+    ).values('names')
+    vector = (
+        SearchVector('order_number', weight='A', config='simple')
+        + SearchVector(Subquery(buyer), weight='B', config='simple')
+        + SearchVector('delivery_address', Subquery(products), weight='C', config='simple')
+    )
+
+    ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), 5000):
+        Order.objects.filter(id__in=ids[start:start + 5000]).update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='orders_arch_search__d0e0a4_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='orders_orde_search__5b7dab_gin'),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,139 @@
+import re
+from functools import reduce
+from operator import add
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import F, Q, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Concat
+from django.db.models.lookups import Exact, GreaterThan
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 from accounts.models import User
 from products.models import Product
 from django.core.validators import MinValueValidator
 import uuid
 
+def rollup_status(statuses):
+    """Summary status of an order (or a farmer's share of it) from its item statuses."""
+    if all(s == 'delivered' for s in statuses):
+        return 'delivered'
+    elif all(s == 'cancelled' for s in statuses):
+        return 'cancelled'
+    elif any(s == 'shipped' for s in statuses):
+        return 'shipped'
+    elif any(s == 'processing' for s in statuses):
+        return 'processing'
+    return 'pending'
+
+ITEM_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+
+class ItemStatusCounts(models.Model):
+    """Item counts per status, kept current so the summary status never needs the items."""
+    pending_count = models.PositiveIntegerField(default=0)
+    processing_count = models.PositiveIntegerField(default=0)
+    shipped_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    cancelled_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def rollup_expression(counts):
+        """SQL equivalent of ``rollup_status`` over ``counts`` (status -> count expression)."""
+        total = reduce(add, counts.values())
+        return Case(
+            When(Exact(total, 0), then=F('status')),
+            When(Exact(counts['delivered'], total), then=Value('delivered')),
+            When(Exact(counts['cancelled'], total), then=Value('cancelled')),
+            When(GreaterThan(counts['shipped'], 0), then=Value('shipped')),
+            When(GreaterThan(counts['processing'], 0), then=Value('processing')),
+            default=Value('pending'),
+            output_field=models.CharField(),
+        )
+
+    @classmethod
+    def shift_status_counts(cls, changes, **extra):
+        """Apply ``(filter Q, {status: delta})`` pairs and re-derive each row's status.
+
+        Counters and status are written by the same UPDATE, with the status
+        computed from the shifted values. Rows receiving identical deltas
+        share a statement.
+        """
+        grouped = {}
+        for condition, deltas in changes:
+            deltas = frozenset((status, delta) for status, delta in deltas.items() if delta)
+            if deltas:
+                grouped[deltas] = grouped.get(deltas, Q()) | condition
+        for deltas, condition in grouped.items():
+            deltas = dict(deltas)
+            counts = {
+                status: F(f'{status}_count') + deltas[status] if status in deltas else F(f'{status}_count')
+                for status in ITEM_STATUSES
+            }
+            cls.objects.filter(condition).update(
+                **{f'{status}_count': counts[status] for status in deltas},
+                status=cls.rollup_expression(counts),
+                **extra,
+            )
+
+def record_item_transitions(transitions):
+    """Account for item status changes given as ``(item_id, order_id, farmer_id, old, new)`` tuples.
+
+    Moves the item counts of the orders and farmer sub-orders involved and
+    publishes an ``order.item_status_changed`` outbox event per item.
+    """
+    from outbox.services import OutboxService
+    from services.dispatch_service import DispatchService
+
+    if not transitions:
+        return
+    order_deltas, sub_order_deltas = {}, {}
+    for _, order_id, farmer_id, old_status, new_status in transitions:
+        for deltas in (order_deltas.setdefault(order_id, {}), sub_order_deltas.setdefault((order_id, farmer_id), {})):
+            deltas[old_status] = deltas.get(old_status, 0) - 1
+            deltas[new_status] = deltas.get(new_status, 0) + 1
+
+    Order.shift_status_counts(
+        [(Q(id=order_id), deltas) for order_id, deltas in order_deltas.items()],
+        updated_at=timezone.now(),
+    )
+    FarmerOrder.shift_status_counts(
+        [(Q(order_id=order_id, farmer_id=farmer_id), deltas) for (order_id, farmer_id), deltas in sub_order_deltas.items()]
+    )
+
+    buyers = dict(Order.objects.filter(id__in=order_deltas).values_list('id', 'buyer_id'))
+    OutboxService.publish_many('order.item_status_changed', OrderItem, [
+        (item_id, {
+            'order_id': order_id,
+            'farmer_id': farmer_id,
+            'previous_status': old_status,
+            'status': new_status,
+            'user_ids': [buyers[order_id], farmer_id],
+        })
+        for item_id, order_id, farmer_id, old_status, new_status in transitions
+    ])
+    # Dispatch plans only cover processing items
+    DispatchService.invalidate(
+        farmer_id for _, _, farmer_id, old_status, new_status in transitions
+        if 'processing' in (old_status, new_status)
+    )
+
 class Cart(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every change to the cart's lines; part of the cart ETag
+    version = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"Cart for {self.buyer.username}"
     
     @property
     def total_price(self):
+        if hasattr(self, 'items_total'):
+            return self.items_total
         return sum(item.subtotal for item in self.items.all())
 
 class CartItem(models.Model):
@@ -31,9 +152,11 @@ class CartItem(models.Model):
     
     @property
     def subtotal(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.quantity * self.product.price
 
-class Order(models.Model):
+class Order(ItemStatusCounts):
     # This status is now a "Summary" status
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -58,12 +181,16 @@ class Order(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by refresh_search_vectors(); see search()
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['buyer']),
             models.Index(fields=['status']),
+            models.Index(fields=['updated_at']),
+            GinIndex(fields=['search_vector']),
         ]
     
     def __str__(self):
@@ -74,25 +201,45 @@ class Order(models.Model):
             self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
         super().save(*args, **kwargs)
 
-    def update_status_based_on_items(self):
-        """Auto-calculate order status based on individual items"""
-        items = self.items.all()
-        if not items.exists():
-            return
+    @staticmethod
+    def search_vector_expression():
+        """Document for an order row: number, buyer, delivery address and product names.
+
+        Related text comes from correlated subqueries because UPDATE cannot join.
+        """
+        buyer = User.objects.filter(pk=OuterRef('buyer_id')).annotate(
+            text=Concat('username', Value(' '), 'email', Value(' '), 'first_name', Value(' '), 'last_name',
+                        output_field=models.TextField())
+        ).values('text')[:1]
+        products = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id').annotate(
+            names=StringAgg('product__name', delimiter=' ')
+        ).values('names')
+        return (
+            SearchVector('order_number', weight='A', config='simple')
+            + SearchVector(Subquery(buyer), weight='B', config='simple')
+            + SearchVector('delivery_address', Subquery(products), weight='C', config='simple')
+        )
+
+    @classmethod
+    def refresh_search_vectors(cls, **filters):
+        """Rebuild the search document of the matching orders with a single UPDATE."""
+        return cls.objects.filter(**filters).update(search_vector=cls.search_vector_expression())
+
+    @staticmethod
+    def search_query(text):
+        """Prefix query matching every word of ``text``, so partial numbers and emails still hit."""
+        terms = [re.sub(r'[^\w@.-]', '', word).lower() for word in text.split()]
+        terms = [f"'{term}':*" for term in terms if term]
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(terms), search_type='raw', config='simple')
+
+    @classmethod
+    def search(cls, queryset, text):
+        """Narrow ``queryset`` to orders matching ``text`` through the GIN index."""
+        query = cls.search_query(text)
+        return queryset.filter(search_vector=query) if query is not None else queryset.none()
 
-        statuses = [item.status for item in items]
-        
-        if all(s == 'delivered' for s in statuses):
-            self.status = 'delivered'
-        elif all(s == 'cancelled' for s in statuses):
-            self.status = 'cancelled'
-        elif any(s in ['shipped', 'out_for_delivery'] for s in statuses):
-            self.status = 'shipped'
-        elif any(s == 'processing' for s in statuses):
-            self.status = 'processing'
-        else:
-            self.status = 'pending'
-        self.save()
 
 class OrderItem(models.Model):
     # Statuses specific to the item journey (Food Delivery style)
@@ -129,6 +276,24 @@ class OrderItem(models.Model):
             return self.quantity * self.price
         return 0
 
+class FarmerOrder(ItemStatusCounts):
+    """A farmer's share of an order: the subtotal and rolled-up status of their items."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='farmer_orders')
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='farmer_sub_orders')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ('farmer', 'order')
+        indexes = [
+            models.Index(fields=['farmer', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.order} for {self.farmer.username}"
+
 class OrderStatusHistory(models.Model):
     order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE, related_name='status_history')
     previous_status = models.CharField(max_length=20, choices=OrderItem.ITEM_STATUS_CHOICES)
@@ -139,5 +304,95 @@ class OrderStatusHistory(models.Model):
     class Meta:
         ordering = ['-timestamp']
         
+    def __str__(self):
+        return f"{self.order_item} changed from {self.previous_status} to {self.new_status}"
+
+class IdempotencyKey(models.Model):
+    """First response returned for an ``Idempotency-Key`` sent by a client.
+
+    A row is claimed before the view runs and completed with the response
+    afterwards, so retries of the same request are answered from here.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'key')
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} for {self.user.username}"
+
+    @property
+    def is_complete(self):
+        return self.response_status is not None
+
+class ArchivedOrder(models.Model):
+    """A delivered or cancelled order moved out of the live tables; ids are kept from ``Order``."""
+    id = models.BigIntegerField(primary_key=True)
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    order_number = models.CharField(max_length=50, unique=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    payment_method = models.CharField(max_length=20, choices=Order.PAYMENT_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    delivery_address = models.TextField()
+    notes = models.TextField(blank=True)
+    # Copied from the live row, so neither is auto-managed
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['buyer', '-created_at']),
+            GinIndex(fields=['search_vector']),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.order_number}"
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    product_name = models.CharField(max_length=200)
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_farmer_orders')
+    quantity = models.IntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=OrderItem.ITEM_STATUS_CHOICES)
+    is_prebooking = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farmer', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+
+    @property
+    def subtotal(self):
+        return self.quantity * self.price
+
+class ArchivedOrderStatusHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order_item = models.ForeignKey(ArchivedOrderItem, on_delete=models.CASCADE, related_name='status_history')
+    previous_status = models.CharField(max_length=20, choices=OrderItem.ITEM_STATUS_CHOICES)
+    new_status = models.CharField(max_length=20, choices=OrderItem.ITEM_STATUS_CHOICES)
+    updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-timestamp']
+
     def __str__(self):
         return f"{self.order_item} changed from {self.previous_status} to {self.new_status}"
\ No newline at end of file
@@ -1,15 +1,39 @@
 from rest_framework import serializers
-from .models import Cart, CartItem, Order, OrderItem
-from products.serializers import ProductSerializer
+from .models import Cart, CartItem, Order, OrderItem, FarmerOrder, ArchivedOrder, ArchivedOrderItem, rollup_status
+from django.core.files.storage import default_storage
+from products.models import Product
+
+def thumbnail_url(path, request=None):
+    """URL for a stored image path, absolute when a request is available (like ImageField)."""
+    if not path:
+        return None
+    url = default_storage.url(path)
+    return request.build_absolute_uri(url) if request else url
+
+class CartProductSerializer(serializers.ModelSerializer):
+    """The slice of a product the cart needs; see DatabaseCartStore.items_queryset."""
+    farmer_name = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    market_state = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'unit', 'farmer_name', 'thumbnail', 'stock_quantity', 'in_stock', 'market_state']
+
+    def get_farmer_name(self, obj):
+        return obj.farmer.get_full_name() or obj.farmer.username
+
+    def get_thumbnail(self, obj):
+        return thumbnail_url(getattr(obj, 'thumbnail', None), self.context.get('request'))
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product_details = ProductSerializer(source='product', read_only=True)
+    product_details = CartProductSerializer(source='product', read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = CartItem
-        fields = ['id', 'cart', 'product', 'product_details', 'quantity', 'added_at', 'subtotal']
-        read_only_fields = ['cart', 'added_at']
+        fields = ['id', 'cart', 'product', 'product_details', 'quantity', 'added_at', 'subtotal', 'is_prebooking', 'crop_growth']
+        read_only_fields = ['cart', 'added_at', 'is_prebooking', 'crop_growth']
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
@@ -17,8 +41,8 @@ class CartSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Cart
-        fields = ['id', 'buyer', 'created_at', 'items', 'total_price']
-        read_only_fields = ['buyer', 'created_at']
+        fields = ['id', 'buyer', 'created_at', 'version', 'items', 'total_price']
+        read_only_fields = ['buyer', 'created_at', 'version']
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
@@ -42,6 +66,9 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['buyer', 'order_number', 'total_amount', 'created_at', 'updated_at', 'status']
 
     def get_items(self, obj):
+        if hasattr(obj, 'farmer_items'):
+            return OrderItemSerializer(obj.farmer_items, many=True).data
+
         request = self.context.get('request')
         items = obj.items.all()
         
@@ -56,26 +83,62 @@ class OrderSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         
         if request and request.user.is_authenticated and not request.user.is_staff:
-            if instance.buyer != request.user:
-                farmer_items = [item for item in instance.items.all() if item.farmer == request.user]
-                
-                if not farmer_items:
-                    return data
-                    
-                farmer_total = sum(item.subtotal for item in farmer_items)
-                data['total_amount'] = str(farmer_total)
-                
-                statuses = [item.status for item in farmer_items]
-                
-                if all(s == 'delivered' for s in statuses):
-                    data['status'] = 'delivered'
-                elif all(s == 'cancelled' for s in statuses):
-                    data['status'] = 'cancelled'
-                elif any(s in ['shipped', 'out_for_delivery'] for s in statuses):
-                    data['status'] = 'shipped'
-                elif any(s == 'processing' for s in statuses):
-                    data['status'] = 'processing'
+            if instance.buyer_id != request.user.id:
+                # Farmers see their own share of the order
+                if hasattr(instance, 'farmer_sub_orders'):
+                    sub_order = instance.farmer_sub_orders[0] if instance.farmer_sub_orders else None
                 else:
-                    data['status'] = 'pending'
+                    sub_order = FarmerOrder.objects.filter(order=instance, farmer=request.user).first()
+
+                if not sub_order:
+                    return data
+
+                data['total_amount'] = str(sub_order.subtotal)
+                data['status'] = sub_order.status
                     
         return data
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    price_at_purchase = serializers.DecimalField(source='price', max_digits=10, decimal_places=2, read_only=True)
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id', 'order', 'product', 'product_name', 'farmer', 'quantity', 'price', 'price_at_purchase', 'status', 'subtotal']
+        read_only_fields = fields
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Same shape as OrderSerializer, flagged with ``archived``."""
+    items = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'buyer', 'order_number', 'status', 'payment_method',
+            'total_amount', 'delivery_address', 'notes', 'created_at',
+            'updated_at', 'items', 'archived'
+        ]
+        read_only_fields = fields
+
+    def get_items(self, obj):
+        items = obj.farmer_items if hasattr(obj, 'farmer_items') else obj.items.all()
+        return ArchivedOrderItemSerializer(items, many=True).data
+
+    def get_archived(self, obj):
+        return True
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+
+        if request and request.user.is_authenticated and not request.user.is_staff:
+            if instance.buyer_id != request.user.id:
+                # Archived orders have no sub-orders; total the farmer's items instead
+                items = instance.farmer_items if hasattr(instance, 'farmer_items') else [
+                    item for item in instance.items.all() if item.farmer_id == request.user.id
+                ]
+                data['total_amount'] = str(sum((item.subtotal for item in items), 0))
+                data['status'] = rollup_status([item.status for item in items])
+
+        return data
@@ -0,0 +1,69 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from accounts.models import User, BuyerProfile
+from crops.models import CropGrowth
+from products.models import Product, ProductImage
+from services.dispatch_service import DispatchService
+from .cart_store import get_cart_store
+from .models import Order, OrderItem
+
+SEARCHABLE_USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=User)
+def track_searchable_user_change(sender, instance, update_fields=None, **kwargs):
+    # Saves such as the last_login update on every sign-in leave these fields alone
+    if not instance.pk or (update_fields is not None and not SEARCHABLE_USER_FIELDS & set(update_fields)):
+        return
+    old = User.objects.filter(pk=instance.pk).values(*SEARCHABLE_USER_FIELDS).first()
+    if old and any(old[field] != getattr(instance, field) for field in SEARCHABLE_USER_FIELDS):
+        instance._search_fields_changed = True
+
+
+@receiver(post_save, sender=User)
+def refresh_buyer_order_search(sender, instance, created, **kwargs):
+    # Buyer names and emails are part of every order's search document
+    if created or not getattr(instance, '_search_fields_changed', False):
+        return
+    instance._search_fields_changed = False
+    Order.refresh_search_vectors(buyer=instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def invalidate_item_dispatch_plan(sender, instance, **kwargs):
+    # Covers direct edits such as quantity changes in the admin
+    DispatchService.invalidate([instance.farmer_id])
+
+
+@receiver(post_save, sender=Order)
+def invalidate_order_dispatch_plans(sender, instance, created, **kwargs):
+    # The delivery address decides which batch the order's items fall into
+    if created:
+        return
+    DispatchService.invalidate(
+        instance.items.filter(status='processing').values_list('farmer_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=BuyerProfile)
+def invalidate_buyer_dispatch_plans(sender, instance, **kwargs):
+    DispatchService.invalidate(
+        OrderItem.objects.filter(order__buyer_id=instance.user_id, status='processing')
+        .values_list('farmer_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def forget_cart_product(sender, instance, **kwargs):
+    # Carts show the current price and stock, not the ones seen when the line was added
+    get_cart_store().forget_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=CropGrowth)
+def forget_cart_product_of(sender, instance, **kwargs):
+    # The thumbnail and the market state come from these
+    if instance.product_id:
+        get_cart_store().forget_products([instance.product_id])
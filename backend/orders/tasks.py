@@ -0,0 +1,57 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from .models import IdempotencyKey
+
+@shared_task
+def purge_expired_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()
+    return f"Purged {deleted} expired idempotency keys."
+
+
+@shared_task
+def persist_dirty_carts(batch_size=500):
+    """Write back carts changed in Redis since the last run."""
+    from .cart_store import get_cart_store, RedisCartStore
+    store = get_cart_store()
+    if not isinstance(store, RedisCartStore):
+        return "Cart store is not Redis backed."
+    user_ids = store.redis.srandmember(RedisCartStore.DIRTY_KEY, batch_size)
+    for user_id in user_ids:
+        store.persist_user(int(user_id))
+    return f"Persisted {len(user_ids)} carts."
+
+
+@shared_task
+def reconcile_carts():
+    """Persist every cart held in Redis, catching any write-back that was lost."""
+    from .cart_store import get_cart_store, RedisCartStore
+    store = get_cart_store()
+    if not isinstance(store, RedisCartStore):
+        return "Cart store is not Redis backed."
+    count = 0
+    for key in store.redis.scan_iter(match='cart:*', count=500):
+        if key == RedisCartStore.DIRTY_KEY:
+            continue
+        store.persist_user(int(key.split(':', 1)[1]))
+        count += 1
+    return f"Reconciled {count} carts."
+
+
+@shared_task
+def archive_orders(batch_size=500):
+    from services.order_service import OrderArchiveService
+
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    if not days:
+        return "Order archiving is disabled."
+
+    cutoff = timezone.now() - timedelta(days=days)
+    total = 0
+    while True:
+        archived = OrderArchiveService.archive_batch(cutoff, batch_size=batch_size)
+        total += archived
+        if archived < batch_size:
+            break
+    return f"Archived {total} orders."
@@ -1,9 +1,16 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from django.db import transaction
-from .models import Cart, CartItem, Order, OrderItem, OrderStatusHistory
-from .serializers import CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer
+from django.db.models import Prefetch, Value
+from .models import (
+    Cart, CartItem, Order, OrderItem, OrderStatusHistory, FarmerOrder, ArchivedOrder, ArchivedOrderItem,
+    record_item_transitions,
+)
+from .serializers import CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer, ArchivedOrderSerializer
+from .idempotency import idempotent
+from .cart_store import get_cart_store
 from products.models import Product
 
 
@@ -16,27 +23,26 @@ class CartViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Cart.objects.filter(buyer=self.request.user)
 
-    def get_object(self):
-        cart, _ = Cart.objects.get_or_create(buyer=self.request.user)
-        # Fix N+1 queries when serializing the cart
-        cart = Cart.objects.prefetch_related(
-            'items__product__images',
-            'items__product__reviews',
-            'items__product__category',
-            'items__product__farmer'
-        ).get(id=cart.id)
-        return cart
-
     def list(self, request, *args, **kwargs):
-        """Return the single cart for this user (same shape as retrieve)."""
-        cart = self.get_object()
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        """Return the single cart for this user (same shape as retrieve).
+
+        The response carries an ETag; clients sending it back in If-None-Match
+        get an empty 304 while the cart is unchanged.
+        """
+        store = get_cart_store()
+        etag = f'"cart-{store.get_version(request.user)}"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(store.get_cart(request.user, self.get_serializer_context()), headers={'ETag': etag})
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    @idempotent
     @transaction.atomic
     @action(detail=False, methods=['post'], url_path='add-item')
     def add_item(self, request):
-        cart = self.get_object()
+        store = get_cart_store()
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
 
@@ -46,45 +52,22 @@ class CartViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Product not found or unavailable'}, status=status.HTTP_404_NOT_FOUND)
 
         is_prebooking = request.data.get('is_prebooking', False)
-        
+        existing = store.find_line(request.user, product.id)
+        in_cart = existing['quantity'] if existing else 0
+
+        growth = None
         if is_prebooking:
             growth = product.active_crop_growth
             if not growth:
                 return Response({'error': 'Product is not available for prebooking'}, status=status.HTTP_400_BAD_REQUEST)
-            if float(growth.available_quantity) < quantity:
+            if float(growth.available_quantity) < (in_cart + quantity):
                 return Response({'error': 'Not enough reservable quantity available'}, status=status.HTTP_400_BAD_REQUEST)
-                
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity, 'is_prebooking': True, 'crop_growth': growth},
-            )
-            if not created:
-                if float(growth.available_quantity) < (cart_item.quantity + quantity):
-                    return Response({'error': 'Not enough reservable quantity available'}, status=status.HTTP_400_BAD_REQUEST)
-                cart_item.quantity += quantity
-                cart_item.is_prebooking = True
-                cart_item.crop_growth = growth
-                cart_item.save()
-        else:
-            if product.stock_quantity < quantity:
-                return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+        elif product.stock_quantity < (in_cart + quantity):
+            return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
 
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity, 'is_prebooking': False},
-            )
-            if not created:
-                if product.stock_quantity < (cart_item.quantity + quantity):
-                    return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
-                cart_item.quantity += quantity
-                cart_item.is_prebooking = False
-                cart_item.save()
-
-        serializer = CartItemSerializer(cart_item)
+        data, created = store.add_line(request.user, product, quantity, growth=growth, context=self.get_serializer_context())
         return_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-        return Response(serializer.data, status=return_status)
+        return Response(data, status=return_status)
 
 
 class CartItemViewSet(viewsets.ModelViewSet):
@@ -97,21 +80,46 @@ class CartItemViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return CartItem.objects.filter(cart__buyer=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_cart_store().get_cart(request.user, self.get_serializer_context())['items'])
+
+    def retrieve(self, request, *args, **kwargs):
+        items = get_cart_store().get_cart(request.user, self.get_serializer_context())['items']
+        for item in items:
+            if str(item['id']) == str(kwargs['pk']):
+                return Response(item)
+        raise NotFound()
+
+    def create(self, request, *args, **kwargs):
+        return Response({'error': 'Use the cart add-item endpoint.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
     def update(self, request, *args, **kwargs):
-        quantity = request.data.get('quantity')
-        if quantity is not None:
-            instance = self.get_object()
-            try:
-                quantity = int(quantity)
-                if instance.is_prebooking and instance.crop_growth:
-                    if float(instance.crop_growth.available_quantity) < quantity:
-                        return Response({'error': 'Not enough reservable quantity available'}, status=status.HTTP_400_BAD_REQUEST)
-                else:
-                    if instance.product.stock_quantity < quantity:
-                        return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
-            except ValueError:
-                pass
-        return super().update(request, *args, **kwargs)
+        store = get_cart_store()
+        line = store.get_line(request.user, kwargs['pk'])
+        if line is None:
+            raise NotFound()
+        try:
+            quantity = int(request.data.get('quantity'))
+        except (TypeError, ValueError):
+            return Response({'error': 'A whole-number quantity is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({'error': 'Quantity must be at least 1.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if line['is_prebooking'] and line['crop_growth_id']:
+            from crops.models import CropGrowth
+            available = CropGrowth.objects.filter(id=line['crop_growth_id']).values_list('available_quantity', flat=True).first()
+            if available is None or float(available) < quantity:
+                return Response({'error': 'Not enough reservable quantity available'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            stock = Product.objects.filter(id=line['product_id']).values_list('stock_quantity', flat=True).first()
+            if stock is None or stock < quantity:
+                return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(store.set_quantity(request.user, kwargs['pk'], quantity, context=self.get_serializer_context()))
+
+    def destroy(self, request, *args, **kwargs):
+        if not get_cart_store().remove_line(request.user, kwargs['pk']):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -124,19 +132,83 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        qs = Order.objects.prefetch_related('items', 'items__product')
         if user.is_staff:
-            return qs.all()
-        return (
-            qs.filter(buyer=user) |
-            qs.filter(items__farmer=user)
-        ).distinct()
+            return Order.objects.prefetch_related('items', 'items__product')
+        if user.is_farmer:
+            # Walk the farmer's sub-orders instead of joining every order item
+            return Order.objects.filter(farmer_orders__farmer=user).order_by('-farmer_orders__created_at').prefetch_related(
+                Prefetch('farmer_orders', queryset=FarmerOrder.objects.filter(farmer=user), to_attr='farmer_sub_orders'),
+                Prefetch('items', queryset=OrderItem.objects.filter(farmer=user).select_related('product'), to_attr='farmer_items'),
+            )
+        return Order.objects.filter(buyer=user).prefetch_related('items', 'items__product')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        q = self.request.query_params.get('q', '').strip()
+        if q:
+            # Orders and archived orders share the search document, so either can be searched
+            queryset = Order.search(queryset, q)
+        return queryset
+
+    @property
+    def include_history(self):
+        """Archived orders are only read when the client asks for ``?history=1``."""
+        return self.request.query_params.get('history') in ('1', 'true')
+
+    def get_archived_queryset(self):
+        user = self.request.user
+        if user.is_staff:
+            return ArchivedOrder.objects.prefetch_related('items')
+        if user.is_farmer:
+            return ArchivedOrder.objects.filter(
+                id__in=ArchivedOrderItem.objects.filter(farmer=user).values('order_id')
+            ).prefetch_related(
+                Prefetch('items', queryset=ArchivedOrderItem.objects.filter(farmer=user), to_attr='farmer_items')
+            )
+        return ArchivedOrder.objects.filter(buyer=user).prefetch_related('items')
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_history:
+            return super().list(request, *args, **kwargs)
+
+        # Page over ids from both tables, then load only the rows on the page
+        live = self.filter_queryset(self.get_queryset())
+        archived = self.filter_queryset(self.get_archived_queryset())
+        rows = live.order_by().values('id', 'created_at', archived=Value(False)).union(
+            archived.order_by().values('id', 'created_at', archived=Value(True)), all=True
+        ).order_by('-created_at', '-id')
+        page = self.paginate_queryset(rows)
+
+        live_orders = live.in_bulk([row['id'] for row in page if not row['archived']])
+        archived_orders = archived.in_bulk([row['id'] for row in page if row['archived']])
+        context = self.get_serializer_context()
+        data = [
+            ArchivedOrderSerializer(archived_orders[row['id']], context=context).data if row['archived']
+            else OrderSerializer(live_orders[row['id']], context=context).data
+            for row in page
+        ]
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.include_history:
+            order = self.get_archived_queryset().filter(pk=kwargs['pk']).first()
+            if order is not None:
+                return Response(ArchivedOrderSerializer(order, context=self.get_serializer_context()).data)
+        return super().retrieve(request, *args, **kwargs)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     @transaction.atomic
     def perform_create(self, serializer):
         from services.order_service import OrderService
         OrderService.create_order_from_cart(self.request.user, serializer)
 
+    def perform_update(self, serializer):
+        order = serializer.save()
+        Order.refresh_search_vectors(id=order.id)
+
     @action(detail=True, methods=['patch'])
     def cancel(self, request, pk=None):
         order = self.get_object()
@@ -154,18 +226,26 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         
         with transaction.atomic():
-            for item in order.items.all():
-                if item.status not in ('shipped', 'delivered', 'cancelled'):
-                    OrderStatusHistory.objects.create(
-                        order_item=item,
-                        previous_status=item.status,
+            # Items are locked in id order before the order row, like every other transition
+            items = list(
+                order.items.select_for_update().filter(status__in=('pending', 'processing'))
+                .order_by('id').values('id', 'farmer_id', 'status')
+            )
+            if items:
+                OrderItem.objects.filter(id__in=[item['id'] for item in items]).update(status='cancelled')
+                OrderStatusHistory.objects.bulk_create([
+                    OrderStatusHistory(
+                        order_item_id=item['id'],
+                        previous_status=item['status'],
                         new_status='cancelled',
                         updated_by=request.user
                     )
-                    item.status = 'cancelled'
-                    item.save()
-            
-            order.update_status_based_on_items()
+                    for item in items
+                ])
+                record_item_transitions([
+                    (item['id'], order.id, item['farmer_id'], item['status'], 'cancelled') for item in items
+                ])
+            order.refresh_from_db()
             
         return Response(OrderSerializer(order).data)
 
@@ -174,6 +254,13 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    valid_transitions = {
+        'pending': ['processing'],
+        'processing': ['shipped'],
+        'shipped': ['delivered']
+    }
+    bulk_transition_limit = 500
+
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
@@ -200,25 +287,99 @@ class OrderItemViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Invalid status transition.'}, status=status.HTTP_400_BAD_REQUEST)
             
         # Transition validation
-        valid_transitions = {
-            'pending': ['processing'],
-            'processing': ['shipped'],
-            'shipped': ['delivered']
-        }
-        
-        allowed_next = valid_transitions.get(item.status, [])
+        allowed_next = self.valid_transitions.get(item.status, [])
         if new_status not in allowed_next:
             return Response({'error': f"Cannot transition from {item.status} to {new_status}."}, status=status.HTTP_400_BAD_REQUEST)
             
         with transaction.atomic():
+            # Only the request that still sees the status it validated moves the counters
+            if not OrderItem.objects.filter(id=item.id, status=item.status).update(status=new_status):
+                return Response({'error': 'The item status has changed, reload and try again.'}, status=status.HTTP_409_CONFLICT)
             OrderStatusHistory.objects.create(
                 order_item=item,
                 previous_status=item.status,
                 new_status=new_status,
                 updated_by=user
             )
+            record_item_transitions([(item.id, item.order_id, item.farmer_id, item.status, new_status)])
             item.status = new_status
-            item.save()
-            item.order.update_status_based_on_items()
             
-        return Response(OrderItemSerializer(item).data)
\ No newline at end of file
+        return Response(OrderItemSerializer(item).data)
+
+    @action(detail=False, methods=['post'], url_path='bulk-transition')
+    def bulk_transition(self, request):
+        """Move many items to one status: ``{"item_ids": [...], "status": "processing"}``.
+
+        Items are checked together and the valid ones are updated with one
+        statement; the response reports the outcome for every requested id.
+        """
+        if not isinstance(request.data, dict):
+            return Response({'error': 'The request body must be an object.'}, status=status.HTTP_400_BAD_REQUEST)
+        new_status = request.data.get('status')
+        item_ids = request.data.get('item_ids')
+        user = request.user
+
+        if new_status not in ('processing', 'shipped', 'delivered'):
+            return Response({'error': 'Invalid status transition.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(item_ids, list) or not item_ids:
+            return Response({'error': 'item_ids must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(item_ids) > self.bulk_transition_limit:
+            return Response(
+                {'error': f'At most {self.bulk_transition_limit} items can be updated at once.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            item_ids = list(dict.fromkeys(int(item_id) for item_id in item_ids))
+        except (TypeError, ValueError):
+            return Response({'error': 'item_ids must contain item ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            rows = {
+                row['id']: row for row in OrderItem.objects.select_for_update(of=('self',))
+                .filter(id__in=item_ids)
+                .order_by('id')
+                .values('id', 'status', 'farmer_id', 'order_id', 'order__buyer_id')
+            }
+
+            results, accepted = [], []
+            for item_id in item_ids:
+                row = rows.get(item_id)
+                # Items the user cannot see are reported like missing ones
+                if not row or (not user.is_staff and user.id not in (row['farmer_id'], row['order__buyer_id'])):
+                    results.append({'id': item_id, 'updated': False, 'error': 'Not found.'})
+                elif new_status in ('processing', 'shipped') and row['farmer_id'] != user.id:
+                    results.append({'id': item_id, 'updated': False, 'error': 'Only the farmer who owns this product can update this status.'})
+                elif new_status == 'delivered' and row['order__buyer_id'] != user.id:
+                    results.append({'id': item_id, 'updated': False, 'error': 'Only the buyer who placed the order can confirm delivery.'})
+                elif new_status not in self.valid_transitions.get(row['status'], []):
+                    results.append({'id': item_id, 'updated': False, 'error': f"Cannot transition from {row['status']} to {new_status}."})
+                else:
+                    results.append({'id': item_id, 'updated': True, 'previous_status': row['status'], 'status': new_status})
+                    accepted.append(row)
+
+            if accepted:
+                # Every accepted item comes from the single status that leads to new_status
+                OrderItem.objects.filter(id__in=[row['id'] for row in accepted]).update(status=new_status)
+                OrderStatusHistory.objects.bulk_create([
+                    OrderStatusHistory(
+                        order_item_id=row['id'],
+                        previous_status=row['status'],
+                        new_status=new_status,
+                        updated_by=user
+                    )
+                    for row in accepted
+                ])
+                record_item_transitions([
+                    (row['id'], row['order_id'], row['farmer_id'], row['status'], new_status) for row in accepted
+                ])
+
+        return Response({'status': new_status, 'updated': len(accepted), 'results': results})
+
+    @action(detail=False, methods=['get'], url_path='dispatch-plan')
+    def dispatch_plan(self, request):
+        """The farmer's processing items grouped into delivery batches with picking totals."""
+        from services.dispatch_service import DispatchService
+
+        if not request.user.is_farmer:
+            return Response({'error': 'Only farmers have dispatch plans.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(DispatchService.plan(request.user))
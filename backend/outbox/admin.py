@@ -0,0 +1,22 @@
+from django.contrib import admin
+from .models import OutboxEvent, OutboxDelivery
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'aggregate_type', 'aggregate_id', 'created_at']
+    list_filter = ['topic', 'created_at']
+    search_fields = ['topic', 'aggregate_type']
+    readonly_fields = ['topic', 'aggregate_type', 'aggregate_id', 'payload', 'created_at']
+    date_hierarchy = 'created_at'
+
+@admin.register(OutboxDelivery)
+class OutboxDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['event', 'consumer', 'status', 'attempts', 'updated_at']
+    list_filter = ['status', 'consumer']
+    readonly_fields = ['event', 'consumer', 'attempts', 'last_error', 'updated_at']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        updated = queryset.update(status='pending', attempts=0)
+        self.message_user(request, f"{updated} deliveries will be retried on the next relay run.")
+    retry.short_description = 'Retry selected deliveries'
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def deliveries_from_offsets(apps, schema_editor):
+    """Owe every consumer the events its offset had not reached yet."""
+    OutboxEvent = apps.get_model('outbox', 'OutboxEvent')
+    OutboxDelivery = apps.get_model('outbox', 'OutboxDelivery')
+    ConsumerOffset = apps.get_model('outbox', 'ConsumerOffset')
+
+    offsets = dict(ConsumerOffset.objects.values_list('consumer', 'last_event_id'))
+    for name, config in settings.OUTBOX_CONSUMERS.items():
+        events = OutboxEvent.objects.filter(id__gt=offsets.get(name, 0), topic__in=config['topics']).order_by('id')
+        OutboxDelivery.objects.bulk_create(
+            (OutboxDelivery(event_id=event_id, consumer=name) for event_id in events.values_list('id', flat=True).iterator()),
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('dead', 'Dead')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='outbox.outboxevent')),
+            ],
+            options={
+                'ordering': ['event_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxdelivery',
+            index=models.Index(fields=['consumer', 'status', 'event'], name='outbox_delivery_queue_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='outboxdelivery',
+            unique_together={('event', 'consumer')},
+        ),
+        migrations.RunPython(deliveries_from_offsets, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ConsumerOffset',
+        ),
+    ]
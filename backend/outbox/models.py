@@ -0,0 +1,47 @@
+from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+
+class OutboxEvent(models.Model):
+    """A domain event recorded in the same transaction as the change it describes."""
+    topic = models.CharField(max_length=100)
+    aggregate_type = models.CharField(max_length=100)
+    aggregate_id = models.PositiveBigIntegerField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.aggregate_type}:{self.aggregate_id})"
+
+class OutboxDelivery(models.Model):
+    """An event a consumer has not processed yet, written in the same transaction as the event.
+
+    The row is deleted once the consumer has handled the event. After
+    ``OUTBOX_MAX_ATTEMPTS`` failures it is kept as ``dead`` for inspection.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('dead', 'Dead'),
+    )
+
+    event = models.ForeignKey(OutboxEvent, on_delete=models.CASCADE, related_name='deliveries')
+    consumer = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['event_id']
+        unique_together = ('event', 'consumer')
+        indexes = [
+            models.Index(fields=['consumer', 'status', 'event'], name='outbox_delivery_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.consumer} <- event #{self.event_id} ({self.status})"
@@ -0,0 +1,101 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.module_loading import import_string
+from .models import OutboxEvent, OutboxDelivery
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxService:
+    @staticmethod
+    def publish(topic, model, object_id, payload):
+        """Record one event about ``model`` row ``object_id`` in the current transaction."""
+        return OutboxService.publish_many(topic, model, [(object_id, payload)])[0]
+
+    @staticmethod
+    def publish_many(topic, model, items):
+        """Record an event per ``(object_id, payload)`` pair, and a delivery per subscribed consumer.
+
+        Both are inserted in the current transaction, so consumers can see an
+        event only after it has committed.
+        """
+        events = OutboxEvent.objects.bulk_create([
+            OutboxEvent(topic=topic, aggregate_type=model._meta.label_lower, aggregate_id=object_id, payload=payload)
+            for object_id, payload in items
+        ])
+        consumers = [name for name, config in settings.OUTBOX_CONSUMERS.items() if topic in config['topics']]
+        OutboxDelivery.objects.bulk_create([
+            OutboxDelivery(event=event, consumer=consumer) for event in events for consumer in consumers
+        ])
+        return events
+
+    @staticmethod
+    def relay(batch_size=500):
+        """Hand pending deliveries to every consumer in ``OUTBOX_CONSUMERS``; returns events delivered per consumer.
+
+        A delivery is deleted in the same transaction as the handler's own
+        writes. Delivery is therefore at least once: a batch that fails is
+        offered again on the next run.
+        """
+        delivered = {}
+        for name, config in settings.OUTBOX_CONSUMERS.items():
+            handler = import_string(config['handler'])
+            delivered[name] = 0
+            while True:
+                count, done = OutboxService._deliver_batch(name, handler, batch_size)
+                delivered[name] += count
+                if done:
+                    break
+        return delivered
+
+    @staticmethod
+    @transaction.atomic
+    def _deliver_batch(name, handler, batch_size):
+        # Rows held by another relay are skipped rather than waited for
+        deliveries = list(
+            OutboxDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(consumer=name, status='pending')
+            .select_related('event')
+            .order_by('event_id')[:batch_size]
+        )
+        if not deliveries:
+            return 0, True
+
+        failed = []
+        try:
+            with transaction.atomic():
+                handler([delivery.event for delivery in deliveries])
+            succeeded = deliveries
+        except Exception:
+            logger.exception("Outbox consumer %s failed on a batch; retrying its events one by one", name)
+            # Narrow the failure down so one bad event does not hold back the rest
+            succeeded = []
+            for delivery in deliveries:
+                try:
+                    with transaction.atomic():
+                        handler([delivery.event])
+                except Exception as e:
+                    failed.append((delivery, e))
+                else:
+                    succeeded.append(delivery)
+
+        OutboxDelivery.objects.filter(id__in=[delivery.id for delivery in succeeded]).delete()
+        for delivery, error in failed:
+            delivery.attempts += 1
+            delivery.last_error = f"{type(error).__name__}: {error}"
+            if delivery.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                delivery.status = 'dead'
+                logger.error("Outbox event %s is dead for consumer %s after %s attempts", delivery.event_id, name, delivery.attempts)
+            delivery.save(update_fields=['attempts', 'last_error', 'status', 'updated_at'])
+
+        # Failed events wait for the next run instead of being retried straight away
+        return len(succeeded), bool(failed) or len(deliveries) < batch_size
+
+    @staticmethod
+    def purge(older_than):
+        """Delete events created before ``older_than`` that no consumer still owes; dead deliveries keep their event."""
+        owed = OutboxDelivery.objects.filter(event=OuterRef('pk'))
+        deleted, _ = OutboxEvent.objects.filter(created_at__lt=older_than).filter(~Exists(owed)).delete()
+        return deleted
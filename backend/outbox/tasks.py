@@ -0,0 +1,17 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from .services import OutboxService
+
+@shared_task
+def relay_outbox(batch_size=500):
+    delivered = OutboxService.relay(batch_size=batch_size)
+    summary = ', '.join(f"{count} to {name}" for name, count in delivered.items())
+    return f"Relayed outbox events: {summary or 'none'}"
+
+@shared_task
+def purge_outbox():
+    cutoff = timezone.now() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+    deleted = OutboxService.purge(cutoff)
+    return f"Purged {deleted} processed outbox events."
@@ -5,6 +5,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from .models import Category, Product, ProductImage, Review
 from .serializers import CategorySerializer, ProductSerializer, ProductImageSerializer, ReviewSerializer
 from .permissions import IsFarmerOwnerOrReadOnly, IsBuyerOwnerOrReadOnly
+from orders.idempotency import idempotent
 
 
 from django.db.models import Count
@@ -112,6 +113,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         CropFollower.objects.filter(buyer=request.user, crop_growth=growth).delete()
         return Response({'status': 'unfollowed'}, status=status.HTTP_200_OK)
 
+    @idempotent
     @action(detail=True, methods=['post'])
     def reserve(self, request, slug=None):
         product = self.get_object()
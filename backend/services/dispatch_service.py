@@ -0,0 +1,187 @@
+import re
+import time
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+PIN_CODE = re.compile(r'\b(\d{6})\b')
+
+
+class DispatchService:
+    """Groups a farmer's processing order items into delivery batches.
+
+    Plans are cached per farmer under a version number that is bumped
+    whenever one of the farmer's processing items changes, so a cached
+    plan is never served after the items it was built from have moved on.
+    """
+
+    @staticmethod
+    def _version_key(farmer_id):
+        return f'dispatch:version:{farmer_id}'
+
+    @staticmethod
+    def invalidate(farmer_ids):
+        """Drop the cached plans of ``farmer_ids`` once the current transaction commits."""
+        farmer_ids = set(farmer_ids)
+        if not farmer_ids:
+            return
+
+        def bump():
+            for farmer_id in farmer_ids:
+                try:
+                    cache.incr(DispatchService._version_key(farmer_id))
+                except ValueError:
+                    # No version yet means no plan is cached under one either
+                    pass
+
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def plan(farmer):
+        version_key = DispatchService._version_key(farmer.id)
+        # A fresh version never collides with plans left from an evicted counter
+        cache.add(version_key, time.time_ns(), timeout=None)
+        version = cache.get(version_key)
+
+        plan_key = f'dispatch:plan:{farmer.id}:{version}'
+        plan = cache.get(plan_key)
+        if plan is None:
+            plan = DispatchService.build_plan(farmer)
+            cache.set(plan_key, plan, timeout=settings.DISPATCH_PLAN_CACHE_SECONDS)
+        return plan
+
+    @staticmethod
+    def locality(address):
+        """Batching key and label for an address: its PIN code, else its last line or comma part."""
+        address = address or ''
+        match = PIN_CODE.search(address)
+        if match:
+            return f'pin:{match.group(1)}', f'PIN {match.group(1)}'
+        parts = [part.strip() for part in re.split(r'[,\n]', address) if part.strip()]
+        if not parts:
+            return 'unknown', 'Unknown'
+        return 'place:' + ' '.join(parts[-1].lower().split()), parts[-1]
+
+    @staticmethod
+    def build_plan(farmer):
+        from orders.models import Order, OrderItem
+        from products.models import Product
+
+        rows = list(
+            OrderItem.objects.filter(farmer=farmer, status='processing')
+            .order_by('id')
+            .values_list(
+                'id', 'order_id', 'product_id', 'quantity',
+                'order__buyer__buyer_profile__latitude', 'order__buyer__buyer_profile__longitude',
+            )
+        )
+        if not rows:
+            return {'item_count': 0, 'batches': []}
+
+        item_ids, order_ids, product_ids, quantities, latitudes, longitudes = zip(*rows)
+        item_ids = np.array(item_ids, dtype=np.int64)
+        order_ids = np.array(order_ids, dtype=np.int64)
+        quantities = np.array(quantities, dtype=np.int64)
+        coords = np.array(
+            [(float(lat), float(lng)) if lat is not None and lng is not None else (np.nan, np.nan)
+             for lat, lng in zip(latitudes, longitudes)],
+            dtype=np.float64,
+        )
+
+        # Text details are only needed once per order and product
+        orders = {
+            row[0]: row[1:] for row in Order.objects
+            .filter(id__in=np.unique(order_ids).tolist())
+            .values_list('id', 'order_number', 'delivery_address')
+        }
+        products = {
+            row[0]: row[1:] for row in Product.objects
+            .filter(id__in=np.unique(product_ids).tolist())
+            .values_list('id', 'name', 'unit')
+        }
+
+        # Buyers with coordinates fall into grid cells, everyone else into the
+        # locality of the order's delivery address
+        located = ~np.isnan(coords).any(axis=1)
+        cell_keys = np.floor(coords[located] / settings.DISPATCH_GRID_DEGREES).astype(np.int64)
+        cells, cell_index = np.unique(cell_keys, axis=0, return_inverse=True)
+
+        localities, labels = {}, []
+        order_locality = {}
+        for order_id, (_, address) in orders.items():
+            key, label = DispatchService.locality(address)
+            if key not in localities:
+                localities[key] = len(localities)
+                labels.append(label)
+            order_locality[order_id] = localities[key]
+        locality_index = np.array([order_locality[order_id] for order_id in order_ids[~located].tolist()], dtype=np.int64)
+
+        raw_batch = np.empty(len(rows), dtype=np.int64)
+        raw_batch[located] = cell_index.reshape(-1)
+        raw_batch[~located] = len(cells) + locality_index
+        batch_keys, batch = np.unique(raw_batch, return_inverse=True)
+        batch = batch.reshape(-1)
+        batch_count = len(batch_keys)
+
+        item_counts = np.bincount(batch, minlength=batch_count)
+        unit_totals = np.bincount(batch, weights=quantities, minlength=batch_count).astype(np.int64)
+        located_counts = np.bincount(batch[located], minlength=batch_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centres = np.column_stack([
+                np.bincount(batch[located], weights=coords[located, 0], minlength=batch_count),
+                np.bincount(batch[located], weights=coords[located, 1], minlength=batch_count),
+            ]) / located_counts[:, None]
+
+        # Picking totals: one bucket per (batch, product) pair
+        product_keys, product_index = np.unique(np.array(product_ids, dtype=np.int64), return_inverse=True)
+        pairs, pair_index = np.unique(batch * len(product_keys) + product_index.reshape(-1), return_inverse=True)
+        pair_totals = np.bincount(pair_index.reshape(-1), weights=quantities).astype(np.int64)
+        pair_batch, pair_product = np.divmod(pairs, len(product_keys))
+        pair_bounds = np.searchsorted(pair_batch, np.arange(batch_count + 1))
+
+        # Items sorted by batch, so each batch is a contiguous slice
+        by_batch = np.argsort(batch, kind='stable')
+        item_bounds = np.concatenate([[0], np.cumsum(item_counts)])
+
+        batches = []
+        for index, key in enumerate(batch_keys.tolist()):
+            if key < len(cells):
+                latitude, longitude = np.round(centres[index], 5).tolist()
+                kind, label = 'area', f'Area around {latitude}, {longitude}'
+                centre = {'latitude': latitude, 'longitude': longitude}
+            else:
+                kind, label, centre = 'locality', labels[key - len(cells)], None
+
+            members = by_batch[item_bounds[index]:item_bounds[index + 1]]
+            picking = sorted(
+                (
+                    {
+                        'product_id': int(product_keys[product]),
+                        'name': products[int(product_keys[product])][0],
+                        'unit': products[int(product_keys[product])][1],
+                        'quantity': int(total),
+                    }
+                    for product, total in zip(
+                        pair_product[pair_bounds[index]:pair_bounds[index + 1]].tolist(),
+                        pair_totals[pair_bounds[index]:pair_bounds[index + 1]].tolist(),
+                    )
+                ),
+                key=lambda line: -line['quantity'],
+            )
+            batches.append({
+                'kind': kind,
+                'label': label,
+                'centre': centre,
+                'item_count': int(item_counts[index]),
+                'total_quantity': int(unit_totals[index]),
+                'item_ids': item_ids[members].tolist(),
+                'orders': [
+                    {'id': order_id, 'order_number': orders[order_id][0], 'delivery_address': orders[order_id][1]}
+                    for order_id in np.unique(order_ids[members]).tolist()
+                ],
+                'picking': picking,
+            })
+
+        batches.sort(key=lambda entry: (-entry['item_count'], entry['label']))
+        return {'item_count': len(rows), 'batches': batches}
@@ -1,69 +1,226 @@
+from decimal import Decimal
 from django.db import transaction
+from django.db.models import F, Q, Sum, Count, Case, When, Value, IntegerField, DecimalField
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
-from orders.models import Cart, OrderItem
+from orders.models import Cart, CartItem, Order, OrderItem, FarmerOrder
+from outbox.services import OutboxService
+from products.models import Product
 
 class OrderService:
     @staticmethod
     @transaction.atomic
     def create_order_from_cart(user, serializer):
+        """Turn the buyer's cart into an order with a fixed number of statements.
+
+        Every product and crop row touched by the cart is locked up front in
+        ascending id order, so concurrent checkouts always acquire locks in
+        the same sequence and cannot deadlock. Stock is then decremented with
+        one conditional UPDATE per table and all order items and reservations
+        are inserted with ``bulk_create``.
+        """
+        from crops.models import CropGrowth, CropReservation
+        from crops.services import reservation_created_payload
+        from orders.cart_store import get_cart_store
+
+        store = get_cart_store()
+        # Carts kept outside the database are written back before they are read
+        store.persist(user)
+
         try:
             cart = Cart.objects.get(buyer=user)
         except Cart.DoesNotExist:
             raise ValidationError('Your cart is empty.')
 
-        cart_items = cart.items.select_related('product', 'product__farmer').all()
-        if not cart_items.exists():
+        lines = list(cart.items.values('product_id', 'quantity', 'is_prebooking', 'crop_growth_id'))
+        if not lines:
             raise ValidationError('Your cart is empty.')
 
-        total_amount = sum(item.subtotal for item in cart_items)
-        order = serializer.save(buyer=user, total_amount=total_amount)
-
-        for ci in cart_items:
-            product = ci.product
-            
-            if ci.is_prebooking:
-                growth = ci.crop_growth
-                if not growth or float(growth.available_quantity) < ci.quantity:
-                    raise ValidationError({'detail': f"Not enough reservable quantity for {product.name}"})
-                
-                growth.available_quantity = float(growth.available_quantity) - ci.quantity
-                growth.save()
-
-                from crops.models import CropReservation
-                CropReservation.objects.create(
+        stock_lines = {line['product_id']: line['quantity'] for line in lines if not line['is_prebooking']}
+        prebook_lines = [line for line in lines if line['is_prebooking']]
+
+        products = {
+            p.id: p for p in Product.objects.select_for_update()
+            .filter(id__in=[line['product_id'] for line in lines])
+            .order_by('id')
+        }
+        growths = {
+            g.id: g for g in CropGrowth.objects.select_for_update()
+            .filter(id__in=[line['crop_growth_id'] for line in prebook_lines if line['crop_growth_id']])
+            .order_by('id')
+        }
+
+        growth_demand = {}
+        for line in prebook_lines:
+            growth = growths.get(line['crop_growth_id'])
+            if growth:
+                growth_demand[growth.id] = growth_demand.get(growth.id, 0) + line['quantity']
+            if not growth or growth.available_quantity < growth_demand[growth.id]:
+                raise ValidationError({'detail': f"Not enough reservable quantity for {products[line['product_id']].name}"})
+
+        for product_id, quantity in stock_lines.items():
+            if products[product_id].stock_quantity < quantity:
+                raise ValidationError({'detail': f"Not enough stock for {products[product_id].name}"})
+
+        # Totals are computed by the database from the locked prices
+        total_amount = cart.items.aggregate(
+            total=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+        )['total'] or Decimal('0')
+        order = serializer.save(buyer=user, total_amount=total_amount, pending_count=len(lines))
+
+        # The quantity guards are repeated in the UPDATE so that a row which
+        # somehow drifted below the demanded quantity is never driven negative
+        if stock_lines:
+            demand = Case(
+                *[When(id=product_id, then=Value(quantity)) for product_id, quantity in stock_lines.items()],
+                output_field=IntegerField(),
+            )
+            updated = Product.objects.filter(id__in=stock_lines, stock_quantity__gte=demand).update(
+                stock_quantity=F('stock_quantity') - demand,
+                updated_at=timezone.now(),
+            )
+            if updated != len(stock_lines):
+                raise ValidationError({'detail': 'Stock changed while placing the order. Please try again.'})
+        if growth_demand:
+            demand = Case(
+                *[When(id=growth_id, then=Value(Decimal(quantity))) for growth_id, quantity in growth_demand.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            )
+            updated = CropGrowth.objects.filter(id__in=growth_demand, available_quantity__gte=demand).update(
+                available_quantity=F('available_quantity') - demand,
+                last_updated=timezone.now(),
+            )
+            if updated != len(growth_demand):
+                raise ValidationError({'detail': 'Reservable quantity changed while placing the order. Please try again.'})
+        # The UPDATEs above skip the product signals that refresh other buyers' carts
+        store.forget_products(products)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line['product_id'],
+                farmer_id=products[line['product_id']].farmer_id,
+                quantity=line['quantity'],
+                price=products[line['product_id']].price,
+                status='pending',
+                is_prebooking=line['is_prebooking'],
+                crop_growth_id=line['crop_growth_id'] if line['is_prebooking'] else None
+            )
+            for line in lines
+        ])
+
+        Order.refresh_search_vectors(id=order.id)
+
+        farmer_shares = {}
+        for line in lines:
+            product = products[line['product_id']]
+            subtotal, count = farmer_shares.get(product.farmer_id, (0, 0))
+            farmer_shares[product.farmer_id] = (subtotal + line['quantity'] * product.price, count + 1)
+        FarmerOrder.objects.bulk_create([
+            FarmerOrder(
+                order=order, farmer_id=farmer_id, subtotal=subtotal, status='pending',
+                pending_count=count, created_at=order.created_at
+            )
+            for farmer_id, (subtotal, count) in farmer_shares.items()
+        ])
+
+        if prebook_lines:
+            reservations = CropReservation.objects.bulk_create([
+                CropReservation(
                     buyer=user,
-                    crop_growth=growth,
-                    quantity_reserved=ci.quantity,
-                    expected_delivery_date=growth.expected_harvest_date,
+                    crop_growth_id=line['crop_growth_id'],
+                    quantity_reserved=line['quantity'],
+                    expected_delivery_date=growths[line['crop_growth_id']].expected_harvest_date,
                     order=order
                 )
+                for line in prebook_lines
+            ])
+            # bulk_create skips the post_save receiver that publishes new pre-bookings
+            OutboxService.publish_many('reservation.created', CropReservation, [
+                (reservation.id, reservation_created_payload(
+                    growths[line['crop_growth_id']].farmer_id, user.id, user.username,
+                    line['quantity'], products[line['product_id']].name,
+                ))
+                for reservation, line in zip(reservations, prebook_lines)
+            ])
 
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    farmer=product.farmer,
-                    quantity=ci.quantity,
-                    price=product.price,
-                    status='pending',
-                    is_prebooking=True,
-                    crop_growth=growth
-                )
-            else:
-                if product.stock_quantity < ci.quantity:
-                    raise ValidationError({'detail': f"Not enough stock for {product.name}"})
-                
-                product.stock_quantity -= ci.quantity
-                product.save()
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    farmer=product.farmer,
-                    quantity=ci.quantity,
-                    price=product.price,
-                    status='pending',
-                    is_prebooking=False
-                )
+        OutboxService.publish('order.created', Order, order.id, {
+            'order_id': order.id,
+            'order_number': order.order_number,
+            'user_ids': [user.id, *farmer_shares],
+        })
 
-        cart_items.delete()
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(id=cart.id).update(version=F('version') + 1)
+        store.clear(user)
         return order
+
+
+class OrderArchiveService:
+    # Only orders with every item delivered or cancelled leave the live tables
+    ACTIVE_COUNTS = {'pending_count': 0, 'processing_count': 0, 'shipped_count': 0}
+
+    @staticmethod
+    @transaction.atomic
+    def archive_batch(cutoff, batch_size=500):
+        """Move up to ``batch_size`` finished orders last changed before ``cutoff`` into the archive tables.
+
+        Orders, items and status history are copied with one bulk INSERT per
+        table and the live rows are then deleted. Orders that still hold an
+        open crop reservation are left alone. Returns the number archived.
+        """
+        from orders.models import OrderStatusHistory, ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory
+
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(updated_at__lt=cutoff, **OrderArchiveService.ACTIVE_COUNTS)
+            .exclude(crop_reservations__reservation_status__in=['PENDING', 'CONFIRMED'])
+            .order_by('updated_at')
+            .values('id', 'buyer_id', 'order_number', 'status', 'payment_method', 'total_amount',
+                    'delivery_address', 'notes', 'created_at', 'updated_at', 'search_vector')[:batch_size]
+        )
+        if not orders:
+            return 0
+
+        order_ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids).values(
+            'id', 'order_id', 'product_id', 'product__name', 'farmer_id', 'quantity', 'price', 'status', 'is_prebooking'
+        )
+        history = OrderStatusHistory.objects.filter(order_item__order_id__in=order_ids).values(
+            'id', 'order_item_id', 'previous_status', 'new_status', 'updated_by_id', 'timestamp'
+        )
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders], batch_size=500)
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(product_name=item.pop('product__name'), **item) for item in items
+        ], batch_size=500)
+        ArchivedOrderStatusHistory.objects.bulk_create(
+            [ArchivedOrderStatusHistory(**row) for row in history], batch_size=500
+        )
+
+        # Cascades to the items, their history and the farmer sub-orders
+        Order.objects.filter(id__in=order_ids).delete()
+        return len(orders)
+
+    # Archived totals for the dashboards; trend charts only cover live orders
+
+    @staticmethod
+    def farmer_totals(farmer):
+        """``(orders, delivered revenue)`` of the farmer's archived order items."""
+        from orders.models import ArchivedOrderItem
+        items = ArchivedOrderItem.objects.filter(farmer=farmer)
+        totals = items.aggregate(
+            orders=Count('order', distinct=True),
+            revenue=Sum(F('quantity') * F('price'), filter=Q(status='delivered')),
+        )
+        return totals['orders'], totals['revenue'] or Decimal('0')
+
+    @staticmethod
+    def order_totals(**filters):
+        """``(orders, delivered revenue)`` of archived orders matching ``filters``."""
+        from orders.models import ArchivedOrder
+        totals = ArchivedOrder.objects.filter(**filters).aggregate(
+            orders=Count('id'),
+            revenue=Sum('total_amount', filter=Q(status='delivered')),
+        )
+        return totals['orders'], totals['revenue'] or Decimal('0')
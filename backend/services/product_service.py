@@ -12,23 +12,14 @@ class ProductService:
         if hasattr(user, 'is_farmer') and user.is_farmer and user == growth.farmer:
             raise ValidationError({'detail': 'Farmers cannot reserve their own crops'})
             
-        quantity_requested = float(quantity_requested)
-        if quantity_requested <= 0:
-            raise ValidationError({'detail': 'Quantity must be greater than 0'})
+        from crops.services import ReservationService, parse_reservation_quantity
+        quantity_requested, error = parse_reservation_quantity(quantity_requested)
+        if error:
+            raise ValidationError({'detail': error})
             
-        if quantity_requested > float(growth.available_quantity):
+        reservation = ReservationService.reserve(user, growth, quantity_requested, expected_delivery_date)
+        if reservation is None:
             raise ValidationError({'detail': 'Requested quantity exceeds available quantity'})
-            
-        from crops.models import CropReservation
-        reservation = CropReservation.objects.create(
-            buyer=user,
-            crop_growth=growth,
-            quantity_reserved=quantity_requested,
-            expected_delivery_date=expected_delivery_date or growth.expected_harvest_date
-        )
-        
-        growth.available_quantity = float(growth.available_quantity) - quantity_requested
-        growth.save()
         return reservation
 
     @staticmethod
@@ -149,11 +149,7 @@ const Cart = () => {
                     >
                       <div className="h-28 w-28 flex-shrink-0 flex items-center justify-center rounded-[1.5rem] bg-surface-elevated p-3 transition-colors duration-300">
                         <img
-                          src={
-                            item.product_details.images.find((i) => i.is_primary)?.image ||
-                            item.product_details.images[0]?.image ||
-                            undefined
-                          }
+                          src={item.product_details.thumbnail || undefined}
                           alt={item.product_details.name}
                           className="max-h-full max-w-full object-contain mix-blend-multiply dark:mix-blend-normal"
                         />
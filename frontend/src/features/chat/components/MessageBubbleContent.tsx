@@ -1,7 +1,7 @@
 /* eslint-disable react-refresh/only-export-components */
 import React from 'react';
 import { FileText, MapPin, Mic} from 'lucide-react';
-import type { ChatMessage } from '@/features/chat';
+import type { ChatMessage, LastMessagePreview } from '@/features/chat';
 
 interface Props { msg: ChatMessage; isMe: boolean; }
 
@@ -72,7 +72,7 @@ export const MessageBubbleContent: React.FC<Props> = ({ msg, isMe }) => {
   }
 };
 
-export function lastMsgPreview(msg: ChatMessage | null): string {
+export function lastMsgPreview(msg: LastMessagePreview | null): string {
   if (!msg) return 'No messages yet';
   if (msg.is_deleted) return '🚫 Message deleted';
   switch (msg.message_type) {
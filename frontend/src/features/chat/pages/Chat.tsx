@@ -26,6 +26,9 @@ const Chat = () => {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [loadingConv, setLoadingConv] = useState(true);
   const [loadingMsgs, setLoadingMsgs] = useState(false);
+  // Cursor of the page before the oldest loaded message; null once the history is complete
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [sending, setSending] = useState(false);
   const [sidebarSearch, setSidebarSearch] = useState('');
   const [isNewChatOpen, setIsNewChatOpen] = useState(false);
@@ -37,9 +40,37 @@ const Chat = () => {
   const wsRef = useRef<WebSocket | null>(null);
 
   const selectedRef = useRef<number | null>(null);
+  // Highest change_seq seen in the open conversation; a reconnect syncs from here
+  const syncSeqRef = useRef(0);
+  // Conversation whose first page has loaded; catching up before that would race it
+  const loadedConversationRef = useRef<number | null>(null);
+  // Scroll height before older messages were prepended, so the view stays in place
+  const prependHeightRef = useRef<number | null>(null);
 
   useEffect(() => { selectedRef.current = selected?.id ?? null; }, [selected]);
 
+  // Fetch what changed in the open conversation while the socket was away
+  const catchUp = useCallback(async () => {
+    const conversationId = selectedRef.current;
+    // A conversation that was empty when opened syncs from 0
+    if (!conversationId || loadedConversationRef.current !== conversationId) return;
+    let hasMore = true;
+    while (hasMore && selectedRef.current === conversationId) {
+      const res = await chatService.syncMessages(conversationId, syncSeqRef.current);
+      setMessages(prev => {
+        const byId = new Map(prev.map(m => [m.id, m]));
+        const newest = prev.length ? prev[prev.length - 1].seq : 0;
+        for (const m of res.messages) {
+          // Changes to messages older than the loaded page are skipped
+          if (byId.has(m.id) || m.seq > newest) byId.set(m.id, m);
+        }
+        return [...byId.values()].sort((a, b) => a.seq - b.seq);
+      });
+      syncSeqRef.current = res.seq;
+      hasMore = res.has_more;
+    }
+  }, []);
+
   // ── Fetch Conversations ───────────────────────────────────────────────────
   const fetchConversations = useCallback(async () => {
     try {
@@ -94,6 +125,11 @@ const Chat = () => {
     switch (data.type) {
       case 'chat_message':
         if (selectedRef.current === data.conversation_id) {
+          syncSeqRef.current = Math.max(syncSeqRef.current, data.message.change_seq ?? 0);
+          // Messages arriving in the open conversation are read on the spot; the server coalesces these
+          if (data.message.sender !== user?.id) {
+            wsRef.current?.send(JSON.stringify({ type: 'message_read', conversation_id: data.conversation_id, seq: data.message.seq }));
+          }
           setMessages(prev => {
             if (prev.some(m => m.id === data.message.id)) return prev;
             return [...prev, data.message];
@@ -120,8 +156,9 @@ const Chat = () => {
         break;
 
       case 'message_read':
-        if (data.conversation_id === selectedRef.current) {
-          setMessages(prev => prev.map(m => m.id === data.message_id ? { ...m, is_read: true } : m));
+        // A read watermark: everything up to data.seq has been read by data.user_id
+        if (data.conversation_id === selectedRef.current && data.user_id !== user?.id) {
+          setMessages(prev => prev.map(m => m.seq <= data.seq && !m.is_read ? { ...m, is_read: true } : m));
         }
         break;
 
@@ -171,10 +208,15 @@ const Chat = () => {
       handleWsEvent(data);
     };
 
+    ws.onopen = () => {
+      ws.send(JSON.stringify({ type: 'active_conversation', conversation_id: selectedRef.current }));
+      catchUp().catch(() => undefined);
+    };
+
     ws.onclose = () => {
       console.log('WS Disconnected');
     };
-  }, [handleWsEvent]);
+  }, [handleWsEvent, catchUp]);
 
   useEffect(() => {
     setupWebSocket();
@@ -189,9 +231,17 @@ const Chat = () => {
     setMessages([]);
     setLoadingMsgs(true);
     setReplyingTo(null);
+    setOlderCursor(null);
+    syncSeqRef.current = 0;
+    loadedConversationRef.current = null;
 
     chatService.getMessages(selected.id)
-      .then(setMessages)
+      .then(({ messages, next }) => {
+        syncSeqRef.current = Math.max(0, ...messages.map(m => m.change_seq));
+        loadedConversationRef.current = selected.id;
+        setMessages(messages);
+        setOlderCursor(next);
+      })
       .catch(() => toast.error('Error loading messages'))
       .finally(() => setLoadingMsgs(false));
 
@@ -200,11 +250,55 @@ const Chat = () => {
     });
   }, [selected]);
 
+  // Tell the server which conversation is open so it skips notifications for it
+  useEffect(() => {
+    const report = () => {
+      if (wsRef.current?.readyState === WebSocket.OPEN) {
+        wsRef.current.send(JSON.stringify({ type: 'active_conversation', conversation_id: selected?.id ?? null }));
+      }
+    };
+    report();
+    if (!selected) return;
+    const timer = setInterval(report, 60000);
+    return () => clearInterval(timer);
+  }, [selected]);
+
+  const loadOlder = useCallback(async () => {
+    if (!selected || !olderCursor || loadingOlder) return;
+    const conversationId = selected.id;
+    setLoadingOlder(true);
+    try {
+      const { messages: older, next } = await chatService.getMessages(conversationId, olderCursor);
+      if (selectedRef.current !== conversationId) return;
+      prependHeightRef.current = scrollRef.current?.scrollHeight ?? null;
+      setMessages(prev => {
+        const known = new Set(prev.map(m => m.id));
+        return [...older.filter(m => !known.has(m.id)), ...prev];
+      });
+      setOlderCursor(next);
+    } catch {
+      toast.error('Error loading older messages');
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [selected, olderCursor, loadingOlder]);
+
+  const handleMessagesScroll = () => {
+    if (scrollRef.current && scrollRef.current.scrollTop < 80) {
+      loadOlder();
+    }
+  };
+
   // ── Scroll to Bottom ───────────────────────────────────────────────────────
   useEffect(() => {
-    if (scrollRef.current) {
-      scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
+    if (!scrollRef.current) return;
+    if (prependHeightRef.current !== null) {
+      // Older messages went in above; keep the same messages in view
+      scrollRef.current.scrollTop += scrollRef.current.scrollHeight - prependHeightRef.current;
+      prependHeightRef.current = null;
+      return;
     }
+    scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
   }, [messages, typingUser]);
 
   // ── Actions ────────────────────────────────────────────────────────────────
@@ -348,8 +442,20 @@ const Chat = () => {
               {/* Messages List */}
               <div 
                 ref={scrollRef}
+                onScroll={handleMessagesScroll}
                 className="flex-1 overflow-y-auto p-6 space-y-6 custom-scrollbar relative"
               >
+                {!loadingMsgs && olderCursor && (
+                  <div className="flex justify-center">
+                    <button
+                      onClick={loadOlder}
+                      disabled={loadingOlder}
+                      className="px-4 py-1.5 bg-surface-elevated/50 hover:bg-surface-elevated rounded-full text-xs font-semibold text-foreground-secondary transition-colors disabled:opacity-60"
+                    >
+                      {loadingOlder ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load older messages'}
+                    </button>
+                  </div>
+                )}
                 {loadingMsgs ? (
                   <div className="flex flex-col items-center justify-center h-full space-y-4">
                     <Loader2 className="h-10 w-10 animate-spin text-gray-400" />
@@ -50,6 +50,9 @@ export interface ChatMessage {
   reactions: MessageReaction[];
   created_at: string;
   updated_at: string;
+  // Position in the conversation when sent, and when last changed (delta sync watermark)
+  seq: number;
+  change_seq: number;
   file_url: string | null;
   file_name: string | null;
   // Location
@@ -58,6 +61,19 @@ export interface ChatMessage {
   location_name?: string;
 }
 
+// The inbox carries a short copy of the newest message rather than the full message
+export type LastMessagePreview = Pick<
+  ChatMessage,
+  'id' | 'conversation' | 'sender' | 'message_type' | 'content' | 'file_name' | 'is_deleted' | 'created_at'
+>;
+
+export interface MessageSearchResult
+  extends Pick<ChatMessage, 'id' | 'conversation' | 'sender' | 'message_type' | 'content' | 'seq' | 'created_at'> {
+  conversation_details: { id: number; is_group: boolean; group_name: string };
+  sender_username: string;
+  rank: number;
+}
+
 export interface Conversation {
   id: number;
   participants: number[];
@@ -68,7 +84,7 @@ export interface Conversation {
   group_name: string;
   group_icon: string | null;
   group_icon_url: string | null;
-  last_message: ChatMessage | null;
+  last_message: LastMessagePreview | null;
   unread_count: number;
 }
 
@@ -85,11 +101,31 @@ export const chatService = {
     return res.data;
   },
 
-  getMessages: async (conversationId: number, page = 1): Promise<ChatMessage[]> => {
-    const res = await api.get<{ results: ChatMessage[] }>(
-      `/chat/messages/?conversation=${conversationId}&ordering=created_at&page=${page}`
+  // Newest messages first from the API; returned oldest first for display, with the cursor for older ones
+  getMessages: async (conversationId: number, cursor?: string | null): Promise<{ messages: ChatMessage[]; next: string | null }> => {
+    const res = await api.get<{ results: ChatMessage[]; next: string | null }>(
+      cursor ?? `/chat/messages/?conversation=${conversationId}`
+    );
+    return { messages: [...res.data.results].reverse(), next: res.data.next };
+  },
+
+  syncMessages: async (conversationId: number, since: number): Promise<{ messages: ChatMessage[]; seq: number; has_more: boolean }> => {
+    const res = await api.get<{ messages: ChatMessage[]; seq: number; has_more: boolean }>(
+      `/chat/messages/sync/?conversation=${conversationId}&since=${since}`
+    );
+    return res.data;
+  },
+
+  searchMessages: async (
+    query: string,
+    options: { conversationId?: number; cursor?: string | null } = {}
+  ): Promise<{ results: MessageSearchResult[]; next: string | null }> => {
+    const params = new URLSearchParams({ q: query });
+    if (options.conversationId) params.set('conversation', String(options.conversationId));
+    const res = await api.get<{ results: MessageSearchResult[]; next: string | null }>(
+      options.cursor ?? `/chat/messages/search/?${params}`
     );
-    return res.data.results ?? (res.data as unknown as ChatMessage[]);
+    return { results: res.data.results, next: res.data.next };
   },
 
   sendMessage: async (
@@ -13,9 +13,10 @@ export interface CartItemDetail {
     price: string;
     unit: string;
     farmer_name: string;
-    images: { id: number; image: string; is_primary: boolean }[];
+    thumbnail: string | null;
     in_stock: boolean;
     stock_quantity: number;
+    market_state: string;
   };
   quantity: number;
   added_at: string;
@@ -28,10 +29,33 @@ export interface Cart {
   id: number;
   buyer: number;
   created_at: string;
+  version: number;
   items: CartItemDetail[];
   total_price: number;
 }
 
+export interface BulkTransitionResult {
+  status: string;
+  updated: number;
+  results: { id: number; updated: boolean; error?: string; previous_status?: string; status?: string }[];
+}
+
+export interface DispatchBatch {
+  kind: 'area' | 'locality';
+  label: string;
+  centre: { latitude: number; longitude: number } | null;
+  item_count: number;
+  total_quantity: number;
+  item_ids: number[];
+  orders: { id: number; order_number: string; delivery_address: string }[];
+  picking: { product_id: number; name: string; unit: string; quantity: number }[];
+}
+
+export interface DispatchPlan {
+  item_count: number;
+  batches: DispatchBatch[];
+}
+
 export interface PlaceOrderPayload {
   delivery_address: string;
   payment_method: 'cod' | 'online' | 'upi';
@@ -88,4 +112,14 @@ export const orderService = {
   updateItemStatus: async (itemId: number, status: string): Promise<void> => {
     await api.post(`/orders/order-items/${itemId}/transition_status/`, { status });
   },
+
+  bulkUpdateItemStatus: async (itemIds: number[], status: string): Promise<BulkTransitionResult> => {
+    const res = await api.post<BulkTransitionResult>('/orders/order-items/bulk-transition/', { item_ids: itemIds, status });
+    return res.data;
+  },
+
+  getDispatchPlan: async (): Promise<DispatchPlan> => {
+    const res = await api.get<DispatchPlan>('/orders/order-items/dispatch-plan/');
+    return res.data;
+  },
 };